@@ -0,0 +1,328 @@
+# api/admission.py
+"""
+Admission control in front of every OpenAI call, per API key: request and
+token buckets, a cool-down after a 429, bounded wait queues and a limit on
+open chat streams.
+
+A call that would have to wait longer than its class allows (a 429's
+retry-after included) fails at once with RateLimited(retry_after) instead of
+sleeping in a request thread; the chat routes answer 429 with Retry-After.
+Interactive chat goes first: background embedding work for a key waits while
+a chat for that key is queued, and only chat may spend the last
+OPENAI_RESERVE of either bucket. The OpenAI clients are created with
+max_retries=0, so every attempt is counted here.
+
+Buckets refill continuously at the per-minute rate and hold
+OPENAI_BURST_S seconds of it; tokens are estimated before the call
+(about 4 characters per token). Keys are tracked by a hash, never stored.
+
+    OPENAI_RPM               (default 0 = no client-side request budget)
+    OPENAI_TPM               (default 0 = no client-side token budget)
+    OPENAI_BURST_S           (default 1)
+    OPENAI_RESERVE           (default 0.2)
+    OPENAI_CHAT_CONCURRENCY  (default 16 open chat streams per key; 0 = no limit)
+    OPENAI_QUEUE_MAX         (default 64 waiting calls per key and class)
+    OPENAI_CHAT_MAX_WAIT_S   (default 10)
+    OPENAI_EMBED_MAX_WAIT_S  (default 5)
+    OPENAI_RETRIES           (default 2; a 429 or a transient error, within the wait)
+    OPENAI_COOLDOWN_S        (default 1; shortest cool-down after a 429, doubled per retry)
+"""
+from collections import OrderedDict
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+
+import metrics
+
+CHAT = "chat"
+EMBED = "embed"
+
+RPM = float(os.getenv("OPENAI_RPM", "0"))
+TPM = float(os.getenv("OPENAI_TPM", "0"))
+BURST_S = float(os.getenv("OPENAI_BURST_S", "1"))
+RESERVE = float(os.getenv("OPENAI_RESERVE", "0.2"))
+CHAT_CONCURRENCY = int(os.getenv("OPENAI_CHAT_CONCURRENCY", "16"))
+QUEUE_MAX = int(os.getenv("OPENAI_QUEUE_MAX", "64"))
+MAX_WAIT_S = {CHAT: float(os.getenv("OPENAI_CHAT_MAX_WAIT_S", "10")),
+              EMBED: float(os.getenv("OPENAI_EMBED_MAX_WAIT_S", "5"))}
+RETRIES = int(os.getenv("OPENAI_RETRIES", "2"))
+COOLDOWN_S = float(os.getenv("OPENAI_COOLDOWN_S", "1"))
+
+_KEYS_MAX = 4096
+_POLL_S = 0.05  # waiting for a chat slot or for queued chats to go first
+
+_LOCK = threading.Lock()
+_COND = threading.Condition(_LOCK)
+_KEYS = OrderedDict()   # sha256(key) -> _Key
+_COUNTS = {(c, o): 0 for c in (CHAT, EMBED)
+           for o in ("admitted", "delayed", "rejected", "throttled", "retried")}
+
+
+class RateLimited(Exception):
+    """The key's budget cannot take this call within its wait; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after, reason="rate limited"):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"OpenAI {reason}; retry after {self.retry_after} s")
+
+
+class _Bucket:
+    __slots__ = ("rate", "cap", "level", "t")
+
+    def __init__(self, per_min, now):
+        self.rate = per_min / 60.0
+        self.cap = max(1.0, self.rate * BURST_S)
+        self.level = self.cap
+        self.t = now
+
+    def _refill(self, now):
+        self.level = min(self.cap, self.level + (now - self.t) * self.rate)
+        self.t = now
+
+    def wait(self, cost, floor, now):
+        """Seconds until `cost` can be taken leaving `floor` of the capacity."""
+        self._refill(now)
+        need = min(cost, self.cap * (1 - floor)) + self.cap * floor - self.level
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self, cost):
+        self.level -= cost  # a call bigger than the bucket leaves it in debt
+
+
+class _Key:
+    __slots__ = ("req", "tok", "blocked_until", "chats", "waiting")
+
+    def __init__(self, now):
+        self.req = _Bucket(RPM, now) if RPM > 0 else None
+        self.tok = _Bucket(TPM, now) if TPM > 0 else None
+        self.blocked_until = 0.0
+        self.chats = 0
+        self.waiting = {CHAT: 0, EMBED: 0}
+
+    def idle(self, now):
+        return not (self.chats or any(self.waiting.values()) or self.blocked_until > now)
+
+
+class Permit:
+    """An admitted call; a chat holds its slot until release() (idempotent)."""
+    __slots__ = ("_key", "cls", "waited_s")
+
+    def __init__(self, key, cls, waited_s):
+        self._key = key
+        self.cls = cls
+        self.waited_s = waited_s
+
+    def release(self):
+        with _LOCK:
+            st, self._key = self._key, None
+            if st is not None and self.cls == CHAT:
+                st.chats -= 1
+                _COND.notify_all()
+
+
+def _count(cls, outcome):
+    _COUNTS[(cls, outcome)] += 1
+    metrics.inc("openai_admission_total", cls=cls, outcome=outcome)
+
+
+def _state(api_key, now):
+    h = hashlib.sha256((api_key or "").encode()).hexdigest()
+    st = _KEYS.get(h)
+    if st is None:
+        st = _KEYS[h] = _Key(now)
+        if len(_KEYS) > _KEYS_MAX:
+            for old in [k for k, s in _KEYS.items() if s.idle(now)][:len(_KEYS) - _KEYS_MAX]:
+                del _KEYS[old]
+    else:
+        _KEYS.move_to_end(h)
+    return st
+
+
+def _attempt(st, cls, tokens, t0, deadline, queued):
+    """
+    Under _LOCK: a Permit if the call may go now, else the seconds to sleep
+    before asking again (the caller is queued). Raises RateLimited when the
+    known wait does not fit before `deadline` or the queue is full.
+    """
+    now = time.monotonic()
+    known = st.blocked_until - now  # cool-down and bucket refill: a time we can compute
+    floor = 0.0 if cls == CHAT else RESERVE
+    if st.req is not None:
+        known = max(known, st.req.wait(1, floor, now))
+    if st.tok is not None:
+        known = max(known, st.tok.wait(tokens, floor, now))
+    if cls == CHAT:
+        busy = CHAT_CONCURRENCY > 0 and st.chats >= CHAT_CONCURRENCY
+    else:
+        busy = st.waiting[CHAT] > 0
+    if known <= 0 and not busy:
+        if st.req is not None:
+            st.req.take(1)
+        if st.tok is not None:
+            st.tok.take(tokens)
+        if cls == CHAT:
+            st.chats += 1
+        _count(cls, "delayed" if queued else "admitted")
+        metrics.observe("openai_admission_wait_seconds", now - t0, cls=cls)
+        return Permit(st, cls, now - t0)
+    left = deadline - now
+    if known > left or left <= 0 or (not queued and st.waiting[cls] >= QUEUE_MAX):
+        _count(cls, "rejected")
+        raise RateLimited(max(known, COOLDOWN_S),
+                          "budget exhausted" if known > 0 else "busy for this API key")
+    if not queued:
+        st.waiting[cls] += 1
+    return min(max(known, 0.0) if not busy else _POLL_S, left)
+
+
+def _dequeue(st, cls):
+    st.waiting[cls] -= 1
+    _COND.notify_all()
+
+
+def acquire(api_key, cls, tokens=0, max_wait=None):
+    """Block until the key's budget admits the call (or raise RateLimited) -> Permit."""
+    t0 = time.monotonic()
+    deadline = t0 + (MAX_WAIT_S[cls] if max_wait is None else max_wait)
+    with _COND:
+        st = _state(api_key, t0)
+        queued = False
+        try:
+            while True:
+                r = _attempt(st, cls, tokens, t0, deadline, queued)
+                if isinstance(r, Permit):
+                    return r
+                queued = True
+                _COND.wait(r)
+        finally:
+            if queued:
+                _dequeue(st, cls)
+
+
+async def aacquire(api_key, cls, tokens=0, max_wait=None):
+    """acquire() for the event loop: sleeps in asyncio, never on the lock."""
+    t0 = time.monotonic()
+    deadline = t0 + (MAX_WAIT_S[cls] if max_wait is None else max_wait)
+    queued = False
+    with _LOCK:
+        st = _state(api_key, t0)
+    try:
+        while True:
+            with _LOCK:
+                r = _attempt(st, cls, tokens, t0, deadline, queued)
+            if isinstance(r, Permit):
+                return r
+            queued = True
+            await asyncio.sleep(min(r, _POLL_S))
+    finally:
+        if queued:
+            with _LOCK:
+                _dequeue(st, cls)
+
+
+def _backoff(e, attempt):
+    """(seconds, key-wide) to wait before retrying after `e`, or None if it is not retryable."""
+    import openai
+    if isinstance(e, openai.RateLimitError):
+        if getattr(e, "code", None) == "insufficient_quota":
+            return None  # billing, not rate: waiting does not help
+        h, hint = e.response.headers, 0.0
+        try:
+            if h.get("retry-after-ms"):
+                hint = float(h["retry-after-ms"]) / 1000.0
+            elif h.get("retry-after"):
+                hint = float(h["retry-after"])
+        except ValueError:
+            pass
+        # never shorter than the floor: waiters released together would just draw the next 429
+        return max(hint, COOLDOWN_S * 2 ** attempt), True
+    if isinstance(e, (openai.APIConnectionError, openai.InternalServerError)):
+        return 0.25 * 2 ** attempt, False
+    return None
+
+
+def _failed(api_key, cls, e, attempt, deadline):
+    """After a failed attempt: seconds to sleep before the next one; raises when there is none."""
+    b = _backoff(e, attempt)
+    if b is None:
+        raise e
+    wait, key_wide = b
+    now = time.monotonic()
+    with _LOCK:
+        if key_wide:  # everyone on this key waits it out, not just this caller
+            _count(cls, "throttled")
+            st = _state(api_key, now)
+            st.blocked_until = max(st.blocked_until, now + wait)
+        if attempt >= RETRIES or now + wait > deadline:
+            if key_wide:
+                raise RateLimited(wait, "rate limited upstream") from e
+            raise e
+        _count(cls, "retried")
+    return 0.0 if key_wide else wait  # the next acquire() waits out the cool-down
+
+
+def start(api_key, cls, tokens, fn, max_wait=None):
+    """
+    fn() under the key's budget -> (result, permit); the caller releases the
+    permit (chat: when the stream is done). 429s and transient errors are
+    retried while the wait fits in max_wait.
+    """
+    deadline = time.monotonic() + (MAX_WAIT_S[cls] if max_wait is None else max_wait)
+    for attempt in range(RETRIES + 1):
+        permit = acquire(api_key, cls, tokens, deadline - time.monotonic())
+        try:
+            return fn(), permit
+        except Exception as e:
+            permit.release()
+            time.sleep(_failed(api_key, cls, e, attempt, deadline))
+        except BaseException:
+            permit.release()
+            raise
+
+
+async def astart(api_key, cls, tokens, afn, max_wait=None):
+    """start() for the event loop; `afn` is a coroutine function."""
+    deadline = time.monotonic() + (MAX_WAIT_S[cls] if max_wait is None else max_wait)
+    for attempt in range(RETRIES + 1):
+        permit = await aacquire(api_key, cls, tokens, deadline - time.monotonic())
+        try:
+            return await afn(), permit
+        except Exception as e:
+            permit.release()
+            await asyncio.sleep(_failed(api_key, cls, e, attempt, deadline))
+        except BaseException:  # cancelled: the client went away
+            permit.release()
+            raise
+
+
+def call(api_key, cls, tokens, fn, max_wait=None):
+    """start() for calls that are done when fn returns (embeddings)."""
+    result, permit = start(api_key, cls, tokens, fn, max_wait)
+    permit.release()
+    return result
+
+
+def estimate_tokens(texts):
+    return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+def stats():
+    now = time.monotonic()
+    with _LOCK:
+        counts = {cls: {o: n for (c, o), n in _COUNTS.items() if c == cls} for cls in (CHAT, EMBED)}
+        states = list(_KEYS.values())
+        return {
+            "keys": len(states),
+            "cooling_down": sum(s.blocked_until > now for s in states),
+            "open_chats": sum(s.chats for s in states),
+            "waiting": {cls: sum(s.waiting[cls] for s in states) for cls in (CHAT, EMBED)},
+            **counts,
+            "rpm": RPM or None,
+            "tpm": TPM or None,
+            "chat_concurrency": CHAT_CONCURRENCY or None,
+            "queue_max": QUEUE_MAX,
+            "max_wait_s": dict(MAX_WAIT_S),
+        }
@@ -0,0 +1,224 @@
+# api/ann.py
+"""
+Nearest-neighbour indexes over the normalized embedding matrix (NumPy only).
+
+Both backends take unit-norm float32 queries and return (ids, scores) of shape
+(q, k), best first, so resolve_entities can swap one for the other:
+
+  ExactIndex  brute force in fixed-size row blocks; memory is O(q * block)
+              instead of O(q * N).
+  IVFIndex    inverted file: spherical k-means centroids + rows bucketed by
+              centroid. `nprobe` (per call) trades recall for latency.
+
+An IVF index is built offline and saved next to the parquet:
+    python api/ann.py build [--nlist 4096] [--path ADInt_CUI_embeddings.parquet]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+BLOCK_ROWS = int(os.getenv("ANN_BLOCK_ROWS", "65536"))
+DEFAULT_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+INDEX_SUFFIX = ".ivf.npz"
+
+
+def _topk(scores, k):
+    """Row-wise top-k of a (q, n) score matrix -> (idx, vals), sorted descending."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), np.int64), np.empty((scores.shape[0], 0), np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-vals, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, mat, block_rows=BLOCK_ROWS):
+        self.mat = mat
+        # compact (quant.CompactMatrix) storage dequantizes per block, so it asks for smaller ones
+        self.block_rows = int(min(block_rows, getattr(mat, "block_rows", block_rows)))
+
+    def search(self, q, k=1, **_):
+        q = np.atleast_2d(q).astype(np.float32, copy=False)
+        best_i = np.empty((q.shape[0], 0), np.int64)
+        best_s = np.empty((q.shape[0], 0), np.float32)
+        for start in range(0, self.mat.shape[0], self.block_rows):
+            block = self.mat[start:start + self.block_rows]
+            idx, vals = _topk(q @ block.T, k)
+            # merge this block's winners with the running top-k
+            cand_i = np.concatenate([best_i, idx + start], axis=1)
+            cand_s = np.concatenate([best_s, vals], axis=1)
+            sel, best_s = _topk(cand_s, k)
+            best_i = np.take_along_axis(cand_i, sel, axis=1)
+        return best_i, best_s
+
+    def status(self):
+        return {"kind": self.kind, "block_rows": self.block_rows}
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, mat, centroids, order, offsets, nprobe=DEFAULT_NPROBE):
+        self.mat = mat
+        self.centroids = centroids    # (nlist, D) unit-norm
+        self.order = order            # (N,) row ids grouped by list
+        self.offsets = offsets        # (nlist + 1,) list boundaries into `order`
+        self.nprobe = int(nprobe)
+
+    @classmethod
+    def train(cls, mat, nlist=None, iters=10, sample=100_000, seed=0, log=None):
+        n = mat.shape[0]
+        nlist = int(nlist or max(1, min(int(4 * np.sqrt(n)), 65536)))
+        rng = np.random.default_rng(seed)
+        train = mat[rng.choice(n, size=min(n, max(sample, nlist)), replace=False)]
+        cent = train[rng.choice(train.shape[0], size=nlist, replace=False)].copy()
+        for it in range(iters):
+            assign = cls._assign(train, cent)
+            counts = np.bincount(assign, minlength=nlist)
+            nz = np.flatnonzero(counts)
+            starts = (np.cumsum(counts) - counts)[nz]
+            sums = np.zeros_like(cent)
+            sums[nz] = np.add.reduceat(train[np.argsort(assign, kind="stable")], starts, axis=0)
+            empty = counts == 0
+            # re-seed empty lists from random training rows
+            sums[empty] = train[rng.choice(train.shape[0], size=int(empty.sum()))]
+            cent = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-9)
+            if log:
+                log(f"kmeans iter {it + 1}/{iters}: {int(empty.sum())} empty lists")
+        assign = cls._assign(mat, cent)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        return cls(mat, cent.astype(np.float32), order, offsets)
+
+    @staticmethod
+    def _assign(x, cent, block_rows=BLOCK_ROWS):
+        out = np.empty(x.shape[0], np.int64)
+        for start in range(0, x.shape[0], block_rows):
+            out[start:start + block_rows] = np.argmax(x[start:start + block_rows] @ cent.T, axis=1)
+        return out
+
+    def search(self, q, k=1, nprobe=None, **_):
+        q = np.atleast_2d(q).astype(np.float32, copy=False)
+        nprobe = min(int(nprobe or self.nprobe), self.centroids.shape[0])
+        lists, _ = _topk(q @ self.centroids.T, nprobe)
+        ids = np.full((q.shape[0], k), -1, np.int64)
+        scores = np.full((q.shape[0], k), -np.inf, np.float32)
+        for i in range(q.shape[0]):
+            cand = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists[i]])
+            if cand.size == 0:
+                continue
+            idx, vals = _topk((self.mat[cand] @ q[i])[None, :], k)
+            ids[i, :idx.shape[1]] = cand[idx[0]]
+            scores[i, :idx.shape[1]] = vals[0]
+        return ids, scores
+
+    def save(self, path, source_rows, source_mtime=None):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 rows=np.int64(source_rows), mtime=np.float64(source_mtime or 0.0))
+
+    def extend(self, start):
+        """Bucket rows [start:] of the matrix (appended after training) into the existing lists."""
+        nlist = self.centroids.shape[0]
+        assign = np.concatenate([np.repeat(np.arange(nlist), np.diff(self.offsets)),
+                                 self._assign(self.mat[start:], self.centroids)])
+        rows = np.concatenate([self.order, np.arange(start, self.mat.shape[0], dtype=np.int64)])
+        self.order = rows[np.argsort(assign, kind="stable")]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        return self
+
+    @classmethod
+    def load(cls, path, mat, source_mtime=None, base_rows=None):
+        """
+        Load a saved index; None if missing or built for a different matrix.
+        With `base_rows` (an embed_store with delta segments), an index saved for
+        fewer rows than the matrix, but at least base_rows, is kept and the rows
+        after it are bucketed in.
+        """
+        if not os.path.exists(path):
+            return None
+        z = np.load(path)
+        rows, n = int(z["rows"]), mat.shape[0]
+        if not (rows == n or (base_rows is not None and base_rows <= rows < n)):
+            return None
+        if z["centroids"].shape[1] != mat.shape[1]:
+            return None
+        if source_mtime is not None and float(z["mtime"]) and float(z["mtime"]) != float(source_mtime):
+            return None
+        index = cls(mat, z["centroids"], z["order"], z["offsets"])
+        return index.extend(rows) if rows < n else index
+
+    def status(self):
+        return {"kind": self.kind, "nlist": int(self.centroids.shape[0]), "nprobe": self.nprobe}
+
+
+class RerankIndex:
+    """
+    Wraps an index over compact storage: take a wider shortlist from `inner`,
+    then re-score it against full-precision rows so the returned scores (and
+    order within the shortlist) match float32.
+    """
+
+    def __init__(self, inner, full, shortlist=32):
+        self.inner = inner
+        self.full = full          # float32 (N, D), typically an np.memmap
+        self.shortlist = int(shortlist)
+        self.kind = inner.kind
+
+    def search(self, q, k=1, **kw):
+        q = np.atleast_2d(q).astype(np.float32, copy=False)
+        cand, _ = self.inner.search(q, k=max(k, self.shortlist), **kw)
+        ids = np.full((q.shape[0], k), -1, np.int64)
+        scores = np.full((q.shape[0], k), -np.inf, np.float32)
+        for i in range(q.shape[0]):
+            c = cand[i][cand[i] >= 0]
+            if c.size == 0:
+                continue
+            exact = np.asarray(self.full[np.sort(c)], dtype=np.float32) @ q[i]
+            idx, vals = _topk(exact[None, :], k)
+            ids[i, :idx.shape[1]] = np.sort(c)[idx[0]]
+            scores[i, :idx.shape[1]] = vals[0]
+        return ids, scores
+
+    def status(self):
+        return {**self.inner.status(), "rerank_shortlist": self.shortlist}
+
+
+def index_path(parquet_path):
+    return str(parquet_path) + INDEX_SUFFIX
+
+
+def open_index(mat, parquet_path, source_mtime=None, base_rows=None):
+    """Pick a backend for `mat` according to EMBEDDINGS_INDEX (auto|exact|ivf)."""
+    mode = os.getenv("EMBEDDINGS_INDEX", "auto")
+    if mode != "exact":
+        ivf = IVFIndex.load(index_path(parquet_path), mat, source_mtime, base_rows)
+        if ivf is not None:
+            return ivf
+        if mode == "ivf":
+            print(f"[ann] no usable IVF index at {index_path(parquet_path)}; using exact search")
+    return ExactIndex(mat)
+
+
+if __name__ == "__main__":
+    import embeds
+
+    ap = argparse.ArgumentParser(description="Build the IVF index next to the embeddings parquet")
+    ap.add_argument("command", choices=["build"])
+    ap.add_argument("--path", default=None, help="parquet path (default: embeds lookup order)")
+    ap.add_argument("--nlist", type=int, default=None)
+    ap.add_argument("--iters", type=int, default=10)
+    args = ap.parse_args()
+
+    src = args.path or embeds._default_path()
+    t0 = time.perf_counter()
+    (_, mat, _, _), _, stats = embeds._build(src)
+    print(f"loaded {mat.shape} in {time.perf_counter() - t0:.1f}s")
+    idx = IVFIndex.train(mat, nlist=args.nlist, iters=args.iters, log=print)
+    idx.save(index_path(src), mat.shape[0], stats["mtime"])
+    print(f"wrote {index_path(src)} ({idx.centroids.shape[0]} lists) in {time.perf_counter() - t0:.1f}s")
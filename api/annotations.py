@@ -0,0 +1,174 @@
+# api/annotations.py
+"""
+Incremental parser for the qaPrompt markup streamed by /api/chat:
+
+    [Fish Oil|Dietary Supplement]($N1)      entity with category
+    [reduce]($R2, $N1, $N3; $R3, $N4, $N2)  relation -> one triple per group
+
+AnnotationParser.feed(delta) returns the entities and triples that closed in
+that delta, so verification can start while the answer is still streaming.
+A relation that mentions an entity id not seen yet is held until the entity
+shows up. Everything after the " || " separator (the question-entity list)
+is ignored.
+
+stream_with_verification() wraps a delta iterator and interleaves
+verification results as separate SSE events; see index.post_chat.
+astream_with_verification() does the same for an async iterator (asgi.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import re
+
+# annotation text never contains brackets, so an open one can only start at the last "["
+_ANNOT = re.compile(r"\[([^\[\]]+)\]\(([^()]*)\)")
+_ENTITY_REF = re.compile(r"^\s*\$N(\d+)\s*$")
+_REL_CODE = re.compile(r"\$R\d+")
+_ENT_CODE = re.compile(r"\$N\d+")
+
+
+class AnnotationParser:
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0              # everything before this is fully parsed
+        self.done = False         # hit the " || " separator
+        self.entities = {}        # "$N1" -> {"name", "category"}
+        self.pending = []         # (relation text, [head code, tail code]) waiting on entities
+        self.seen = set()         # emitted triple keys
+
+    def feed(self, delta):
+        """Consume a text delta; return {"entities": [...], "triples": [[h, r, t], ...]}."""
+        out = {"entities": [], "triples": []}
+        if self.done or not delta:
+            return out
+        self.buf += delta
+        end = len(self.buf)
+        sep = self.buf.find("||", self.pos)
+        if sep != -1:
+            end, self.done = sep, True
+
+        last = self.pos
+        for m in _ANNOT.finditer(self.buf, self.pos, end):
+            self._annotation(m.group(1), m.group(2), out)
+            last = m.end()
+        tail_open = self.buf.rfind("[", last, end)
+        if tail_open != -1:
+            close = self.buf.find("]", tail_open, end)
+            if close != -1 and close + 1 < end and self.buf[close + 1] != "(":
+                tail_open = -1  # "[...]" followed by plain text: nothing left open
+        self.pos = end if (self.done or tail_open == -1) else tail_open
+
+        if out["entities"] and self.pending:
+            still = []
+            for rel, codes in self.pending:
+                if not self._emit(rel, codes, out):
+                    still.append((rel, codes))
+            self.pending = still
+        return out
+
+    def _annotation(self, text, args, out):
+        ref = _ENTITY_REF.match(args)
+        if ref:
+            name, _, category = text.partition("|")
+            ent = {"name": name.strip(), "category": category.strip() or None}
+            code = f"$N{ref.group(1)}"
+            if self.entities.get(code) != ent:
+                self.entities[code] = ent
+                out["entities"].append({"id": code, **ent})
+            return
+        if not _REL_CODE.search(args):
+            return  # a plain markdown link, not an annotation
+        for group in args.split(";"):
+            codes = _ENT_CODE.findall(group)
+            if len(codes) >= 2 and not self._emit(text.strip(), codes[:2], out):
+                self.pending.append((text.strip(), codes[:2]))
+
+    def _emit(self, rel, codes, out):
+        h, t = self.entities.get(codes[0]), self.entities.get(codes[1])
+        if not (h and t):
+            return False
+        key = (h["name"].lower(), rel.lower(), t["name"].lower())
+        if key not in self.seen:
+            self.seen.add(key)
+            out["triples"].append([h["name"], rel, t["name"]])
+        return True
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+_POOL = None
+
+
+def _default_pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-verify")
+    return _POOL
+
+
+def stream_with_verification(deltas, verify_fn, executor=None):
+    """
+    Yield SSE events for an LLM text stream:
+      delta   {"text": ...}                    every text chunk, unchanged
+      triples {"triples": [...]}               triples as soon as they close
+      verify  {"results": [...]}               verify_fn(triples) output, when ready
+      done    {"triples": n}                   after the text and all verifications
+    Verification runs on `executor` so KG latency overlaps generation; results
+    are flushed between deltas in completion order and drained at the end.
+    """
+    executor = executor or _default_pool()
+    parser = AnnotationParser()
+    inflight = []
+    total = 0
+    for delta in deltas:
+        events, found = _feed(parser, delta, verify_fn, executor, inflight)
+        total += found
+        yield from events
+        yield from _flush(inflight, block=False)
+    yield from _flush(inflight, block=True)
+    yield sse("done", {"triples": total})
+
+
+async def astream_with_verification(deltas, verify_fn, executor=None):
+    """stream_with_verification() over an async delta iterator; waits for verify without blocking the loop."""
+    executor = executor or _default_pool()
+    parser = AnnotationParser()
+    inflight = []
+    total = 0
+    async for delta in deltas:
+        events, found = _feed(parser, delta, verify_fn, executor, inflight)
+        total += found
+        for ev in events + _flush(inflight, block=False):
+            yield ev
+    if inflight:
+        await asyncio.wait([asyncio.wrap_future(f) for f in inflight])
+    for ev in _flush(inflight, block=True):
+        yield ev
+    yield sse("done", {"triples": total})
+
+
+def _feed(parser, delta, verify_fn, executor, inflight):
+    """Events for one delta; closed triples are submitted to `executor` and added to `inflight`."""
+    events = [sse("delta", {"text": delta})]
+    found = parser.feed(delta)["triples"]
+    if found:
+        events.append(sse("triples", {"triples": found}))
+        inflight.append(executor.submit(verify_fn, found))
+    return events, len(found)
+
+
+def _flush(inflight, block):
+    """verify events for finished futures (all of them with block=True), removed from `inflight`."""
+    events, keep = [], []
+    for fut in inflight:
+        if block or fut.done():
+            try:
+                events.append(sse("verify", {"results": fut.result()}))
+            except Exception as e:
+                events.append(sse("verify_error", {"error": str(e)}))
+        else:
+            keep.append(fut)
+    inflight[:] = keep
+    return events
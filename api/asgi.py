@@ -0,0 +1,202 @@
+# api/asgi.py
+"""
+ASGI entry point, for deployments where long /api/chat streams would
+otherwise pin sync workers:
+
+    uvicorn asgi:app --app-dir api --host 0.0.0.0 --port 5000
+
+POST /api/chat is served here on the event loop: the OpenAI stream is read
+with the async client (chat.adeltas), so an open stream costs a coroutine
+and a socket instead of a thread. "stream_verify" works as in the Flask
+route; verification runs on the same chat-verify thread pool.
+
+Every other route goes to the Flask app (index.app) unchanged, on a
+separate pool of ASGI_SYNC_THREADS threads (default 32), with the response
+buffered. Verify, recommend and evidence therefore never queue behind chat
+streams, and keep the graph.py driver, its retries and the CSR backend.
+Request and response contracts are the same as under gunicorn.
+
+    ASGI_SYNC_THREADS   (default 32)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+from annotations import astream_with_verification
+from werkzeug.datastructures import Headers
+
+from index import app as flask_app
+from verify import verify_list
+import admission
+import chat
+import metrics
+
+SYNC_THREADS = int(os.getenv("ASGI_SYNC_THREADS", "32"))
+
+_POOL = ThreadPoolExecutor(SYNC_THREADS, thread_name_prefix="asgi-sync")
+
+_STREAM_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+    (b"access-control-allow-origin", b"*"),
+]
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return None
+        chunks.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _json(send, status, obj):
+    return _respond(send, status, [(b"content-type", b"application/json"), (b"access-control-allow-origin", b"*")],
+                    json.dumps(obj).encode())
+
+
+# --- everything but /api/chat: the Flask app on the sync pool ----------------
+def _environ(scope, body):
+    headers = {}
+    for name, value in scope["headers"]:
+        key = name.decode("latin1").upper().replace("-", "_")
+        key = key if key in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{key}"
+        headers[key] = f"{headers[key]},{value.decode('latin1')}" if key in headers else value.decode("latin1")
+    server = scope.get("server") or ("localhost", 80)
+    return {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        **headers,
+    }
+
+
+def _run_wsgi(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = int(status.split(" ", 1)[0]), headers
+
+    it = flask_app(environ, start_response)
+    try:
+        body = b"".join(it)
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+    headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in started["headers"]]
+    return started["status"], headers, body
+
+
+async def _flask(scope, body, send):
+    status, headers, data = await asyncio.get_running_loop().run_in_executor(_POOL, _run_wsgi, _environ(scope, body))
+    await _respond(send, status, headers, data)
+
+
+# --- POST /api/chat on the loop ----------------------------------------------
+async def _until_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _observe(t0, status):
+    # like the Flask hook: until the response starts, not the whole stream
+    metrics.observe("http_request_seconds", time.perf_counter() - t0, route="/api/chat", method="POST")
+    metrics.inc("http_requests_total", route="/api/chat", method="POST", status=status)
+
+
+async def _chat(scope, body, receive, send):
+    t0 = time.perf_counter()
+    try:
+        data = json.loads(body or b"{}") or {}
+    except ValueError:
+        _observe(t0, 400)
+        return await _json(send, 400, {"error": "invalid JSON body"})
+    headers = Headers([(k.decode("latin1"), v.decode("latin1")) for k, v in scope["headers"]])
+    api_key = chat.api_key_from(headers, data)
+    if not api_key:
+        _observe(t0, 401)
+        return await _json(send, 401, {"error": "Missing OpenAI API key"})
+
+    gen = chat.adeltas(api_key, data.get("messages", []))
+    if data.get("stream_verify") or parse_qs(scope["query_string"].decode()).get("stream_verify") == ["1"]:
+        gen = astream_with_verification(gen, verify_list)
+
+    async def stream():
+        try:
+            first = await gen.__anext__()
+        except StopAsyncIteration:
+            first = ""
+        except admission.RateLimited as e:
+            _observe(t0, 429)
+            return await _respond(send, 429, [(b"content-type", b"application/json"),
+                                              (b"access-control-allow-origin", b"*"),
+                                              (b"retry-after", str(e.retry_after).encode())],
+                                  json.dumps({"error": str(e), "retry_after": e.retry_after}).encode())
+        except Exception as e:  # nothing sent yet: fail the request like a sync worker would
+            _observe(t0, 500)
+            return await _json(send, 500, {"error": str(e)})
+        await send({"type": "http.response.start", "status": 200, "headers": _STREAM_HEADERS})
+        _observe(t0, 200)
+        await send({"type": "http.response.body", "body": first.encode(), "more_body": True})
+        async for piece in gen:
+            await send({"type": "http.response.body", "body": piece.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    # stop reading from OpenAI as soon as the client goes away
+    task, watch = asyncio.ensure_future(stream()), asyncio.ensure_future(_until_disconnect(receive))
+    try:
+        await asyncio.wait([task, watch], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        task.cancel()
+        watch.cancel()
+        result = (await asyncio.gather(task, watch, return_exceptions=True))[0]
+        await gen.aclose()
+    if isinstance(result, Exception):
+        raise result
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                _POOL.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    body = await _read_body(receive)
+    if body is None:
+        return
+    if scope["method"] == "POST" and scope["path"] == "/api/chat":
+        await _chat(scope, body, receive, send)
+    else:
+        await _flask(scope, body, send)
@@ -0,0 +1,19 @@
+# api/blobs.py
+"""
+String columns for the .npz files (csr_graph.py, neighbors.py): every string
+UTF-8 encoded into one uint8 blob, plus int64 offsets so string i is
+blob[off[i]:off[i + 1]]. Loads as two arrays instead of N Python objects.
+"""
+import numpy as np
+
+
+def pack(strings):
+    """[str] -> (blob, offsets)."""
+    data = [s.encode("utf-8") for s in strings]
+    off = np.zeros(len(data) + 1, np.int64)
+    np.cumsum([len(b) for b in data], out=off[1:])
+    return np.frombuffer(b"".join(data), np.uint8), off
+
+
+def str_at(blob, off, i):
+    return bytes(blob[off[i]:off[i + 1]]).decode("utf-8")
@@ -0,0 +1,221 @@
+# api/chat.py
+"""
+/api/chat: the annotated-answer prompt and the streaming OpenAI calls, shared
+by the Flask route (index.py) and the ASGI app (asgi.py).
+
+OpenAI clients are cached per API key (at most CHAT_CLIENTS_MAX keys, least
+recently used dropped first), so a user's requests reuse one HTTP connection
+pool instead of opening a new one every time. The sync and async clients are
+cached separately; the cache is keyed by a hash of the key.
+
+Each stream is admitted by admission.py as interactive work and holds a chat
+slot for its key until it ends. open_deltas() does the admission and pulls
+the first chunk before the route answers, so a full budget becomes a 429
+with Retry-After instead of a broken 200 stream.
+
+    CHAT_MODEL                  (default gpt-4o)
+    CHAT_CLIENTS_MAX            (default 256)
+    CHAT_COMPLETION_TOKENS      (default 1000; the answer's share of the token estimate)
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
+
+import admission
+import metrics
+
+MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+CLIENTS_MAX = int(os.getenv("CHAT_CLIENTS_MAX", "256"))
+COMPLETION_TOKENS = int(os.getenv("CHAT_COMPLETION_TOKENS", "1000"))
+
+_LOCK = threading.Lock()
+_CLIENTS = OrderedDict()   # ("sync" | "async", sha256(key)) -> client
+_COUNTS = {"created": 0, "reused": 0}
+
+QA_PROMPT = """
+You are an expert in healthcare and dietary supplements and need to help users answer related questions.
+Please return your response in a format where all entities and their relations are clearly defined in the response.
+Specifically, use [] to identify all entities and relations in the response,
+add () after identified entities and relations to assign unique ids to entities ($N1, $N2, ..) and relations ($R1, $R2, ...).
+When annotating an entity, append its category before the ID, separated by a vertical bar "|". The category must be one of: Dietary Supplement, Drugs, Disease, Symptom, Gene. For example: [Fish Oil|Dietary Supplement]($N1), [Alzheimer's disease|Disease]($N2).
+For the relation, also add the entities it connects to. Use ; to separate if this relation exists in more than one triple.
+The entities can only be the following types: Dietary Supplement, Drugs, Disease, Symptom and Gene.
+Relation label policy (canonical KG types):
+Use ONLY these exact relation labels in the square brackets (UPPER_SNAKE_CASE):
+INTERACTS_WITH, AFFECTS, TREATS, PREVENTS, INHIBITS, STIMULATES, ASSOCIATED_WITH, CAUSES, AUGMENTS, PRODUCES, COEXISTS_WITH.
+
+• The bracketed relation text MUST be one of the above (e.g., [INHIBITS]($R1, $N1, $N2)).
+• You MAY use natural language in the prose, but the annotated relation label must be canonical.
+• If the user’s phrasing is a paraphrase (e.g., “help slow”, “reducing”, “improve”), choose the closest canonical label (e.g., INHIBITS or AFFECTS). Do NOT invent new labels.
+Each sentence in the response must include a clearly defined relation between entities, and this relation must be annotated.
+Identified entities must have relations with other entities in the response.
+Each sentence in the response should not include more than one relation.
+When answering a question, focus on identifying and annotating only the entities and relations that are directly relevant to the user's query. Avoid including additional entities that are not closely related to the core question.
+Try to provide context in your response.
+
+After your response, also add the identified entities in the user question, in the format of a JSON string list;
+Please use " || " to split the two parts.
+
+Example 1,
+if the question is "Can Ginkgo biloba prevent Alzheimer's Disease?"
+Your response could be:
+"Gingko biloba is a plant extract...
+Some studies have suggested that [Gingko biloba]($N1) may [improve]($R1, $N1, $N2) cognitive function and behavior in people with [Alzheimer's disease]($N2)... ||
+["Ginkgo biloba", "Alzheimer's Disease"]"
+
+Example 2,
+If the question is "What are the benefits of fish oil?"
+Your response could be:
+"[Fish oil]($N1) is known for its [rich content of]($R1, $N1, $N2) [Omega-3 fatty acids]($N2)... The benefits of [Fish Oil]($N1): [Fish Oil]($N1) can [reduce]($R2, $N1, $N3) the risk of [cognitive decline]($N3).
+[Fight]($R3, $N2, $N4) [Inflammation]($N4): [Omega-3 fatty acids]($N2) has potent... || ["Fish Oil", "Omega-3 fatty acids", "cognitive decline", "Inflammation"]"
+
+Example 3,
+If the question is "Can Coenzyme Q10 prevent Heart disease?"
+Your response could be:
+"Some studies have suggested that [Coenzyme Q10]($N1) supplementation may [have potential benefits]($R1, $N1, $N2) for [heart health]($N2)... [Coenzyme Q10]($N1) [has]($R2, $N1, $N2) [antioxidant properties]($N2)... ||
+["Coenzyme Q10", "heart health", "antioxidant", "Heart disease"]"
+
+Example 4,
+If the question is "Can taking Choerospondias axillaris slow the progression of Alzheimer's disease?"
+Your response could be:
+"
+[Choerospondias axillaris]($N1), also known as Nepali hog plum, is a fruit that is used in traditional medicine in some Asian countries. It is believed to have various health benefits due to its [antioxidant]($N2) properties. However, there is limited scientific research on its effects on [Alzheimer's disease]($N3) specifically.
+
+Some studies have suggested that [antioxidant]($N2) can help [reduce]($R1, $N2, $N3) oxidative stress, which is a factor in the development and progression of [Alzheimer's disease]($N3). Therefore, it is possible that the antioxidant properties of Choerospondias axillaris might have some protective effects against the disease. However, more research is needed to determine its efficacy and the appropriate dosage.  ||
+["Choerospondias axillaris", "antioxidant", "Alzheimer's disease"]"
+
+Example 5,
+If the question is "What Complementary and Integrative Health Interventions are beneficial for people with Alzheimer's disease?"
+Your response could be:
+"Some Complementary and Integrative Health Interventions have been explored for their potential benefits in individuals with [Alzheimer's disease]($N1).
+
+[Mind-body practices]($N2), such as yoga and meditation, are examples of interventions that may [improve]($R1, $N2, $N1) cognitive function and quality of life in people with [Alzheimer's disease]($N1). These practices can help reduce stress and improve emotional well-being.
+
+Dietary supplements, including [omega-3 fatty acids]($N3) and [vitamin E]($N4), have been studied for their potential to [slow]($R2, $N3, $N2; $R3, $N4, $N2) cognitive decline in [Alzheimer's disease]($N2). [Omega-3 fatty acids]($N3) are known for their anti-inflammatory and neuroprotective properties, while [vitamin E]($N4) is an antioxidant that may [protect]($R3, $N4, $N5) [neurons]($N5) from damage.
+
+[Aromatherapy]($N6) using essential oils, such as lavender, has been suggested to [help]($R4, $N6, $N1) with anxiety and improve sleep quality in individuals with [Alzheimer's disease]($N1).
+|| ["Alzheimer's disease", "Mind-body practices", "omega-3 fatty acids", "vitamin E", "Aromatherapy"]"
+
+Use the above examples only as a guide for format and structure. Do not reuse their exact wording. Always generate a unique, original response that follows the annotated format.
+"""
+
+
+def api_key_from(headers, body):
+    """x-openai-key header, then Authorization: Bearer <key>, then "apiKey" in the body."""
+    auth_header = (headers.get("Authorization") or "").strip()
+    header_key = (headers.get("x-openai-key") or headers.get("X-OpenAI-Key") or "").strip()
+    return (
+        header_key
+        or (auth_header.startswith("Bearer ") and auth_header.replace("Bearer ", "").strip())
+        or (body.get("apiKey") or "").strip()
+    )
+
+
+def _client(kind, api_key):
+    k = (kind, hashlib.sha256(api_key.encode()).hexdigest())
+    with _LOCK:
+        c = _CLIENTS.get(k)
+        if c is not None:
+            _CLIENTS.move_to_end(k)
+            _COUNTS["reused"] += 1
+            return c
+    from openai import AsyncOpenAI, OpenAI
+    c = (AsyncOpenAI if kind == "async" else OpenAI)(api_key=api_key, max_retries=0)
+    with _LOCK:
+        c = _CLIENTS.setdefault(k, c)
+        _COUNTS["created"] += 1
+        while len(_CLIENTS) > CLIENTS_MAX:
+            # not closed: a stream that is still reading keeps its own reference
+            _CLIENTS.popitem(last=False)
+    return c
+
+
+def client(api_key):
+    return _client("sync", api_key)
+
+
+def async_client(api_key):
+    return _client("async", api_key)
+
+
+def _messages(messages):
+    return [{"role": "assistant", "content": QA_PROMPT}, *messages]
+
+
+def _content(chunk):
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+
+def _tokens(messages):
+    texts = [QA_PROMPT, *(str(m.get("content") or "") for m in messages if isinstance(m, dict))]
+    return admission.estimate_tokens(texts) + COMPLETION_TOKENS
+
+
+def deltas(api_key, messages):
+    """Text chunks of the streamed answer (blocking; the Flask route)."""
+    t0 = time.perf_counter()
+    first = True
+    res, permit = admission.start(
+        api_key, admission.CHAT, _tokens(messages),
+        lambda: client(api_key).chat.completions.create(
+            model=MODEL, messages=_messages(messages), temperature=1, stream=True))
+    try:
+        for chunk in res:
+            content = _content(chunk)
+            if content:
+                if first:
+                    metrics.observe("openai_request_seconds", time.perf_counter() - t0, op="chat_first_token")
+                    first = False
+                yield content
+    finally:
+        res.close()
+        permit.release()
+        metrics.observe("openai_request_seconds", time.perf_counter() - t0, op="chat_stream")
+
+
+def open_deltas(api_key, messages):
+    """
+    deltas() with the first chunk already read, so admission.RateLimited and
+    OpenAI errors are raised here, before the route has sent anything.
+    """
+    gen = deltas(api_key, messages)
+    first = next(gen, None)
+
+    def rest():
+        try:
+            if first is not None:
+                yield first
+            yield from gen
+        finally:
+            gen.close()
+    return rest()
+
+
+async def adeltas(api_key, messages):
+    """Async twin of deltas() for the ASGI app: waiting on the model holds no thread."""
+    t0 = time.perf_counter()
+    first = True
+    res, permit = await admission.astart(
+        api_key, admission.CHAT, _tokens(messages),
+        lambda: async_client(api_key).chat.completions.create(
+            model=MODEL, messages=_messages(messages), temperature=1, stream=True))
+    try:
+        async for chunk in res:
+            content = _content(chunk)
+            if content:
+                if first:
+                    metrics.observe("openai_request_seconds", time.perf_counter() - t0, op="chat_first_token")
+                    first = False
+                yield content
+    finally:
+        await res.close()
+        permit.release()
+        metrics.observe("openai_request_seconds", time.perf_counter() - t0, op="chat_stream")
+
+
+def stats():
+    with _LOCK:
+        kinds = [k for k, _ in _CLIENTS]
+        return {"clients": kinds.count("sync"), "async_clients": kinds.count("async"), **_COUNTS}
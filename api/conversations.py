@@ -0,0 +1,216 @@
+# api/conversations.py
+"""
+Server-side graph state for /api/data, one entry per conversation (userId).
+
+new_conversation builds a graph from the submitted triples; continue_conversation
+merges only triples the conversation has not seen and reports the difference:
+
+    {"version": 3, "reset": false,
+     "added":   {"nodes": [node id, ...], "edges": [[source, target, category], ...]},
+     "updated": {"nodes": [...], "edges": [...]}}
+
+and vis_res carries just those nodes and edges.
+
+Triples are checked against the KG (verify_list) only the first time they
+appear, so a turn costs the new triples, not the whole conversation.
+
+Memory is bounded by CONVERSATIONS_MAX graphs and CONVERSATIONS_MAX_ITEMS
+nodes + edges across all graphs; the least recently used graphs are evicted
+first. A continue_conversation for an evicted graph rebuilds it from the
+request and answers with the full graph ("reset": true).
+"""
+from collections import OrderedDict
+import os
+import threading
+
+from kg_index import normalize_name
+
+MAX_CONVERSATIONS = int(os.getenv("CONVERSATIONS_MAX", "500"))
+MAX_ITEMS = int(os.getenv("CONVERSATIONS_MAX_ITEMS", "200000"))
+
+
+def _node_id(name):
+    return f"n:{normalize_name(name)}"
+
+
+class ConversationGraph:
+    def __init__(self):
+        self.nodes = {}          # node id -> {"id", "name", "category"}
+        self.edges = {}          # (source, target, category) -> edge dict
+        self.name_mapping = {}   # KG name -> name as the answer wrote it
+        self.seen = set()        # (head key, relation, tail key) already merged
+        self.version = 0
+        self.lock = threading.Lock()  # one request per conversation merges at a time
+
+    @property
+    def size(self):
+        return len(self.nodes) + len(self.edges)
+
+    def new_triples(self, triples):
+        """Distinct, well-formed triples not merged yet, in input order."""
+        out, keys = [], set()
+        for t in triples:
+            if not (isinstance(t, (list, tuple)) and len(t) >= 3 and t[0] and t[2]):
+                continue
+            key = (normalize_name(t[0]), (t[1] or "").strip().lower(), normalize_name(t[2]))
+            if key not in self.seen and key not in keys:
+                keys.add(key)
+                out.append(list(t[:3]))
+        return out
+
+    def merge(self, triples, results, categories=None):
+        """Merge triples with their verify results (same order); return the diff."""
+        categories = categories or {}
+        diff = {"added": {"nodes": [], "edges": []}, "updated": {"nodes": [], "edges": []}}
+        added_nodes, added_edges = set(), set()
+
+        def node(raw, kg_name):
+            nid = _node_id(kg_name)
+            category = categories.get(normalize_name(raw))
+            cur = self.nodes.get(nid)
+            if cur is None:
+                self.nodes[nid] = cur = {"id": nid, "name": kg_name, "category": category or "Objects"}
+                added_nodes.add(nid)
+                diff["added"]["nodes"].append(cur)
+            elif category and cur["category"] != category and nid not in added_nodes:
+                cur["category"] = category
+                diff["updated"]["nodes"].append(cur)
+            if raw != kg_name:
+                self.name_mapping[kg_name] = raw
+            return nid
+
+        for t, res in zip(triples, results):
+            self.seen.add((normalize_name(t[0]), (t[1] or "").strip().lower(), normalize_name(t[2])))
+            resolved = res.get("resolved") or {}
+            src = node(t[0], resolved.get("head") or t[0])
+            dst = node(t[2], resolved.get("tail") or t[2])
+            category = resolved.get("alt_rel") or res.get("rel_norm") or t[1]
+            key = (src, dst, category)
+            count = int(res.get("count") or 0)
+            cur = self.edges.get(key)
+            if cur is None:
+                # PubMed ids are paged from /api/evidence with the edge's cursor
+                self.edges[key] = cur = {
+                    "source": src, "target": dst, "category": category, "PubMed_ID": "",
+                    "status": res.get("status", "unsure"), "count": count,
+                    "evidence": (res.get("evidence") or {}).get("cursor"),
+                }
+                added_edges.add(key)
+                diff["added"]["edges"].append(cur)
+                continue
+            upgraded = res.get("status") == "supported" and cur["status"] != "supported"
+            if count > cur["count"] or upgraded:
+                cur["count"] = max(cur["count"], count)
+                cur["evidence"] = cur["evidence"] or (res.get("evidence") or {}).get("cursor")
+                if res.get("status") == "supported":
+                    cur["status"] = "supported"
+                if key not in added_edges:
+                    diff["updated"]["edges"].append(cur)
+
+        if any(diff["added"].values()) or any(diff["updated"].values()):
+            self.version += 1
+        diff["version"] = self.version
+        return diff
+
+    def full(self):
+        return {"nodes": list(self.nodes.values()), "edges": list(self.edges.values())}
+
+
+class ConversationStore:
+    def __init__(self, max_conversations=MAX_CONVERSATIONS, max_items=MAX_ITEMS):
+        self.max_conversations = max_conversations
+        self.max_items = max_items
+        self._graphs = OrderedDict()   # conversation id -> ConversationGraph
+        self._lock = threading.Lock()
+        self._items = 0
+        self._stats = {"created": 0, "merged": 0, "evicted": 0, "resets": 0}
+
+    def get(self, cid, create=False):
+        """Return (graph, created)."""
+        with self._lock:
+            g = self._graphs.get(cid)
+            if g is not None:
+                self._graphs.move_to_end(cid)
+                return g, False
+            if not create:
+                return None, False
+            g = self._graphs[cid] = ConversationGraph()
+            self._stats["created"] += 1
+            return g, True
+
+    def drop(self, cid):
+        with self._lock:
+            g = self._graphs.pop(cid, None)
+            if g is not None:
+                self._items -= g.size
+
+    def account(self, cid, before, after):
+        """Record a graph's size change and evict older graphs if over budget."""
+        with self._lock:
+            if cid in self._graphs:  # may have been evicted by a concurrent request
+                self._items += after - before
+            self._stats["merged"] += 1
+            while self._graphs and (len(self._graphs) > self.max_conversations or self._items > self.max_items):
+                old_id, old = next(iter(self._graphs.items()))
+                if old_id == cid:
+                    break  # only the graph being answered is left; it may stay oversize
+                del self._graphs[old_id]
+                self._items -= old.size
+                self._stats["evicted"] += 1
+
+    def count_reset(self):
+        with self._lock:
+            self._stats["resets"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"conversations": len(self._graphs), "items": self._items,
+                    "max_conversations": self.max_conversations, "max_items": self.max_items,
+                    **self._stats}
+
+
+_STORE = ConversationStore()
+
+
+def update(cid, input_type, triples, enrich, categories=None, full=False):
+    """
+    Apply one /api/data call. `enrich(triples) -> verify results` is only
+    called with triples this conversation has not seen. Returns
+    (vis_res, node_name_mapping, diff); vis_res is the whole graph for a new,
+    reset or `full` request and just the added + updated items otherwise.
+    """
+    store = _STORE
+    if input_type == "new_conversation":
+        store.drop(cid)
+    g, created = store.get(cid, create=True)
+    reset = created and input_type != "new_conversation"
+    if reset:
+        store.count_reset()
+
+    with g.lock:
+        fresh = g.new_triples(triples)
+        before = g.size
+        diff = g.merge(fresh, enrich(fresh) if fresh else [], categories)
+        store.account(cid, before, g.size)
+        diff["reset"] = reset
+        if created or full:
+            return g.full(), dict(g.name_mapping), _ids(diff)
+        mapping = dict(g.name_mapping)
+    changed = {
+        "nodes": diff["added"]["nodes"] + diff["updated"]["nodes"],
+        "edges": diff["added"]["edges"] + diff["updated"]["edges"],
+    }
+    names = {n["name"] for n in changed["nodes"]}
+    return changed, {k: v for k, v in mapping.items() if k in names}, _ids(diff)
+
+
+def _ids(diff):
+    # the items themselves travel in vis_res; the diff only says which is which
+    for part in ("added", "updated"):
+        diff[part] = {"nodes": [n["id"] for n in diff[part]["nodes"]],
+                      "edges": [[e["source"], e["target"], e["category"]] for e in diff[part]["edges"]]}
+    return diff
+
+
+def stats():
+    return _STORE.stats()
@@ -0,0 +1,526 @@
+# api/csr_graph.py
+"""
+Embedded, read-only graph backend: the KG in NumPy CSR arrays.
+
+verify, recommend, evidence, lexicon and neighbors only need exact-name
+lookups, 1-hop neighbours with relation type and evidence count, and 2-hop
+bridges. With GRAPH_BACKEND=csr, graph.get_driver() returns a CSRDriver
+instead of a Neo4j driver; its transactions are CSRTx, the NumPy
+implementation of kg_backend.GraphTx: same rows as neo4j_graph.Neo4jTx, same
+order, same ties (benchmarks/csr_parity.py checks).
+
+Input is a KG export, a directory with nodes and edges as parquet or CSV:
+
+    nodes.parquet|csv   id, name, [name_key], [aliases], [cui]
+    edges.parquet|csv   [id], source, target, type, [pmid]
+
+`export` writes one from Neo4j; `build` turns it into GRAPH_CSR_PATH, which
+is what the server loads (an export directory also works, it is converted on
+the fly):
+
+    node_ids   (N,)    Neo4j ids, sorted; node i is node_ids[i]
+    names / keys / aliases / cuis   blob + offsets per node
+    key_hash   (N,)    64-bit hash of each name_key, sorted; key_order maps back
+    name_rank  (N,)    rank of (lower(name), id), the recommend tie order
+    indptr     (N+1,)  half-edges of node i are [indptr[i], indptr[i+1])
+    nbr / hrel / hedge (2E,)  other end, relation code, relationship index
+    rel_ids    (E,)    Neo4j id(r); rel types are interned as small ints
+    pmid       blob + offsets per relationship (PubMed_ID as a string)
+
+    python api/csr_graph.py export --out kg_export/
+    python api/csr_graph.py build --src kg_export/ [--out api/kg.csr.npz]
+    python api/csr_graph.py status
+"""
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from kg_backend import GraphTx
+from kg_index import normalize_name
+import blobs
+
+_DEFAULT_PATH = str(Path(__file__).with_name("kg.csr.npz"))
+
+_ALIAS_SEP = "\x1f"
+
+_GRAPH = None
+_LOCK = threading.Lock()
+
+
+def _path():
+    return os.getenv("GRAPH_CSR_PATH", _DEFAULT_PATH)
+
+
+def _key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _in(values, targets):
+    # np.isin has a fixed cost that dominates for the usual one or two targets
+    if len(targets) == 1:
+        return values == targets[0]
+    return np.isin(values, targets)
+
+
+class TransactionTimedOut(Exception):
+    """Raised when a unit_of_work timeout runs out; graph.is_timeout() matches the code."""
+    code = "Neo.ClientError.Transaction.TransactionTimedOutClientConfiguration"
+
+
+# --- build -----------------------------------------------------------------
+def _read_table(src, stem):
+    import pandas as pd
+    for ext, reader in (("parquet", pd.read_parquet), ("csv", lambda p: pd.read_csv(p, keep_default_na=False))):
+        p = Path(src) / f"{stem}.{ext}"
+        if p.exists():
+            return reader(p)
+    raise FileNotFoundError(f"no {stem}.parquet or {stem}.csv in {src}")
+
+
+def _aliases(v):
+    if v is None or (isinstance(v, float) and v != v):
+        return []
+    if isinstance(v, str):
+        return [a for a in v.split("|") if a] if v else []
+    return [str(a) for a in v]
+
+
+def _text(df, col, n):
+    if col not in df:
+        return [""] * n
+    return ["" if v is None or (isinstance(v, float) and v != v) else str(v) for v in df[col].tolist()]
+
+
+def build_arrays(nodes, edges):
+    """pandas nodes/edges (export columns) -> dict of arrays + meta."""
+    nodes = nodes.sort_values("id", kind="stable").reset_index(drop=True)
+    n = len(nodes)
+    node_ids = nodes["id"].to_numpy(np.int64)
+    names = _text(nodes, "name", n)
+    keys = _text(nodes, "name_key", n) if "name_key" in nodes else [normalize_name(x) for x in names]
+    aliases = [_ALIAS_SEP.join(_aliases(v)) for v in nodes["aliases"]] if "aliases" in nodes else [""] * n
+    cuis = _text(nodes, "cui", n)
+
+    # relationships whose ends are not in the node table are dropped
+    sid, tid = edges["source"].to_numpy(np.int64), edges["target"].to_numpy(np.int64)
+    src = np.minimum(np.searchsorted(node_ids, sid), max(n - 1, 0))
+    dst = np.minimum(np.searchsorted(node_ids, tid), max(n - 1, 0))
+    ok = (node_ids[src] == sid) & (node_ids[dst] == tid) if n else np.zeros(len(edges), bool)
+    edges = edges[ok].reset_index(drop=True)
+    src, dst = src[ok].astype(np.int64), dst[ok].astype(np.int64)
+    e = len(edges)
+    rel_ids = edges["id"].to_numpy(np.int64) if "id" in edges else np.arange(e, dtype=np.int64)
+    types = [t.upper() for t in _text(edges, "type", e)]
+    rel_types = sorted(set(types))
+    code = {t: i for i, t in enumerate(rel_types)}
+    erel = np.array([code[t] for t in types], np.uint16)
+
+    # undirected: each relationship is listed under both ends (once for a self-loop)
+    loop = src == dst
+    eidx = np.arange(e, dtype=np.int64)
+    hn = np.concatenate([src, dst[~loop]])
+    ho = np.concatenate([dst, src[~loop]])
+    he = np.concatenate([eidx, eidx[~loop]])
+    order = np.lexsort((he, hn))  # per node, in relationship order
+    indptr = np.zeros(n + 1, np.int64)
+    np.cumsum(np.bincount(hn, minlength=n), out=indptr[1:])
+
+    hashes = np.array([_key_hash(k) for k in keys], np.uint64)
+    key_order = np.lexsort((node_ids, hashes))
+    rank = np.empty(n, np.int32)
+    rank[sorted(range(n), key=lambda i: (names[i].lower(), int(node_ids[i])))] = np.arange(n, dtype=np.int32)
+
+    name_blob, name_off = blobs.pack(names)
+    key_blob, key_off = blobs.pack(keys)
+    alias_blob, alias_off = blobs.pack(aliases)
+    cui_blob, cui_off = blobs.pack(cuis)
+    pmid_blob, pmid_off = blobs.pack(_text(edges, "pmid", e))
+    return {
+        "node_ids": node_ids,
+        "name_blob": name_blob, "name_off": name_off,
+        "key_blob": key_blob, "key_off": key_off,
+        "key_hash": hashes[key_order], "key_order": key_order,
+        "alias_blob": alias_blob, "alias_off": alias_off,
+        "cui_blob": cui_blob, "cui_off": cui_off,
+        "name_rank": rank,
+        "indptr": indptr,
+        "nbr": ho[order].astype(np.int32),
+        "hrel": erel[he[order]],
+        "hedge": he[order].astype(np.int32),
+        "rel_ids": rel_ids,
+        "pmid_blob": pmid_blob, "pmid_off": pmid_off,
+        "meta": {"rel_types": rel_types, "nodes": n, "edges": e, "built_at": time.time()},
+    }
+
+
+def build(src, out=None):
+    """KG export directory -> .npz at `out` (default GRAPH_CSR_PATH); returns meta."""
+    out = out or _path()
+    t0 = time.perf_counter()
+    arrays = build_arrays(_read_table(src, "nodes"), _read_table(src, "edges"))
+    arrays["meta"]["source"] = str(src)
+    tmp = f"{out}.tmp.npz"
+    np.savez(tmp, meta=np.frombuffer(json.dumps(arrays["meta"]).encode(), np.uint8),
+             **{k: v for k, v in arrays.items() if k != "meta"})
+    os.replace(tmp, out)
+    return {**arrays["meta"], "build_s": round(time.perf_counter() - t0, 2)}
+
+
+def export(out, log=print):
+    """Dump the KG from Neo4j into `out`/nodes.parquet and `out`/edges.parquet."""
+    import pandas as pd
+    import graph
+    if graph.BACKEND != "neo4j":
+        raise RuntimeError("export reads the KG from Neo4j; unset GRAPH_BACKEND")
+    os.makedirs(out, exist_ok=True)
+    nodes = graph.read(lambda tx: tx.export_nodes())
+    log(f"[csr_graph] {len(nodes)} nodes")
+    for r in nodes:
+        r["aliases"] = _aliases(r["aliases"])
+    pd.DataFrame(nodes, columns=["id", "name", "name_key", "aliases", "cui"]).to_parquet(Path(out) / "nodes.parquet")
+    edges = graph.read(lambda tx: tx.export_edges())
+    log(f"[csr_graph] {len(edges)} relationships")
+    pd.DataFrame(edges, columns=["id", "source", "target", "type", "pmid"]).to_parquet(Path(out) / "edges.parquet")
+    return {"nodes": len(nodes), "edges": len(edges), "out": str(out)}
+
+
+# --- queries -----------------------------------------------------------------
+class CSRGraph:
+    def __init__(self, arrays):
+        self.a = arrays
+        self.meta = arrays["meta"]
+        self.rel_types = self.meta["rel_types"]
+        self.rel_code = {t: i for i, t in enumerate(self.rel_types)}
+        self.node_ids = arrays["node_ids"]
+        self.indptr = arrays["indptr"]
+        self.nbr = arrays["nbr"]
+        self.hrel = arrays["hrel"]
+        self.hedge = arrays["hedge"]
+        self.degree = np.diff(self.indptr)
+
+    @property
+    def nbytes(self):
+        return int(sum(v.nbytes for v in self.a.values() if isinstance(v, np.ndarray)))
+
+    def name(self, i):
+        return blobs.str_at(self.a["name_blob"], self.a["name_off"], i)
+
+    def key(self, i):
+        return blobs.str_at(self.a["key_blob"], self.a["key_off"], i)
+
+    def by_key(self, key):
+        """Node indices whose name_key equals `key`, in id order."""
+        hashes, h = self.a["key_hash"], np.uint64(_key_hash(key))
+        lo, hi = np.searchsorted(hashes, h, "left"), np.searchsorted(hashes, h, "right")
+        # a hash collision is possible, so confirm the key itself
+        return [i for i in self.a["key_order"][lo:hi].tolist() if self.key(i) == key]
+
+    def by_ids(self, ids):
+        """Node indices for Neo4j ids, in the given order; unknown ids are dropped."""
+        ids = np.asarray(list(ids), np.int64)
+        pos = np.searchsorted(self.node_ids, ids)
+        ok = pos < len(self.node_ids)
+        ok[ok] = self.node_ids[pos[ok]] == ids[ok]
+        return pos[ok].tolist()
+
+    def _adj(self, i):
+        s = slice(self.indptr[i], self.indptr[i + 1])
+        return self.nbr[s], self.hrel[s], self.hedge[s]
+
+    def _mult(self, i):
+        """(sorted neighbour indices, parallel-edge counts) of node i."""
+        return np.unique(self.nbr[self.indptr[i]:self.indptr[i + 1]], return_counts=True)
+
+    @staticmethod
+    def _count(mult, m):
+        """Parallel-edge counts for nodes `m` from a _mult() pair (0 if not adjacent)."""
+        u, c = mult
+        if not len(u):
+            return np.zeros(len(m), np.int64)
+        j = np.minimum(np.searchsorted(u, m), len(u) - 1)
+        return np.where(u[j] == m, c[j], 0)
+
+    def direct(self, hs, ts):
+        """neo4j_graph.Q_DIRECT rows: evidence per relation type, in first-seen order."""
+        counts = {}
+        ts = np.asarray(ts, np.int32)
+        for h in hs:
+            nbr, rel, _ = self._adj(h)
+            for c in rel[_in(nbr, ts)].tolist():
+                counts[c] = counts.get(c, 0) + 1
+        return [{"reltype": self.rel_types[c], "evidence": n} for c, n in counts.items()]
+
+    def bridge(self, hs, ts, expand, hub_degree, deadline=None):
+        """neo4j_graph.Q_TWO: best (bridge name, weight) over every (h, t) pair, or None."""
+        best = None  # (-weight, name)
+        for h in hs:
+            for t in ts:
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise TransactionTimedOut("bridge search exceeded the transaction timeout")
+                a, b = (h, t) if self.degree[h] <= self.degree[t] else (t, h)
+                nbr = self.nbr[self.indptr[a]:self.indptr[a + 1]]
+                cand = nbr[(nbr != a) & (nbr != b) & (self.degree[nbr] <= hub_degree)]
+                if not len(cand):
+                    continue
+                _, first = np.unique(cand, return_index=True)
+                ms = cand[np.sort(first)][:expand]  # distinct, in expansion order
+                c2 = self._count(self._mult(b), ms)
+                hit = c2 > 0
+                if not hit.any():
+                    continue
+                ms = ms[hit]
+                w = c2[hit] + self._count(self._mult(a), ms)
+                top = w.max()
+                name = min(self.name(int(m)) for m in ms[w == top])
+                if best is None or (-int(top), name) < best:
+                    best = (-int(top), name)
+        return (best[1], -best[0]) if best else None
+
+    def evidence(self, hs, ts, rel, after, limit):
+        """neo4j_graph.Q_EVIDENCE rows: (pmid, rid) after `after`, in order."""
+        code = self.rel_code.get(rel)
+        if code is None:
+            return []
+        ts = np.asarray(ts, np.int32)
+        pb, po, rid = self.a["pmid_blob"], self.a["pmid_off"], self.a["rel_ids"]
+        rows = []
+        for h in hs:
+            nbr, r, e = self._adj(h)
+            for j in e[_in(nbr, ts) & (r == code)].tolist():
+                rows.append((blobs.str_at(pb, po, j), int(rid[j])))
+        rows.sort()
+        return [{"pmid": p, "rid": r} for p, r in rows if (p, r) > after][:limit]
+
+    def recommend(self, hs, whitelist, exclude, limit):
+        """neo4j_graph.Q_RECOMMEND rows for head indices `hs`."""
+        codes = [self.rel_code[w] for w in whitelist if w in self.rel_code]
+        if whitelist and not codes:
+            return []
+        excl = np.array(sorted({i for k in exclude for i in self.by_key(k)}), np.int32)
+        nr = len(self.rel_types)
+        parts = []
+        for h in hs:
+            nbr, rel, _ = self._adj(h)
+            keep = np.ones(len(nbr), bool)
+            if codes:
+                keep &= np.isin(rel, codes)
+            if len(excl):
+                keep &= ~np.isin(nbr, excl)
+            combo, cnt = np.unique(nbr[keep].astype(np.int64) * nr + rel[keep], return_counts=True)
+            parts.append((np.full(len(combo), h), combo // nr, combo % nr, cnt))
+        if not parts:
+            return []
+        hh, tt, rr, cc = (np.concatenate(x) for x in zip(*parts))
+        # evidence desc, relation asc, tail name asc (ties: tail id); stable across heads
+        order = np.lexsort((self.a["name_rank"][tt], rr, -cc))[:limit]
+        return [{"head_name": self.name(int(hh[j])), "head_id": int(self.node_ids[hh[j]]),
+                 "tail_name": self.name(int(tt[j])), "tail_id": int(self.node_ids[tt[j]]),
+                 "relation": self.rel_types[rr[j]], "evidence": int(cc[j])} for j in order.tolist()]
+
+    def top(self, hs, top):
+        """neo4j_graph.Q_TOP rows."""
+        out = []
+        nr = len(self.rel_types)
+        for h in hs:
+            nbr, rel, _ = self._adj(h)
+            combo, cnt = np.unique(rel.astype(np.int64) * len(self.node_ids) + nbr, return_counts=True)
+            rr, tt = combo // len(self.node_ids), combo % len(self.node_ids)
+            order = np.lexsort((self.a["name_rank"][tt], -cnt, rr))
+            for code in range(nr):
+                sel = order[rr[order] == code][:top]
+                if len(sel):
+                    out.append({"hid": int(self.node_ids[h]), "rtype": self.rel_types[code],
+                                "top": [[int(self.node_ids[tt[j]]), int(cnt[j])] for j in sel.tolist()]})
+        return out
+
+    def nodes(self):
+        return [{"id": int(nid), "name": self.name(i), "key": self.key(i), "degree": int(self.degree[i])}
+                for i, nid in enumerate(self.node_ids.tolist())]
+
+    def lexicon(self):
+        ab, ao = self.a["alias_blob"], self.a["alias_off"]
+        return [{"id": int(nid), "name": self.name(i),
+                 "aliases": [x for x in blobs.str_at(ab, ao, i).split(_ALIAS_SEP) if x]}
+                for i, nid in enumerate(self.node_ids.tolist())]
+
+    def probe(self, idx):
+        cb, co = self.a["cui_blob"], self.a["cui_off"]
+        return [{"labels": ["Node"], "Name": self.name(i), "CUI": blobs.str_at(cb, co, i) or None,
+                 "id": int(self.node_ids[i])} for i in idx[:5]]
+
+
+class CSRTx(GraphTx):
+    """GraphTx over a CSRGraph; `deadline` (perf_counter) bounds the bridge search."""
+
+    def __init__(self, g, deadline=None):
+        self.g = g
+        self.deadline = deadline
+
+    def _ends(self, anchor):
+        g = self.g
+        if "hids" in anchor:
+            return g.by_ids(anchor["hids"]), g.by_ids(anchor["tids"])
+        return g.by_key(anchor["hkey"]), g.by_key(anchor["tkey"])
+
+    def _heads(self, head_ids, head_key):
+        return self.g.by_ids(head_ids) if head_ids is not None else self.g.by_key(head_key)
+
+    def direct_pair(self, hkey, tkey):
+        return self.g.direct(self.g.by_key(hkey), self.g.by_key(tkey))
+
+    def bridge_pair(self, hkey, tkey, expand, hub_degree):
+        hit = self.g.bridge(self.g.by_key(hkey), self.g.by_key(tkey), expand, hub_degree, self.deadline)
+        return hit[0] if hit else None
+
+    def direct(self, items):
+        out = {}
+        for it in items:
+            rows = self.g.direct(*self._ends(it))
+            if rows:
+                out[it["idx"]] = rows
+        return out
+
+    def bridges(self, items, expand, hub_degree):
+        out = {}
+        for it in items:
+            hit = self.g.bridge(*self._ends(it), expand, hub_degree, self.deadline)
+            if hit:
+                out[it["idx"]] = hit[0]
+        return out
+
+    def evidence(self, anchor, rel, after, limit):
+        return self.g.evidence(*self._ends(anchor), rel, after, limit)
+
+    def recommend(self, head_ids, head_key, whitelist, exclude, limit):
+        return self.g.recommend(self._heads(head_ids, head_key), whitelist, exclude, limit)
+
+    def recommend_batch(self, items):
+        out = {}
+        for it in items:
+            rows = self.g.recommend(self._heads(it["head_ids"], it["head_key"]),
+                                    it["whitelist"], it["exclude"], it["limit"])
+            if rows:
+                out[it["idx"]] = rows
+        return out
+
+    def probe(self, ids=None, key=None):
+        return self.g.probe(self.g.by_ids(ids) if ids else self.g.by_key(key))
+
+    def lexicon(self):
+        return self.g.lexicon()
+
+    def nodes(self):
+        return self.g.nodes()
+
+    def top(self, ids, top):
+        return self.g.top(self.g.by_ids(ids), top)
+
+    def index_status(self, name):
+        # the name_key lookup is an in-memory sorted index here
+        return {"name": name, "state": "ONLINE", "populationPercent": 100.0,
+                "labelsOrTypes": ["Node"], "properties": ["name_key"]}
+
+    def stamp(self):
+        m = self.g.meta
+        return f"csr:{m.get('path')}:{m.get('built_at')}:{m.get('nodes')}:{m.get('edges')}"
+
+# --- driver surface ------------------------------------------------------------
+class CSRSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, *args, **kwargs):
+        # no network: the session is its own transaction
+        timeout = getattr(work, "timeout", None)  # set by neo4j.unit_of_work
+        deadline = time.perf_counter() + timeout if timeout else None
+        return work(CSRTx(self.driver.graph, deadline), *args, **kwargs)
+
+    def close(self):
+        pass
+
+
+class CSRDriver:
+    def __init__(self, g):
+        self.graph = g
+
+    def session(self, **_):
+        return CSRSession(self)
+
+    def close(self):
+        pass
+
+
+# --- loading -------------------------------------------------------------------
+def _load_file(path):
+    with np.load(path) as z:
+        arrays = {k: z[k] for k in z.files if k != "meta"}
+        arrays["meta"] = json.loads(bytes(z["meta"]).decode())
+    return arrays
+
+
+def load(path=None):
+    """CSRGraph from a built .npz or straight from an export directory."""
+    path = path or _path()
+    t0 = time.perf_counter()
+    if os.path.isdir(path):
+        arrays = build_arrays(_read_table(path, "nodes"), _read_table(path, "edges"))
+    else:
+        arrays = _load_file(path)
+    arrays["meta"]["load_s"] = round(time.perf_counter() - t0, 3)
+    arrays["meta"]["path"] = str(path)
+    return CSRGraph(arrays)
+
+
+def open_driver(path=None):
+    """graph.get_driver() hook for GRAPH_BACKEND=csr; loads once per process."""
+    global _GRAPH
+    with _LOCK:
+        if _GRAPH is None:
+            _GRAPH = load(path)
+    return CSRDriver(_GRAPH)
+
+
+def status():
+    g = _GRAPH
+    if g is None:
+        return {"loaded": False, "path": _path()}
+    return {"loaded": True, **{k: g.meta.get(k) for k in ("path", "nodes", "edges", "built_at", "load_s")},
+            "rel_types": len(g.rel_types), "bytes": g.nbytes}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export the KG and build the in-memory CSR backend.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export")
+    e.add_argument("--out", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--src", required=True, help="export directory (nodes/edges parquet or csv)")
+    b.add_argument("--out", default=None)
+    s = sub.add_parser("status")
+    s.add_argument("--path", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        print(json.dumps(export(args.out), indent=2))
+    elif args.cmd == "build":
+        print(json.dumps(build(args.src, args.out), indent=2))
+    else:
+        global _GRAPH
+        _GRAPH = load(args.path)
+        print(json.dumps(status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# api/embed_batcher.py
+"""
+Cross-request micro-batching for embedding calls.
+
+Flask worker threads that need embeddings at about the same time each call
+EmbeddingDispatcher.embed(). Requests for the same model key are held for at
+most EMBED_BATCH_WINDOW_MS (or until MAX_BATCH inputs are waiting), sent as
+one API call from a small fetch pool, and the vectors are handed back to each
+caller. The queue is bounded by EMBED_BATCH_MAX_PENDING inputs; beyond that,
+callers get EmbeddingQueueFull instead of piling up.
+
+A window of 0 disables batching: embed() then calls fetch() directly.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+from embed_cache import MAX_BATCH
+
+
+class EmbeddingQueueFull(RuntimeError):
+    pass
+
+
+class _Pending:
+    __slots__ = ("texts", "fetch", "event", "result", "error", "enqueued")
+
+    def __init__(self, texts, fetch):
+        self.texts = texts
+        self.fetch = fetch
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.enqueued = time.monotonic()
+
+
+class EmbeddingDispatcher:
+    def __init__(self, window_ms=None, max_batch=MAX_BATCH, max_pending=None, workers=None, timeout_s=None):
+        self.window = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5") if window_ms is None else window_ms) / 1000.0
+        self.max_batch = int(max_batch)
+        self.max_pending = int(max_pending or os.getenv("EMBED_BATCH_MAX_PENDING", str(8 * MAX_BATCH)))
+        self.timeout_s = float(timeout_s or os.getenv("EMBED_BATCH_TIMEOUT_S", "60"))
+        self._workers = int(workers or os.getenv("EMBED_BATCH_WORKERS", "4"))
+        self._cv = threading.Condition()
+        self._groups = {}        # model key -> [pending, ...] in arrival order
+        self._pending_inputs = 0
+        self._pool = None
+        self._thread = None
+        self._stats = {"requests": 0, "inputs": 0, "batches": 0, "rejected": 0, "max_wait_ms": 0.0}
+
+    def _start(self):
+        if self._thread is None:
+            self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="embed-fetch")
+            self._thread = threading.Thread(target=self._loop, name="embed-dispatch", daemon=True)
+            self._thread.start()
+
+    def embed(self, texts, key, fetch):
+        """Return fetch()-equivalent vectors for `texts`, possibly batched with other callers."""
+        texts = list(texts)
+        if self.window <= 0 or not texts or len(texts) >= self.max_batch:
+            return fetch(texts)
+        p = _Pending(texts, fetch)
+        with self._cv:
+            if self._pending_inputs + len(texts) > self.max_pending:
+                self._stats["rejected"] += 1
+                raise EmbeddingQueueFull(f"{self._pending_inputs} embedding inputs already queued")
+            self._start()
+            self._groups.setdefault(key, []).append(p)
+            self._pending_inputs += len(texts)
+            self._stats["requests"] += 1
+            self._cv.notify()
+        if not p.event.wait(self.timeout_s):
+            raise TimeoutError("embedding batch did not complete in time")
+        if p.error is not None:
+            raise p.error
+        return p.result
+
+    def _take_ready(self):
+        """Pop one ready batch (key, items) or return the seconds until the next deadline."""
+        now = time.monotonic()
+        next_due = None
+        for key, items in self._groups.items():
+            waiting = sum(len(p.texts) for p in items)
+            due = items[0].enqueued + self.window
+            if waiting >= self.max_batch or now >= due:
+                batch, n = [], 0
+                while items and n + len(items[0].texts) <= self.max_batch:
+                    n += len(items[0].texts)
+                    batch.append(items.pop(0))
+                if not items:
+                    del self._groups[key]
+                self._pending_inputs -= n
+                return batch, None
+            next_due = due if next_due is None else min(next_due, due)
+        return None, (None if next_due is None else max(0.0, next_due - now))
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                batch, wait = self._take_ready()
+                while batch is None:
+                    self._cv.wait(wait)
+                    batch, wait = self._take_ready()
+                waited = (time.monotonic() - batch[0].enqueued) * 1000.0
+                self._stats["batches"] += 1
+                self._stats["inputs"] += sum(len(p.texts) for p in batch)
+                self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], round(waited, 2))
+            self._pool.submit(self._run, batch)
+
+    @staticmethod
+    def _run(batch):
+        texts = [t for p in batch for t in p.texts]
+        try:
+            vecs = batch[0].fetch(texts)
+            i = 0
+            for p in batch:
+                p.result = vecs[i:i + len(p.texts)]
+                i += len(p.texts)
+        except Exception as e:
+            for p in batch:
+                p.error = e
+        for p in batch:
+            p.event.set()
+
+    def stats(self):
+        with self._cv:
+            s = dict(self._stats)
+            s["queued_inputs"] = self._pending_inputs
+        s["window_ms"] = self.window * 1000.0
+        s["avg_batch_inputs"] = round(s["inputs"] / s["batches"], 2) if s["batches"] else 0.0
+        return s
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_dispatcher():
+    global _DEFAULT
+    if _DEFAULT is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT is None:
+                _DEFAULT = EmbeddingDispatcher()
+    return _DEFAULT
+
+
+def stats():
+    return _DEFAULT.stats() if _DEFAULT is not None else {}
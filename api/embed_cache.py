@@ -0,0 +1,175 @@
+# api/embed_cache.py
+"""
+Two-level cache for text embeddings keyed by (model, normalized text).
+
+  1. in-process LRU (EMBED_CACHE_MEM_ITEMS entries)
+  2. SQLite file on disk (EMBED_CACHE_PATH; empty string disables it)
+
+get_many() dedupes a batch, serves what it can from memory/disk, sends only
+the distinct misses to `fetch` in chunks of at most MAX_BATCH, and writes the
+new vectors back to both levels. Vectors are stored as float32 blobs.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+MAX_BATCH = 2048  # OpenAI embeddings input limit per request
+
+_DEFAULT_PATH = str(Path(__file__).with_name("embedding_cache.sqlite"))
+
+
+def normalize_text(text: str) -> str:
+    # newlines hurt embedding quality; collapse all whitespace runs
+    return " ".join((text or "").split())
+
+
+def model_key(model, **kwargs) -> str:
+    # request options such as `dimensions` change the vector, so they are part of the key
+    return f"{model}|{json.dumps(kwargs, sort_keys=True)}" if kwargs else str(model)
+
+
+class EmbeddingCache:
+    def __init__(self, path=None, mem_items=None):
+        if path is None:
+            path = os.getenv("EMBED_CACHE_PATH", _DEFAULT_PATH)
+        self.path = path or None
+        self.mem_items = int(mem_items or os.getenv("EMBED_CACHE_MEM_ITEMS", "50000"))
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # sqlite connections are per thread
+        self._stats = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "deduped": 0, "fetch_calls": 0}
+        if self.path:
+            try:
+                self._db().execute(
+                    "CREATE TABLE IF NOT EXISTS emb (model TEXT, text TEXT, vec BLOB, PRIMARY KEY (model, text))"
+                )
+                self._db().commit()
+            except sqlite3.Error as e:
+                print(f"[embed_cache] disk cache disabled ({self.path}): {e}")
+                self.path = None
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # --- memory level ----------------------------------------------------
+    def _mem_get(self, key):
+        with self._lock:
+            v = self._lru.get(key)
+            if v is not None:
+                self._lru.move_to_end(key)
+            return v
+
+    def _mem_put(self, key, vec):
+        with self._lock:
+            self._lru[key] = vec
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.mem_items:
+                self._lru.popitem(last=False)
+
+    # --- disk level ------------------------------------------------------
+    def _disk_get(self, model, texts):
+        if not self.path or not texts:
+            return {}
+        out = {}
+        try:
+            db = self._db()
+            for i in range(0, len(texts), 500):  # stay under SQLite's variable limit
+                part = texts[i:i + 500]
+                q = f"SELECT text, vec FROM emb WHERE model = ? AND text IN ({','.join('?' * len(part))})"
+                for text, blob in db.execute(q, [model, *part]):
+                    out[text] = np.frombuffer(blob, dtype=np.float32)
+        except sqlite3.Error as e:
+            print(f"[embed_cache] disk read failed: {e}")
+        return out
+
+    def _disk_put(self, model, items):
+        if not self.path or not items:
+            return
+        try:
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO emb (model, text, vec) VALUES (?, ?, ?)",
+                [(model, t, np.asarray(v, dtype=np.float32).tobytes()) for t, v in items],
+            )
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"[embed_cache] disk write failed: {e}")
+
+    # --- public ----------------------------------------------------------
+    def get_many(self, texts, model, fetch):
+        """
+        Return one vector (list of floats) per input text, in order.
+        `fetch(list_of_texts) -> list_of_vectors` is called only for distinct misses,
+        never with more than MAX_BATCH texts at once.
+        """
+        norm = [normalize_text(t) for t in texts]
+        uniq = list(dict.fromkeys(norm))
+        found = {}
+        for t in uniq:
+            v = self._mem_get((model, t))
+            if v is not None:
+                found[t] = v
+        mem_hits = len(found)
+
+        disk = self._disk_get(model, [t for t in uniq if t not in found])
+        for t, v in disk.items():
+            self._mem_put((model, t), v)
+        found.update(disk)
+
+        missing = [t for t in uniq if t not in found]
+        fetched = []
+        for i in range(0, len(missing), MAX_BATCH):
+            chunk = missing[i:i + MAX_BATCH]
+            vecs = fetch(chunk)
+            with self._lock:
+                self._stats["fetch_calls"] += 1
+            for t, v in zip(chunk, vecs):
+                v = np.asarray(v, dtype=np.float32)
+                found[t] = v
+                self._mem_put((model, t), v)
+                fetched.append((t, v))
+        self._disk_put(model, fetched)
+
+        with self._lock:
+            self._stats["mem_hits"] += mem_hits
+            self._stats["disk_hits"] += len(disk)
+            self._stats["misses"] += len(missing)
+            self._stats["deduped"] += len(norm) - len(uniq)
+        return [found[t].tolist() for t in norm]
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["mem_items"] = len(self._lru)
+        lookups = s["mem_hits"] + s["disk_hits"] + s["misses"]
+        s["hit_rate"] = round((s["mem_hits"] + s["disk_hits"]) / lookups, 4) if lookups else 0.0
+        s["disk_path"] = self.path
+        return s
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_cache():
+    global _DEFAULT
+    if _DEFAULT is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT is None:
+                _DEFAULT = EmbeddingCache()
+    return _DEFAULT
+
+
+def stats():
+    """Stats of the shared cache, or {} if nothing has used it yet."""
+    return _DEFAULT.stats() if _DEFAULT is not None else {}
@@ -0,0 +1,333 @@
+# api/embed_store.py
+"""
+Binary embedding store: the parquet converted once into a file the server
+memory-maps instead of parsing, so a cold start costs page faults rather
+than a pandas decode and a renormalization, and every process on the host
+shares one copy through the page cache.
+
+One segment file:
+
+    0      b"KNEMBST1"
+    8      uint64 header length
+    16     JSON header: format, rows, dim, offsets of the sections below,
+           base_id, source (parquet name + mtime), created_at
+    page   matrix          (rows, dim) float32, unit-norm rows, C order
+    ...    name offsets    (rows + 1,) int64 into the blob
+    ...    name blob       UTF-8 names back to back
+
+The base lives at <parquet>.store (or EMBEDDINGS_STORE). `append` adds
+concepts new to the KG as delta segments <store>.delta-0001, ... without
+rewriting the base; names already in the store are skipped. Deltas carry
+their base's base_id, so a rebuilt base never picks up stale ones. `compact`
+folds the deltas into a new base.
+
+    python api/embed_store.py build   [--path ADInt_CUI_embeddings.parquet]
+    python api/embed_store.py append  --src new_concepts.parquet
+    python api/embed_store.py compact
+    python api/embed_store.py status
+
+embeds.load() uses the store when it was built from the current parquet (or
+there is no parquet) and falls back to the parquet otherwise; running
+servers pick up appended deltas like a changed parquet
+(EMBEDDINGS_RELOAD_CHECK_S). EMBEDDINGS_USE_STORE=0 ignores the store.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+MAGIC = b"KNEMBST1"
+FORMAT = 1
+SUFFIX = ".store"
+PAGE = 4096
+
+USE_STORE = os.getenv("EMBEDDINGS_USE_STORE", "1") == "1"
+
+
+def store_path(parquet_path):
+    return os.getenv("EMBEDDINGS_STORE") or str(parquet_path) + SUFFIX
+
+
+def delta_paths(path):
+    return sorted(glob.glob(glob.escape(path) + ".delta-*"))
+
+
+class NameTable:
+    """Row names as one UTF-8 blob + offsets: no per-name Python objects, mmap-able."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob          # uint8 (bytes,)
+        self.offsets = offsets    # int64 (N + 1,)
+
+    @classmethod
+    def from_strings(cls, names):
+        enc = [("" if n is None else str(n)).encode("utf-8") for n in names]
+        offsets = np.zeros(len(enc) + 1, np.int64)
+        np.cumsum([len(b) for b in enc], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(enc), np.uint8), offsets)
+
+    @classmethod
+    def concat(cls, tables):
+        if len(tables) == 1:
+            return tables[0]
+        blobs, offs, base = [], [np.zeros(1, np.int64)], 0
+        for t in tables:
+            blobs.append(np.asarray(t.blob))
+            offs.append(t.offsets[1:] + base)
+            base += int(t.offsets[-1])
+        return cls(np.concatenate(blobs), np.concatenate(offs))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def tolist(self):
+        raw = bytes(self.blob)
+        off = self.offsets.tolist()
+        return [raw[off[i]:off[i + 1]].decode("utf-8") for i in range(len(self))]
+
+    @property
+    def nbytes(self):
+        return int(self.blob.nbytes + self.offsets.nbytes)
+
+
+class SegmentedMatrix:
+    """
+    Row-wise concatenation of memory-mapped segments without copying them.
+    Offers what ann.py and quant.py touch on a matrix: shape, dtype, nbytes,
+    row slices and fancy indexing. A slice inside one segment is a view.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.starts = np.cumsum([0] + [p.shape[0] for p in parts])
+        self.dtype = parts[0].dtype
+
+    @property
+    def shape(self):
+        return int(self.starts[-1]), self.parts[0].shape[1]
+
+    @property
+    def nbytes(self):
+        return int(sum(p.nbytes for p in self.parts))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            a, b, step = idx.indices(len(self))
+            if step != 1:
+                raise IndexError("SegmentedMatrix only supports contiguous row slices")
+            pieces = [p[max(a - s, 0):min(b - s, p.shape[0])]
+                      for p, s in zip(self.parts, self.starts[:-1].tolist()) if a < s + p.shape[0] and b > s]
+            if not pieces:
+                return np.empty((0, self.shape[1]), self.dtype)
+            return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+        idx = np.asarray(idx)
+        if idx.ndim == 0:
+            k = int(np.searchsorted(self.starts, idx, side="right") - 1)
+            return self.parts[k][int(idx) - int(self.starts[k])]
+        seg = np.searchsorted(self.starts, idx, side="right") - 1
+        out = np.empty((idx.shape[0], self.shape[1]), self.dtype)
+        for k in np.unique(seg).tolist():
+            m = seg == k
+            out[m] = self.parts[k][idx[m] - self.starts[k]]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = np.concatenate(self.parts)
+        return out.astype(dtype, copy=False) if dtype is not None else out
+
+
+# --- writing ---------------------------------------------------------------------
+def _write(path, names, mat, header):
+    """Write one segment atomically; `mat` must already be unit-norm float32."""
+    mat = np.ascontiguousarray(mat, dtype=np.float32)
+    table = names if isinstance(names, NameTable) else NameTable.from_strings(names)
+    rows, dim = mat.shape if mat.ndim == 2 else (0, 0)
+    if rows != len(table):
+        raise ValueError(f"{rows} vectors but {len(table)} names")
+    header = {**header, "format": FORMAT, "rows": rows, "dim": dim, "dtype": "float32", "created_at": time.time()}
+    # two passes: section offsets depend on the header's own length
+    for _ in range(2):
+        head = json.dumps(header).encode()
+        matrix_offset = -(-(16 + len(head)) // PAGE) * PAGE
+        header.update(matrix_offset=matrix_offset,
+                      offsets_offset=matrix_offset + mat.nbytes,
+                      blob_offset=matrix_offset + mat.nbytes + table.offsets.nbytes,
+                      blob_bytes=int(table.offsets[-1]))
+    head = json.dumps(header).encode()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(head)).tobytes())
+        f.write(head)
+        f.write(b"\0" * (matrix_offset - 16 - len(head)))
+        mat.tofile(f)
+        table.offsets.astype(np.int64).tofile(f)
+        f.write(bytes(table.blob))
+    os.replace(tmp, path)
+    return header
+
+
+def _unit_matrix(src):
+    """(NameTable, unit-norm float32 matrix) from a parquet, normalized exactly as embeds._build does."""
+    import embeds
+    names, mat = embeds._read_matrix(src)
+    return NameTable.from_strings(names.tolist()), embeds._normalize(mat)
+
+
+def build(src, out=None, log=print):
+    """Parquet -> new base store; drops any deltas of the previous base."""
+    out = out or store_path(src)
+    t0 = time.perf_counter()
+    names, mat = _unit_matrix(src)
+    header = _write(out, names, mat, {"base_id": uuid.uuid4().hex, "segment": 0,
+                                      "source": os.path.basename(src), "source_mtime": os.path.getmtime(src)})
+    for d in delta_paths(out):
+        os.remove(d)
+    log(f"[embed_store] {header['rows']} x {header['dim']} -> {out} in {time.perf_counter() - t0:.1f}s")
+    return header
+
+
+def append(src, path, log=print):
+    """Add the rows of `src` whose names the store does not have yet, as a new delta segment."""
+    store = open_store(path)
+    names, mat = _unit_matrix(src)
+    if mat.shape[0] and mat.shape[1] != store["dim"]:
+        raise ValueError(f"{src} has dim {mat.shape[1]}, the store {store['dim']}")
+    known = set(store["names"].tolist())
+    keep = [i for i, n in enumerate(names.tolist()) if n not in known and not known.add(n)]
+    if not keep:
+        log(f"[embed_store] nothing new in {src}")
+        return None
+    n = len(store["segments"])
+    out = f"{path}.delta-{n:04d}"
+    header = _write(out, [names[i] for i in keep], mat[keep],
+                    {"base_id": store["base_id"], "segment": n, "source": os.path.basename(src),
+                     "source_mtime": os.path.getmtime(src)})
+    log(f"[embed_store] +{len(keep)} rows ({mat.shape[0] - len(keep)} already known) -> {out}")
+    return header
+
+
+def compact(path, log=print):
+    """Rewrite base + deltas as one base segment (same source stamp as the base)."""
+    store = open_store(path)
+    base = store["segments"][0]
+    header = _write(path, store["names"], store["matrix"][0:store["rows"]],
+                    {"base_id": uuid.uuid4().hex, "segment": 0, "source": base["source"],
+                     "source_mtime": base["source_mtime"]})
+    for d in delta_paths(path):
+        os.remove(d)
+    log(f"[embed_store] compacted {len(store['segments'])} segments into {path} ({header['rows']} rows)")
+    return header
+
+
+# --- reading ---------------------------------------------------------------------
+def _open_segment(path):
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"{path} is not an embedding store")
+        header = json.loads(f.read(int(np.frombuffer(f.read(8), np.uint64)[0])))
+    if header.get("format") != FORMAT:
+        raise ValueError(f"{path}: store format {header.get('format')}, expected {FORMAT}")
+    rows, dim = header["rows"], header["dim"]
+    mat = (np.memmap(path, np.float32, "r", offset=header["matrix_offset"], shape=(rows, dim)) if rows
+           else np.empty((0, dim), np.float32))
+    offsets = np.memmap(path, np.int64, "r", offset=header["offsets_offset"], shape=(rows + 1,))
+    blob = (np.memmap(path, np.uint8, "r", offset=header["blob_offset"], shape=(header["blob_bytes"],))
+            if header["blob_bytes"] else np.empty(0, np.uint8))
+    return header, mat, NameTable(blob, offsets)
+
+
+def open_store(path):
+    """Map the base and its deltas: {"names", "matrix", "rows", "dim", "base_id", "segments"}."""
+    header, mat, names = _open_segment(path)
+    headers, mats, tables = [header], [mat], [names]
+    for d in delta_paths(path):
+        h, m, t = _open_segment(d)
+        if h["base_id"] != header["base_id"] or h["dim"] != header["dim"]:
+            continue  # left over from an earlier base
+        headers.append(h)
+        mats.append(m)
+        tables.append(t)
+    return {
+        "names": NameTable.concat(tables),
+        "matrix": mats[0] if len(mats) == 1 else SegmentedMatrix(mats),
+        "rows": sum(h["rows"] for h in headers),
+        "base_rows": header["rows"],
+        "dim": header["dim"],
+        "base_id": header["base_id"],
+        "source_mtime": header["source_mtime"],
+        "segments": headers,
+    }
+
+
+def stamp(path):
+    """Cheap change token for the base and its deltas (for reload checks)."""
+    try:
+        return tuple((p, os.path.getmtime(p)) for p in [path, *delta_paths(path)])
+    except OSError:
+        return None
+
+
+def usable(parquet_path):
+    """The store path to serve from, or None: missing, disabled, or older than the parquet."""
+    path = store_path(parquet_path)
+    if not USE_STORE or not os.path.exists(path):
+        return None
+    if os.path.exists(parquet_path):
+        try:
+            with open(path, "rb") as f:
+                f.read(8)
+                header = json.loads(f.read(int(np.frombuffer(f.read(8), np.uint64)[0])))
+        except (OSError, ValueError) as e:
+            print(f"[embed_store] ignoring {path}: {e}")
+            return None
+        if header.get("source_mtime") != os.path.getmtime(parquet_path):
+            print(f"[embed_store] {path} was built from another version of {parquet_path}; "
+                  "using the parquet (rebuild with `python api/embed_store.py build`)")
+            return None
+    return path
+
+
+def main():
+    import embeds
+
+    ap = argparse.ArgumentParser(description="Build and extend the memory-mapped embedding store.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--path", default=None, help="parquet (default: embeds lookup order)")
+    b.add_argument("--out", default=None)
+    a = sub.add_parser("append")
+    a.add_argument("--src", required=True, help="parquet of new concepts (Name, embedding)")
+    for p in (a, sub.add_parser("compact"), sub.add_parser("status")):
+        p.add_argument("--store", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        print(json.dumps(build(args.path or embeds._default_path(), args.out), indent=2))
+        return
+    path = args.store or store_path(embeds._default_path())
+    if not os.path.exists(path):
+        ap.error(f"no store at {path}; run `build` first")
+    if args.cmd == "append":
+        print(json.dumps(append(args.src, path), indent=2))
+    elif args.cmd == "compact":
+        print(json.dumps(compact(path), indent=2))
+    else:
+        s = open_store(path)
+        print(json.dumps({"path": path, "rows": s["rows"], "dim": s["dim"], "base_id": s["base_id"],
+                          "segments": [{k: h[k] for k in ("segment", "rows", "source", "created_at")}
+                                       for h in s["segments"]]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
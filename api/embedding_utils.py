@@ -1,26 +1,75 @@
-import textwrap as tr
-from typing import List, Optional
-
-import matplotlib.pyplot as plt
-import plotly.express as px
-from scipy import spatial
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-from sklearn.metrics import average_precision_score, precision_recall_curve
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-
-from openai import OpenAI
+# api/embedding_utils.py
+"""
+Embedding calls used while serving requests (get_embedding / get_embeddings).
+
+Kept deliberately light: the OpenAI client is created on first use, and the
+offline analysis helpers (plots, PCA/t-SNE, distances) live in
+embedding_analysis.py. Their old names still resolve from this module, but
+only import the heavy libraries when touched.
+
+    python api/embedding_utils.py --import-report [--budget-ms 500]
+"""
+from typing import List
+import argparse
 import os
+import subprocess
+import sys
+import threading
+
 import numpy as np
-import pandas as pd
 
-client = OpenAI()
+import admission
+from embed_batcher import default_dispatcher
+from embed_cache import MAX_BATCH, default_cache, model_key
+import metrics
+
 DEFAULT_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+_ANALYSIS_NAMES = {
+    "plot_multiclass_precision_recall", "distances_from_embeddings",
+    "indices_of_nearest_neighbors_from_distances", "pca_components_from_embeddings",
+    "tsne_components_from_embeddings", "chart_from_components", "chart_from_components_3D",
+}
+
+
+def get_client():
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                from openai import OpenAI
+                _CLIENT = OpenAI(max_retries=0)  # retries go through admission.call
+    return _CLIENT
+
+
+def __getattr__(name):
+    # `embedding_utils.client` and the analysis helpers are resolved on first access
+    if name == "client":
+        return get_client()
+    if name in _ANALYSIS_NAMES:
+        import embedding_analysis
+        return getattr(embedding_analysis, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _create_embeddings(list_of_text: List[str], model=DEFAULT_EMBED_MODEL, **kwargs) -> List[List[float]]:
+    """One API batch, admitted as background work: raises admission.RateLimited rather than sleeping."""
+    assert len(list_of_text) <= MAX_BATCH
+    client = get_client()
+
+    def create():
+        with metrics.timer("openai_request_seconds", op="embeddings"):
+            return client.embeddings.create(input=list_of_text, model=model, **kwargs)
+
+    resp = admission.call(client.api_key, admission.EMBED, admission.estimate_tokens(list_of_text), create)
+    return [d.embedding for d in resp.data]
+
+
 def get_embedding(text: str, model=DEFAULT_EMBED_MODEL, **kwargs) -> List[float]:
-    text = text.replace("\n", " ")
-    resp = client.embeddings.create(input=[text], model=model, **kwargs)
-    return resp.data[0].embedding
+    return get_embeddings([text], model=model, **kwargs)[0]
 
 
 # @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
@@ -36,12 +85,16 @@ def get_embedding(text: str, model=DEFAULT_EMBED_MODEL, **kwargs) -> List[float]
 #     ]
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 def get_embeddings(list_of_text: List[str], model=DEFAULT_EMBED_MODEL, **kwargs) -> List[List[float]]:
-    assert len(list_of_text) <= 2048
-    list_of_text = [t.replace("\n", " ") for t in list_of_text]
-    resp = client.embeddings.create(input=list_of_text, model=model, **kwargs)
-    return [d.embedding for d in resp.data]
+    """Cached (memory + disk), deduplicated, micro-batched, chunked to the API batch limit."""
+    model = model or DEFAULT_EMBED_MODEL
+    key = model_key(model, **kwargs)
+    # cache misses from concurrent requests are coalesced into shared API calls
+    return default_cache().get_many(
+        list_of_text, key,
+        fetch=lambda texts: default_dispatcher().embed(
+            texts, key, lambda batch: _create_embeddings(batch, model=model, **kwargs)),
+    )
 
 
 # @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
@@ -61,187 +114,55 @@ def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
-def plot_multiclass_precision_recall(
-    y_score, y_true_untransformed, class_list, classifier_name
-):
-    """
-    Precision-Recall plotting for a multiclass problem. It plots average precision-recall, per class precision recall and reference f1 contours.
+SERVING_MODULES = ["embedding_utils", "embeds", "verify", "recommend", "index"]
 
-    Code slightly modified, but heavily based on https://scikit-learn.org/stable/auto_examples/model_selection/plot_precision_recall.html
-    """
-    n_classes = len(class_list)
-    y_true = pd.concat(
-        [(y_true_untransformed == class_list[i]) for i in range(n_classes)], axis=1
-    ).values
-
-    # For each class
-    precision = dict()
-    recall = dict()
-    average_precision = dict()
-    for i in range(n_classes):
-        precision[i], recall[i], _ = precision_recall_curve(y_true[:, i], y_score[:, i])
-        average_precision[i] = average_precision_score(y_true[:, i], y_score[:, i])
-
-    # A "micro-average": quantifying score on all classes jointly
-    precision_micro, recall_micro, _ = precision_recall_curve(
-        y_true.ravel(), y_score.ravel()
-    )
-    average_precision_micro = average_precision_score(y_true, y_score, average="micro")
-    print(
-        str(classifier_name)
-        + " - Average precision score over all classes: {0:0.2f}".format(
-            average_precision_micro
-        )
-    )
-
-    # setup plot details
-    plt.figure(figsize=(9, 10))
-    f_scores = np.linspace(0.2, 0.8, num=4)
-    lines = []
-    labels = []
-    for f_score in f_scores:
-        x = np.linspace(0.01, 1)
-        y = f_score * x / (2 * x - f_score)
-        (l,) = plt.plot(x[y >= 0], y[y >= 0], color="gray", alpha=0.2)
-        plt.annotate("f1={0:0.1f}".format(f_score), xy=(0.9, y[45] + 0.02))
-
-    lines.append(l)
-    labels.append("iso-f1 curves")
-    (l,) = plt.plot(recall_micro, precision_micro, color="gold", lw=2)
-    lines.append(l)
-    labels.append(
-        "average Precision-recall (auprc = {0:0.2f})" "".format(average_precision_micro)
-    )
 
-    for i in range(n_classes):
-        (l,) = plt.plot(recall[i], precision[i], lw=2)
-        lines.append(l)
-        labels.append(
-            "Precision-recall for class `{0}` (auprc = {1:0.2f})"
-            "".format(class_list[i], average_precision[i])
-        )
-
-    fig = plt.gcf()
-    fig.subplots_adjust(bottom=0.25)
-    plt.xlim([0.0, 1.0])
-    plt.ylim([0.0, 1.05])
-    plt.xlabel("Recall")
-    plt.ylabel("Precision")
-    plt.title(f"{classifier_name}: Precision-Recall curve for each class")
-    plt.legend(lines, labels)
-
-
-def distances_from_embeddings(
-    query_embedding: List[float],
-    embeddings: List[List[float]],
-    distance_metric="cosine",
-) -> List[List]:
-    """Return the distances between a query embedding and a list of embeddings."""
-    distance_metrics = {
-        "cosine": spatial.distance.cosine,
-        "L1": spatial.distance.cityblock,
-        "L2": spatial.distance.euclidean,
-        "Linf": spatial.distance.chebyshev,
-    }
-    distances = [
-        distance_metrics[distance_metric](query_embedding, embedding)
-        for embedding in embeddings
-    ]
-    return distances
-
-
-def indices_of_nearest_neighbors_from_distances(distances) -> np.ndarray:
-    """Return a list of indices of nearest neighbors from a list of distances."""
-    return np.argsort(distances)
-
-
-def pca_components_from_embeddings(
-    embeddings: List[List[float]], n_components=2
-) -> np.ndarray:
-    """Return the PCA components of a list of embeddings."""
-    pca = PCA(n_components=n_components)
-    array_of_embeddings = np.array(embeddings)
-    return pca.fit_transform(array_of_embeddings)
-
-
-def tsne_components_from_embeddings(
-    embeddings: List[List[float]], n_components=2, **kwargs
-) -> np.ndarray:
-    """Returns t-SNE components of a list of embeddings."""
-    # use better defaults if not specified
-    if "init" not in kwargs.keys():
-        kwargs["init"] = "pca"
-    if "learning_rate" not in kwargs.keys():
-        kwargs["learning_rate"] = "auto"
-    tsne = TSNE(n_components=n_components, **kwargs)
-    array_of_embeddings = np.array(embeddings)
-    return tsne.fit_transform(array_of_embeddings)
-
-
-def chart_from_components(
-    components: np.ndarray,
-    labels: Optional[List[str]] = None,
-    strings: Optional[List[str]] = None,
-    x_title="Component 0",
-    y_title="Component 1",
-    mark_size=5,
-    **kwargs,
-):
-    """Return an interactive 2D chart of embedding components."""
-    empty_list = ["" for _ in components]
-    data = pd.DataFrame(
-        {
-            x_title: components[:, 0],
-            y_title: components[:, 1],
-            "label": labels if labels else empty_list,
-            "string": ["<br>".join(tr.wrap(string, width=30)) for string in strings]
-            if strings
-            else empty_list,
-        }
-    )
-    chart = px.scatter(
-        data,
-        x=x_title,
-        y=y_title,
-        color="label" if labels else None,
-        symbol="label" if labels else None,
-        hover_data=["string"] if strings else None,
-        **kwargs,
-    ).update_traces(marker=dict(size=mark_size))
-    return chart
-
-
-def chart_from_components_3D(
-    components: np.ndarray,
-    labels: Optional[List[str]] = None,
-    strings: Optional[List[str]] = None,
-    x_title: str = "Component 0",
-    y_title: str = "Component 1",
-    z_title: str = "Compontent 2",
-    mark_size: int = 5,
-    **kwargs,
-):
-    """Return an interactive 3D chart of embedding components."""
-    empty_list = ["" for _ in components]
-    data = pd.DataFrame(
-        {
-            x_title: components[:, 0],
-            y_title: components[:, 1],
-            z_title: components[:, 2],
-            "label": labels if labels else empty_list,
-            "string": ["<br>".join(tr.wrap(string, width=30)) for string in strings]
-            if strings
-            else empty_list,
-        }
+def import_report(module):
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+    Returns (total_us, [(name, self_us, cumulative_us), ...]) sorted by self time.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
     )
-    chart = px.scatter_3d(
-        data,
-        x=x_title,
-        y=y_title,
-        z=z_title,
-        color="label" if labels else None,
-        symbol="label" if labels else None,
-        hover_data=["string"] if strings else None,
-        **kwargs,
-    ).update_traces(marker=dict(size=mark_size))
-    return chart
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows, total = [], 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cum_us)))
+        if name.strip() == module:
+            total = int(cum_us)
+    return total, sorted(rows, key=lambda r: -r[1])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embedding helpers: import-time report for the serving path")
+    ap.add_argument("--import-report", nargs="*", metavar="MODULE",
+                    help=f"modules to measure (default: {' '.join(SERVING_MODULES)})")
+    ap.add_argument("--top", type=int, default=10, help="slowest dependencies to list per module")
+    ap.add_argument("--budget-ms", type=float, default=None,
+                    help="exit non-zero if any module's cold import exceeds this")
+    args = ap.parse_args()
+    if args.import_report is None:
+        ap.print_help()
+        sys.exit(0)
+
+    over = False
+    for mod in args.import_report or SERVING_MODULES:
+        try:
+            total, rows = import_report(mod)
+        except RuntimeError as e:
+            print(f"{mod}: import failed ({e})")
+            over = True
+            continue
+        flag = ""
+        if args.budget_ms is not None and total / 1000 > args.budget_ms:
+            flag, over = "  OVER BUDGET", True
+        print(f"{mod}: {total / 1000:.1f} ms cumulative{flag}")
+        for name, self_us, cum_us in rows[:args.top]:
+            print(f"    {self_us / 1000:8.1f} ms self {cum_us / 1000:8.1f} ms cum  {name}")
+    sys.exit(1 if over else 0)
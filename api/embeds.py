@@ -1,16 +1,40 @@
 # api/embeds.py
 from pathlib import Path
 import os
+import threading
+import tempfile
+import time
 import pandas as pd
 import numpy as np
 
+import ann
+import embed_store
+import metrics
+import quant
+
 # --- module globals ---
-_EMB_DF = None     # pandas DataFrame with ["Name","embedding"]
-_MAT = None        # normalized embedding matrix (N, D)
+_NAMES = None      # embed_store.NameTable: row j's name is _NAMES[j] (row j <-> _MAT[j])
+_MAT = None        # normalized embedding matrix (N, D); quant.CompactMatrix in compact modes
 _DIM = 0
+_INDEX = None      # ann.ExactIndex / ann.IVFIndex over _MAT (ann.RerankIndex when compact)
 _PATH = None
 
+# (names, mat, dim, index) published as one tuple so readers always see a consistent
+# set; the legacy globals above are kept in sync for callers that read them directly
+_SNAP = None
+_LOCK = threading.Lock()
+_RELOADING = False
+_STATS = {}        # load_s, matrix_bytes, process_peak_rss_mb, mtime, loaded_at, last_error
+_LAST_CHECK = 0.0
+_STAMP = None      # _source_stamp() of what the snapshot was built from
+
 PARQUET_BASENAME = "ADInt_CUI_embeddings.parquet"
+# seconds between mtime checks from the request path; 0 disables the watcher
+RELOAD_CHECK_S = float(os.getenv("EMBEDDINGS_RELOAD_CHECK_S", "30"))
+# float32 | float16 | int8 for the resident matrix (see quant.py)
+STORAGE = os.getenv("EMBEDDINGS_STORAGE", "float32")
+# compact modes re-score this many first-pass candidates at full precision
+RERANK_SHORTLIST = int(os.getenv("EMBEDDINGS_RERANK", "32"))
 
 def _candidate_paths():
     envp = os.getenv("EMBEDDINGS_PATH")
@@ -23,77 +47,246 @@ def _candidate_paths():
 
 def _default_path():
     for p in _candidate_paths():
-        if p.exists():
+        if p.exists() or os.path.exists(embed_store.store_path(p)):
             return str(p)
     return str(Path(__file__).with_name(PARQUET_BASENAME))
 
+def _process_peak_rss_mb():
+    """The whole process's peak RSS so far, not what one load cost."""
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # KiB on Linux
+    except Exception:
+        return None
+
+def _read_matrix(path):
+    """Return (names, mat) with mat a single float32 (N, D) allocation."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        pq = None
+
+    if pq is not None:
+        tbl = pq.read_table(path, columns=["Name", "embedding"])
+        col = tbl.column("embedding").combine_chunks()
+        n = len(col)
+        # flatten() skips null rows and reshape() would shear ragged ones; both must fail the load
+        if col.null_count:
+            raise ValueError(f"{path}: {col.null_count} rows have no embedding")
+        if n:
+            import pyarrow.compute as pc
+            lens = pc.list_value_length(col)
+            lo, hi = pc.min(lens).as_py(), pc.max(lens).as_py()
+            if lo != hi:
+                raise ValueError(f"{path}: embeddings have {lo} to {hi} dimensions")
+        # list<float> -> flat values buffer -> (N, D) without per-row Python objects
+        flat = col.flatten().to_numpy(zero_copy_only=False)
+        mat = flat.astype(np.float32, copy=False).reshape(n, -1) if n else np.empty((0, 0), np.float32)
+        names = tbl.column("Name").to_pandas()
+        return names, mat
+
+    df = pd.read_parquet(path, columns=["Name", "embedding"])
+    vals = df["embedding"].values
+    n = len(vals)
+    dim = int(np.asarray(vals[0]).size) if n else 0
+    mat = np.empty((n, dim), dtype=np.float32)
+    for i, v in enumerate(vals):
+        mat[i] = np.asarray(v, dtype=np.float32).reshape(-1)
+    return df["Name"], mat
+
+def _full_precision(mat, path, mtime):
+    """
+    Keep the float32 rows on disk next to the parquet (or EMBEDDINGS_CACHE_DIR)
+    and memory-map them, so compact modes can re-rank without holding them resident.
+    """
+    name = os.path.basename(path) + ".f32.npy"
+    fp = os.path.join(os.getenv("EMBEDDINGS_CACHE_DIR") or os.path.dirname(path), name)
+    try:
+        if os.path.exists(fp) and os.path.getmtime(fp) >= mtime:
+            full = np.load(fp, mmap_mode="r")
+            if full.shape == mat.shape:
+                return full, fp
+        np.save(fp, mat)
+    except OSError:  # read-only data dir
+        fp = os.path.join(tempfile.gettempdir(), name)
+        np.save(fp, mat)
+    return np.load(fp, mmap_mode="r"), fp
+
+def _normalize(mat):
+    """Unit-norm rows (zero rows stay zero), in place when `mat` allows it."""
+    if not mat.flags.writeable or not mat.flags.c_contiguous:
+        mat = np.ascontiguousarray(mat, dtype=np.float32).copy()
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    mat /= norms  # in place: no second (N, D) copy
+    return mat
+
+def _source_stamp(path):
+    """What the reload check compares: the parquet mtime and the embed_store files."""
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    return mtime, embed_store.stamp(embed_store.store_path(path))
+
+def _build(path):
+    t0 = time.perf_counter()
+    stamp = _source_stamp(path)
+    store_path = embed_store.usable(path)
+    if store_path:
+        # memory-mapped, already normalized: nothing to parse or copy
+        store = embed_store.open_store(store_path)
+        names, mat, mtime = store["names"], store["matrix"], store["source_mtime"]
+        base_rows, segments = store["base_rows"], len(store["segments"])
+    else:
+        names, mat = _read_matrix(path)
+        names = embed_store.NameTable.from_strings(names.tolist())
+        mat = _normalize(mat)
+        mtime = os.path.getmtime(path)
+        base_rows, segments = None, None
+    full_path = None
+    if STORAGE != "float32":
+        if store_path:
+            full, full_path = mat, store_path  # the store already holds the float32 rows on disk
+        else:
+            full, full_path = _full_precision(mat, path, mtime)
+        mat = quant.quantize(np.asarray(mat), STORAGE)  # the resident float32 copy is dropped here
+        index = ann.RerankIndex(ann.open_index(mat, path, mtime, base_rows), full, RERANK_SHORTLIST)
+    else:
+        index = ann.open_index(mat, path, mtime, base_rows)
+    stats = {
+        "load_s": round(time.perf_counter() - t0, 3),
+        "source": "store" if store_path else "parquet",
+        "store_path": store_path,
+        "store_segments": segments,
+        "storage": quant.storage_mode(mat),
+        "matrix_bytes": int(mat.nbytes),
+        "names_bytes": names.nbytes,
+        "full_precision_path": full_path,
+        "process_peak_rss_mb": _process_peak_rss_mb(),
+        "mtime": mtime,
+        "loaded_at": time.time(),
+        "last_error": None,
+        "index": index.status(),
+    }
+    return (names, mat, int(mat.shape[1]) if len(mat.shape) == 2 else 0, index), stamp, stats
+
+def _publish(snap, path, stamp, stats):
+    global _SNAP, _NAMES, _MAT, _DIM, _INDEX, _PATH, _STAMP, _STATS
+    with _LOCK:
+        _SNAP = snap
+        _NAMES, _MAT, _DIM, _INDEX = snap
+        _PATH = path
+        _STAMP = stamp
+        _STATS = stats
+
 def load():
-    """Load parquet once; return True if loaded; False if not available/corrupt."""
-    global _EMB_DF, _MAT, _DIM, _PATH
-    if _MAT is not None:
+    """Load the embeddings once (store or parquet); True if loaded, False if not available/corrupt."""
+    global _PATH
+    if _SNAP is not None:
         return True
     _PATH = _default_path()
-    if not os.path.exists(_PATH):
+    if not os.path.exists(_PATH) and not embed_store.usable(_PATH):
         return False
     try:
-        df = pd.read_parquet(_PATH, columns=["Name", "embedding"])
-        embs = []
-        for v in df["embedding"].values:
-            arr = np.asarray(v, dtype=np.float32)
-            if arr.ndim != 1:
-                arr = arr.reshape(-1)
-            embs.append(arr)
-        embs = np.vstack(embs)  # (N, D)
-        norms = np.linalg.norm(embs, axis=1, keepdims=True)
-        norms[norms == 0] = 1.0
-        _EMB_DF = df.reset_index(drop=True)
-        _MAT = embs / norms
-        _DIM = int(_MAT.shape[1])
+        snap, stamp, stats = _build(_PATH)
+        _publish(snap, _PATH, stamp, stats)
         return True
-    except Exception:
-        _EMB_DF = None
-        _MAT = None
-        _DIM = 0
+    except Exception as e:
+        _STATS["last_error"] = str(e)
         return False
 
+def reload(path=None, background=True):
+    """
+    Build a fresh matrix (optionally in a thread) and swap it in atomically.
+    In-flight resolve_entities calls keep the snapshot they started with.
+    Returns False if a reload is already running.
+    """
+    global _RELOADING
+    with _LOCK:
+        if _RELOADING:
+            return False
+        _RELOADING = True
+    path = path or _default_path()
+
+    def _run():
+        global _RELOADING
+        try:
+            snap, stamp, stats = _build(path)
+            _publish(snap, path, stamp, stats)
+        except Exception as e:
+            _STATS["last_error"] = str(e)  # keep serving the old snapshot
+        finally:
+            _RELOADING = False
+
+    if background:
+        threading.Thread(target=_run, name="embeds-reload", daemon=True).start()
+    else:
+        _run()
+    return True
+
+def maybe_reload():
+    """Cheap, rate-limited mtime check (parquet and store); kicks a background reload on change."""
+    global _LAST_CHECK
+    if RELOAD_CHECK_S <= 0 or _SNAP is None:
+        return
+    now = time.monotonic()
+    if now - _LAST_CHECK < RELOAD_CHECK_S:
+        return
+    _LAST_CHECK = now
+    try:
+        if _source_stamp(_PATH) != _STAMP:
+            reload(_PATH)
+    except OSError:
+        pass
+
 def is_loaded():
-    return _MAT is not None
+    return _SNAP is not None
 
 def status():
+    snap = _SNAP
     return {
-        "loaded": bool(is_loaded()),
+        "loaded": snap is not None,
         "path": _PATH or _default_path(),
-        "rows": int(_EMB_DF.shape[0]) if is_loaded() else 0,
-        "dim": int(_DIM) if is_loaded() else 0,
+        "rows": len(snap[0]) if snap else 0,
+        "dim": int(snap[2]) if snap else 0,
+        "reloading": _RELOADING,
+        **_STATS,
     }
 
-def resolve_entities(names, embed_fn=None, model=None, threshold=None):
+def resolve_entities(names, embed_fn=None, model=None, threshold=None, k=1, nprobe=None):
     """
     Resolve free-text names to the closest KG name using cosine similarity
-    against precomputed embeddings.
+    against precomputed embeddings (through the snapshot's ANN index).
 
-    Returns: list of dicts like {"best_name": str|None, "score": float}
+    Returns: list of dicts like {"best_name": str|None, "score": float};
+    with k > 1 each dict also has "candidates": [{"name", "score"}, ...].
+    `nprobe` tunes recall vs latency for an IVF index (ignored by exact).
     """
     if not names:
         return []
     if not is_loaded() and not load():
         # parquet not available -> return null matches
         return [{"best_name": None, "score": 0.0} for _ in names]
+    maybe_reload()
+    names_tbl, _, _, index = _SNAP  # one snapshot for the whole call, even if a reload swaps mid-way
 
     # Lazy import to avoid hard OpenAI dependency at module import
     if embed_fn is None:
         from embedding_utils import get_embeddings as embed_fn
 
-    vecs = np.asarray(embed_fn(names, model=model), dtype=np.float32)
+    with metrics.timer("embeds_resolve_seconds", stage="embed"):
+        vecs = np.asarray(embed_fn(names, model=model), dtype=np.float32)
     vecs /= (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-9)
 
-    sims = vecs @ _MAT.T  # (k, N)
+    with metrics.timer("embeds_resolve_seconds", stage="search"):
+        ids, scores = index.search(vecs, k=max(1, int(k)), nprobe=nprobe)
     thr = float(os.getenv("ENTITY_SIM_THRESHOLD", threshold or "0.80"))
 
     out = []
-    for i in range(sims.shape[0]):
-        j = int(np.argmax(sims[i]))
-        score = float(sims[i, j])
-        best = _EMB_DF["Name"].iloc[j] if score >= thr else None
-        out.append({"best_name": best, "score": score})
+    for i in range(ids.shape[0]):
+        j, score = int(ids[i, 0]), float(scores[i, 0])
+        best = names_tbl[j] if j >= 0 and score >= thr else None
+        res = {"best_name": best, "score": score if j >= 0 else 0.0}
+        if k > 1:
+            res["candidates"] = [{"name": names_tbl[int(c)], "score": float(v)}
+                                 for c, v in zip(ids[i], scores[i]) if c >= 0]
+        out.append(res)
     return out
@@ -0,0 +1,103 @@
+# api/evidence.py
+"""
+Paged PubMed evidence for one (head, relation, tail).
+
+/api/verify returns only a count per triple plus an opaque cursor; the UI
+fetches each verified edge's first page from here once the graph is drawn:
+
+    GET  /api/evidence?cursor=<token>&limit=50
+    POST /api/evidence {"head": ..., "relation": ..., "tail": ..., "limit": 50}
+
+    -> {"papers": ["12345", ...], "next": <token> | null}
+
+Pages are ordered by (PubMed_ID as string, relationship id) and continue
+after the last row of the previous page (keyset pagination), so paging is
+stable even while edges are added, and only limit + 1 ids leave the database
+per page. A cursor is base64url JSON: the pair's node ids (or name keys
+without a lexicon), the relation type, and the position after which the next
+page starts.
+"""
+import base64
+import json
+import os
+import traceback
+
+from flask import Blueprint, request, jsonify
+
+from kg_index import normalize_name
+import graph
+import lexicon
+
+evidence_bp = Blueprint("evidence_bp", __name__)
+
+PAGE_DEFAULT = int(os.getenv("EVIDENCE_PAGE_SIZE", "50"))
+PAGE_MAX = int(os.getenv("EVIDENCE_PAGE_MAX", "200"))
+
+
+def encode_cursor(anchor, rel, after=("", -1)):
+    """anchor: {"hids", "tids"} or {"hkey", "tkey"}; rel: canonical relation type."""
+    body = {**anchor, "rel": rel, "after": list(after)}
+    raw = json.dumps(body, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Raises ValueError for anything that is not a cursor we issued."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        body = json.loads(raw)
+        after = body["after"]
+        if not (isinstance(body["rel"], str) and len(after) == 2):
+            raise ValueError
+        if "hids" in body:
+            anchor = {"hids": [int(i) for i in body["hids"]], "tids": [int(i) for i in body["tids"]]}
+        else:
+            anchor = {"hkey": str(body["hkey"]), "tkey": str(body["tkey"])}
+        return anchor, body["rel"], (str(after[0]), int(after[1]))
+    except Exception:
+        raise ValueError("invalid evidence cursor")
+
+
+def page(anchor, rel, after=("", -1), limit=PAGE_DEFAULT):
+    """One page of PubMed ids -> (papers, next cursor or None)."""
+    rows = graph.call("evidence", anchor, rel, after, limit + 1)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    nxt = encode_cursor(anchor, rel, (rows[-1]["pmid"], rows[-1]["rid"])) if more else None
+    return [r["pmid"] for r in rows if r["pmid"]], nxt
+
+
+def _anchor_for(head, tail):
+    if lexicon.is_loaded():
+        h, t = lexicon.resolve_many([head, tail])
+        if h["ids"] and t["ids"]:
+            return {"hids": h["ids"], "tids": t["ids"]}
+    # no lexicon, or a name it cannot place (a node added since it was built): ask by name_key
+    return {"hkey": normalize_name(head), "tkey": normalize_name(tail)}
+
+
+@evidence_bp.route("/api/evidence", methods=["GET", "POST"])
+def evidence():
+    data = request.get_json(silent=True) or {}
+    args = {**request.args.to_dict(), **data}
+    try:
+        limit = max(1, min(int(args.get("limit", PAGE_DEFAULT)), PAGE_MAX))
+        if args.get("cursor"):
+            anchor, rel, after = decode_cursor(str(args["cursor"]))
+        else:
+            head, tail = (args.get("head") or "").strip(), (args.get("tail") or "").strip()
+            if not (head and tail and args.get("relation")):
+                return jsonify({"error": "cursor, or head + relation + tail, is required"}), 400
+            from verify import normalize_relation
+            anchor, rel, after = _anchor_for(head, tail), normalize_relation(args["relation"]), ("", -1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        papers, nxt = page(anchor, rel, after, limit)
+    except graph.GraphUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"papers": papers, "next": nxt})
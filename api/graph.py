@@ -0,0 +1,248 @@
+# api/graph.py
+"""
+Shared KG access for all blueprints: one driver (one connection pool) per
+worker process, managed read transactions, and pool statistics.
+
+    rows = graph.call("probe", key=key)                # one kg_backend.GraphTx method
+    out  = graph.read(lambda tx: my_work(tx, args))   # several reads, one tx
+    out  = graph.read_within(2.0, my_work, args)       # server-side timeout
+
+`tx` is a kg_backend.GraphTx: the blueprints ask for rows by method, never
+by query text.
+
+Managed transactions are retried by the driver on transient errors (leader
+switch, deadlock, dropped connection) for up to NEO4J_TX_RETRY_S seconds, so
+those no longer surface as HTTP 500s. Transaction times also go to
+metrics.py, labelled by the unit of work (or the Q_* constant for query()).
+Pool settings come from the environment:
+
+    NEO4J_MAX_POOL_SIZE          (default 50)
+    NEO4J_ACQUIRE_TIMEOUT_S      (default 30)
+    NEO4J_MAX_CONN_LIFETIME_S    (default 3600)
+    NEO4J_CONNECT_TIMEOUT_S      (default 15)
+    NEO4J_TX_RETRY_S             (default 15)
+
+kg_version() stamps the graph being served; result_cache.py keys on it so
+a changed or swapped graph never serves cached answers from the old one.
+
+GRAPH_BACKEND picks the implementation: "neo4j" (neo4j_graph.py, Cypher) or
+"csr", the embedded read-only backend in csr_graph.py (KG loaded from
+GRAPH_CSR_PATH into NumPy arrays). The same read()/call() work against either.
+"""
+from collections import deque
+import os
+import sys
+import threading
+import time
+
+from neo4j import GraphDatabase, unit_of_work
+from neo4j.exceptions import ServiceUnavailable as GraphUnavailable  # noqa: F401  (re-exported)
+
+from kg_backend import GraphTx
+from neo4j_graph import Neo4jTx
+import metrics
+
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "knowpass123")
+
+MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+ACQUIRE_TIMEOUT_S = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT_S", "30"))
+MAX_CONN_LIFETIME_S = float(os.getenv("NEO4J_MAX_CONN_LIFETIME_S", "3600"))
+CONNECT_TIMEOUT_S = float(os.getenv("NEO4J_CONNECT_TIMEOUT_S", "15"))
+TX_RETRY_S = float(os.getenv("NEO4J_TX_RETRY_S", "15"))
+# "neo4j" (default) or "csr" (csr_graph.py)
+BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")
+# a fixed KG version (e.g. set by the ingest job) instead of polling node/edge counts
+KG_VERSION = os.getenv("KG_VERSION", "")
+KG_VERSION_CHECK_S = float(os.getenv("KG_VERSION_CHECK_S", "30"))
+
+_DRIVER = None
+_LOCK = threading.Lock()
+
+_STATS_LOCK = threading.Lock()
+_IN_FLIGHT = 0
+_PEAK_IN_FLIGHT = 0
+_COUNTS = {"transactions": 0, "retries": 0, "failures": 0, "timeouts": 0}
+_WAITS_MS = deque(maxlen=1000)  # call -> first attempt started (pool acquisition + BEGIN)
+_TX_MS = deque(maxlen=1000)
+
+_GENERATION = 0      # bumped whenever the driver is swapped or reset
+_STAMP = None        # last stamp read from the graph (see kg_version)
+_STAMP_AT = 0.0
+_STAMP_LOCK = threading.Lock()
+
+
+def get_driver():
+    global _DRIVER
+    if _DRIVER is None:
+        with _LOCK:
+            if _DRIVER is None and BACKEND == "csr":
+                import csr_graph
+                _DRIVER = csr_graph.open_driver()
+            elif _DRIVER is None:
+                _DRIVER = GraphDatabase.driver(
+                    NEO4J_URI,
+                    auth=(NEO4J_USER, NEO4J_PASSWORD),
+                    max_connection_pool_size=MAX_POOL_SIZE,
+                    connection_acquisition_timeout=ACQUIRE_TIMEOUT_S,
+                    max_connection_lifetime=MAX_CONN_LIFETIME_S,
+                    connection_timeout=CONNECT_TIMEOUT_S,
+                    max_transaction_retry_time=TX_RETRY_S,
+                )
+    return _DRIVER
+
+
+def set_driver(driver):
+    """Swap in another driver (benchmarks use an in-memory stand-in)."""
+    global _DRIVER
+    with _LOCK:
+        _DRIVER = driver
+    bump_version()
+
+
+def reset_driver():
+    """
+    Close and drop a Neo4j driver so the next get_driver() opens a fresh pool.
+    The gunicorn master calls this before forking: sockets must not be shared
+    between workers. The in-process CSR graph is kept (workers share its pages).
+    """
+    global _DRIVER
+    with _LOCK:
+        if BACKEND == "csr":
+            return
+        drv, _DRIVER = _DRIVER, None
+    if drv is not None:
+        drv.close()
+    bump_version()
+
+
+def bump_version():
+    """Treat the KG as changed now (driver swap, reload, or after an ingest in this process)."""
+    global _GENERATION, _STAMP_AT
+    with _STAMP_LOCK:
+        _GENERATION += 1
+        _STAMP_AT = 0.0
+
+
+def _read_stamp():
+    return KG_VERSION or call("stamp")
+
+
+def kg_version():
+    """
+    Version stamp of the graph being served: (driver generation, stamp). The
+    stamp is KG_VERSION or the backend's (the CSR build, Neo4j's node and
+    relationship counts), re-read at most every KG_VERSION_CHECK_S by one thread at a time.
+    When it cannot be read, the previous stamp stays in force.
+    """
+    global _STAMP, _STAMP_AT
+    now = time.monotonic()
+    if now - _STAMP_AT >= KG_VERSION_CHECK_S and _STAMP_LOCK.acquire(blocking=_STAMP is None):
+        try:
+            if now - _STAMP_AT >= KG_VERSION_CHECK_S:
+                _STAMP_AT = now
+                try:
+                    _STAMP = _read_stamp()
+                except Exception as e:
+                    print(f"[graph] could not read the KG version: {e}")
+        finally:
+            _STAMP_LOCK.release()
+    return _GENERATION, _STAMP
+
+
+def read(work, *args, **kwargs):
+    """Run `work(tx, *args, **kwargs)` in a managed read transaction and return its result."""
+    return _read(work, None, args, kwargs, _work_label(work))
+
+
+def read_within(timeout_s, work, *args, **kwargs):
+    """
+    Like read(), but the server aborts the transaction after `timeout_s`
+    seconds; check the raised error with is_timeout(). Timeouts are not retried.
+    """
+    return _read(work, timeout_s, args, kwargs, _work_label(work))
+
+
+def _work_label(work):
+    return f"{getattr(work, '__module__', '')}.{getattr(work, '__name__', 'work')}"
+
+
+def is_timeout(e):
+    return "TransactionTimedOut" in (getattr(e, "code", None) or "")
+
+
+def _read(work, timeout_s, args, kwargs, label):
+    global _IN_FLIGHT, _PEAK_IN_FLIGHT
+    t0 = time.perf_counter()
+    attempts = [0]
+
+    def _work(tx):
+        if attempts[0] == 0:
+            _WAITS_MS.append((time.perf_counter() - t0) * 1000.0)
+        attempts[0] += 1
+        # the CSR driver hands out its own GraphTx; a Neo4j transaction gets the Cypher one
+        return work(tx if isinstance(tx, GraphTx) else Neo4jTx(tx), *args, **kwargs)
+
+    if timeout_s is not None:
+        _work = unit_of_work(timeout=timeout_s)(_work)
+
+    with _STATS_LOCK:
+        _IN_FLIGHT += 1
+        _PEAK_IN_FLIGHT = max(_PEAK_IN_FLIGHT, _IN_FLIGHT)
+    ok = False
+    try:
+        with get_driver().session() as session:
+            out = session.execute_read(_work)
+        ok = True
+        return out
+    finally:
+        with _STATS_LOCK:
+            _IN_FLIGHT -= 1
+            _COUNTS["transactions"] += 1
+            _COUNTS["retries"] += max(0, attempts[0] - 1)
+            if not ok:
+                _COUNTS["failures"] += 1
+                if is_timeout(sys.exc_info()[1]):
+                    _COUNTS["timeouts"] += 1
+        elapsed = time.perf_counter() - t0
+        _TX_MS.append(elapsed * 1000.0)
+        metrics.observe("neo4j_transaction_seconds", elapsed, work=label, ok=str(ok).lower())
+
+
+def call(method, *args, **kwargs):
+    """One GraphTx method in its own read transaction, e.g. call("evidence", anchor, rel, after, limit)."""
+    return _read(lambda tx: getattr(tx, method)(*args, **kwargs), None, (), {}, f"GraphTx.{method}")
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(p * len(v)))], 2)
+
+
+def stats():
+    with _STATS_LOCK:
+        s = dict(_COUNTS)
+        in_flight, peak = _IN_FLIGHT, _PEAK_IN_FLIGHT
+    waits, txs = list(_WAITS_MS), list(_TX_MS)
+    out = {
+        "backend": BACKEND,
+        "uri": NEO4J_URI,
+        "pool": {
+            "max_size": MAX_POOL_SIZE,
+            "in_use": in_flight,
+            "peak_in_use": peak,
+            "utilization": round(in_flight / MAX_POOL_SIZE, 3) if MAX_POOL_SIZE else 0.0,
+            "acquire_timeout_s": ACQUIRE_TIMEOUT_S,
+            "max_conn_lifetime_s": MAX_CONN_LIFETIME_S,
+        },
+        "wait_ms": {"p50": _pct(waits, 0.5), "p95": _pct(waits, 0.95), "max": round(max(waits), 2) if waits else 0.0},
+        "tx_ms": {"p50": _pct(txs, 0.5), "p95": _pct(txs, 0.95)},
+        **s,
+    }
+    if BACKEND == "csr":
+        import csr_graph
+        out["csr"] = csr_graph.status()
+    return out
@@ -0,0 +1,58 @@
+# api/gunicorn.conf.py
+"""
+gunicorn -c api/gunicorn.conf.py wsgi:app
+
+The app (embeddings, ANN index, lexicon, neighbour table, CSR graph) loads
+once in the master and the workers share it copy-on-write; see wsgi.py. Each
+worker logs its boot time and memory, and reports them under "process" in
+/api/_health and as process_* in /api/_metrics.
+
+With preload a HUP restarts the workers but does not reload the app: restart
+the master (or POST /api/_embeddings/reload from localhost or with
+X-Admin-Token, which gives that one worker a private copy) to pick up a new
+parquet.
+
+    PORT                (default 5000)
+    GUNICORN_WORKERS    (default 2 x CPUs + 1)
+    GUNICORN_THREADS    (default 4; a streaming /api/chat holds a thread)
+    GUNICORN_TIMEOUT    (default 120 s)
+    GUNICORN_PRELOAD    (default 1; 0 loads everything in every worker)
+"""
+import gc
+import multiprocessing
+import os
+import time
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+if preload_app:
+    # an mtime-triggered reload would give every worker its own private matrix
+    os.environ.setdefault("EMBEDDINGS_RELOAD_CHECK_S", "0")
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import graph
+    # the Neo4j pool's sockets must not be shared across fork(); workers reconnect lazily
+    graph.reset_driver()
+    # keep the collector from writing to the preloaded objects' headers (and so copying their pages)
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    worker.forked_at = time.time()
+
+
+def post_worker_init(worker):
+    import metrics
+    metrics.set_boot(time.time() - worker.forked_at, worker.cfg.preload_app)
+    p = metrics.process_stats()
+    worker.log.info("worker %s booted in %.2f s: rss %s MB, pss %s MB, private %s MB",
+                    p["pid"], p["boot_s"], p.get("rss_mb"), p.get("pss_mb"), p.get("private_mb"))
@@ -0,0 +1,51 @@
+# api/health.py
+"""
+GET /api/_health: one JSON snapshot of every subsystem's status (embeddings,
+Neo4j pool, name_key index, lexicon, neighbour table, caches, batchers,
+OpenAI admission, process). Each module reports through its own
+status()/stats(); this blueprint only gathers them, so the request
+blueprints do not import modules they never call.
+"""
+import os
+
+from flask import Blueprint, jsonify
+
+from embeds import status as embeds_status
+from kg_index import index_status
+import admission
+import chat
+import conversations
+import embed_batcher
+import embed_cache
+import graph
+import lexicon
+import metrics
+import neighbors
+import relations
+import result_cache
+
+health_bp = Blueprint("health_bp", __name__)
+
+
+@health_bp.route("/api/_health", methods=["GET"])
+def _health():
+    emb = embeds_status()
+    return jsonify({
+        "embeddings": emb,
+        "neo4j_uri": graph.NEO4J_URI,
+        "neo4j": graph.stats(),
+        "name_index": index_status(),
+        "lexicon": lexicon.status(),
+        "neighbors": neighbors.status(),
+        "embedding_cache": embed_cache.stats(),
+        "embedding_batcher": embed_batcher.stats(),
+        "conversations": conversations.stats(),
+        "relations": relations.stats(),
+        "result_cache": result_cache.stats(),
+        "chat_clients": chat.stats(),
+        "openai_admission": admission.stats(),
+        "process": metrics.process_stats(),
+        "model": relations.MODEL,
+        "entity_threshold": os.getenv("ENTITY_SIM_THRESHOLD", "0.80"),
+        "loaded": bool(emb.get("loaded")),
+    })
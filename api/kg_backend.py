@@ -0,0 +1,77 @@
+# api/kg_backend.py
+"""
+What the blueprints ask of the KG, independent of where it lives.
+
+graph.read(work) hands `work` a GraphTx: one read transaction on the
+configured backend (GRAPH_BACKEND). neo4j_graph.Neo4jTx answers each method
+with Cypher, csr_graph.CSRTx with NumPy over the in-memory CSR arrays; both
+return the same rows in the same order (benchmarks/csr_parity.py checks).
+A new kind of read is a new method here, implemented by both.
+
+Pair items (verify, evidence) are anchored on node ids, {"hids", "tids"}, or
+on name keys, {"hkey", "tkey"}; a batch may mix both. Recommend items carry
+"head_ids" (None for a name_key anchor) and "head_key".
+"""
+from abc import ABC, abstractmethod
+
+
+def by_anchor(items):
+    """Split pair items into (id-anchored, name_key-anchored)."""
+    ids = [it for it in items if "hids" in it]
+    return ids, [it for it in items if "hids" not in it]
+
+
+class GraphTx(ABC):
+    """One read transaction. Rows are plain dicts."""
+
+    @abstractmethod
+    def direct_pair(self, hkey, tkey):
+        """[{"reltype", "evidence"}]: relationships between two name keys, per type."""
+
+    @abstractmethod
+    def bridge_pair(self, hkey, tkey, expand, hub_degree):
+        """Best 2-hop bridge name between two name keys, or None (see neo4j_graph.py for the scoring)."""
+
+    @abstractmethod
+    def direct(self, items):
+        """{idx: [{"reltype", "evidence"}]} for pair items; pairs with no relationship are absent."""
+
+    @abstractmethod
+    def bridges(self, items, expand, hub_degree):
+        """{idx: bridge name} for pair items; pairs with no bridge are absent."""
+
+    @abstractmethod
+    def evidence(self, anchor, rel, after, limit):
+        """[{"pmid", "rid"}] of the pair's `rel` relationships after (pmid, rid), in that order."""
+
+    @abstractmethod
+    def recommend(self, head_ids, head_key, whitelist, exclude, limit):
+        """Neighbour rows of one head (see recommend.py for fields and order)."""
+
+    @abstractmethod
+    def recommend_batch(self, items):
+        """{idx: rows} for recommend items, each with its own filters and limit."""
+
+    @abstractmethod
+    def probe(self, ids=None, key=None):
+        """Up to 5 [{"labels", "Name", "CUI", "id"}] by node ids, else by name key."""
+
+    @abstractmethod
+    def lexicon(self):
+        """Every node as {"id", "name", "aliases"} (an iterable; may stream)."""
+
+    @abstractmethod
+    def nodes(self):
+        """Every node as {"id", "name", "key", "degree"}."""
+
+    @abstractmethod
+    def top(self, ids, top):
+        """[{"hid", "rtype", "top": [[tail id, evidence], ...]}], the neighbour table's entries."""
+
+    @abstractmethod
+    def index_status(self, name):
+        """{"state", "populationPercent"} of the name_key index, or None if it is missing."""
+
+    @abstractmethod
+    def stamp(self):
+        """A string that changes whenever the graph does (graph.kg_version)."""
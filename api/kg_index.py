@@ -0,0 +1,101 @@
+# api/kg_index.py
+"""
+Canonical, index-backed node name keys for the Neo4j KG.
+
+Every node gets `name_key = toLower(trim(coalesce(Name, name, name_lc)))` and a
+range index on (:Node).name_key, so lookups become index seeks instead of a
+label scan with toLower() on each node. Queries pass `normalize_name(text)`.
+
+Maintenance:
+    python api/kg_index.py migrate      # backfill/refresh keys + create index
+    python api/kg_index.py status       # index state and nodes missing a key
+"""
+import argparse
+import json
+
+import graph
+
+NAME_KEY_PROP = "name_key"
+INDEX_NAME = "node_name_key"
+
+# keep the Cypher expression and normalize_name() in lock-step
+_KEY_EXPR = "toLower(trim(coalesce(n.Name, n.name, n.name_lc, '')))"
+
+Q_CREATE_INDEX = f"CREATE INDEX {INDEX_NAME} IF NOT EXISTS FOR (n:Node) ON (n.{NAME_KEY_PROP})"
+
+Q_BACKFILL = f"""
+MATCH (n:Node)
+WHERE n.{NAME_KEY_PROP} IS NULL OR n.{NAME_KEY_PROP} <> {_KEY_EXPR}
+WITH n LIMIT $batch
+SET n.{NAME_KEY_PROP} = {_KEY_EXPR}
+RETURN count(n) AS updated
+"""
+
+Q_MISSING = f"MATCH (n:Node) WHERE n.{NAME_KEY_PROP} IS NULL RETURN count(n) AS missing"
+
+_STATUS = {"name": INDEX_NAME, "exists": None, "state": "unchecked"}
+
+
+def normalize_name(name: str) -> str:
+    """Python side of the name_key expression."""
+    return (name or "").strip().lower()
+
+
+def ensure_index(driver):
+    with driver.session() as s:
+        s.run(Q_CREATE_INDEX).consume()
+
+
+def migrate(driver, batch_size=10_000, log=print):
+    """Backfill name_key in batches (idempotent) and create the index."""
+    ensure_index(driver)
+    total = 0
+    with driver.session() as s:
+        while True:
+            rec = s.run(Q_BACKFILL, batch=int(batch_size)).single()
+            n = int(rec["updated"]) if rec else 0
+            if n == 0:
+                break
+            total += n
+            log(f"name_key: updated {total} nodes")
+    return total
+
+
+def check_index():
+    """Look the index up once (at startup) and cache the result for /api/_health."""
+    global _STATUS
+    try:
+        rec = graph.call("index_status", INDEX_NAME)
+        if rec is None:
+            _STATUS = {"name": INDEX_NAME, "exists": False, "state": "missing"}
+        else:
+            _STATUS = {
+                "name": INDEX_NAME, "exists": True, "state": rec["state"],
+                "population": rec["populationPercent"],
+            }
+    except Exception as e:
+        _STATUS = {"name": INDEX_NAME, "exists": None, "state": "unknown", "error": str(e)}
+    return _STATUS
+
+
+def index_status():
+    return dict(_STATUS)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Maintain the name_key index on the KG")
+    ap.add_argument("command", choices=["migrate", "status"])
+    ap.add_argument("--batch-size", type=int, default=10_000)
+    args = ap.parse_args()
+
+    drv = graph.get_driver()
+    try:
+        if args.command == "migrate":
+            n = migrate(drv, batch_size=args.batch_size)
+            print(f"done: {n} nodes updated")
+        st = check_index()
+        with drv.session() as s:
+            st["nodes_missing_key"] = s.run(Q_MISSING).single()["missing"]
+        print(json.dumps(st, indent=2))
+    finally:
+        drv.close()
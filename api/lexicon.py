@@ -0,0 +1,163 @@
+# api/lexicon.py
+"""
+In-process entity lexicon: normalized name / alias -> Neo4j node ids.
+
+Built once at startup from the KG so that verify and recommend can anchor
+queries on node ids instead of resolving names in the database. Lookups are a
+dict hit on the same normalized key the name_key index uses. Only when there
+is no exact or alias hit do we fall back to embeds.resolve_entities and map
+its best KG name back through the lexicon.
+"""
+import os
+import sys
+import threading
+import time
+
+from kg_index import normalize_name
+import graph
+import metrics
+
+# one snapshot dict, replaced wholesale on refresh so readers never see a half-built map
+_LEX = None
+_LOCK = threading.Lock()
+
+EMBED_FALLBACK = os.getenv("LEXICON_EMBED_FALLBACK", "1") == "1"
+
+def _add(m, key, nid):
+    # values stay plain ints for the common unique-name case; tuples only on collisions
+    cur = m.get(key)
+    if cur is None:
+        m[key] = nid
+    elif isinstance(cur, tuple):
+        if nid not in cur:
+            m[key] = cur + (nid,)
+    elif cur != nid:
+        m[key] = (cur, nid)
+
+
+def _ids(v):
+    if v is None:
+        return []
+    return list(v) if isinstance(v, tuple) else [v]
+
+
+def _collect(tx):
+    # stream records instead of materializing the whole node list
+    names, aliases, alias_names = {}, {}, {}
+    for rec in tx.lexicon():
+        nid, name = int(rec["id"]), rec["name"] or ""
+        key = normalize_name(name)
+        if key:
+            _add(names, key, nid)
+        al = rec["aliases"]
+        if isinstance(al, str):
+            al = [al]
+        for a in al or []:
+            akey = normalize_name(str(a))
+            if akey and akey != key:
+                _add(aliases, akey, nid)
+                alias_names[nid] = name
+    return names, aliases, alias_names
+
+
+def build():
+    """(Re)build from the KG and swap it in. Returns status() or raises."""
+    global _LEX
+    with _LOCK:
+        t0 = time.perf_counter()
+        names, aliases, alias_names = graph.read(_collect)
+        _LEX = {
+            "names": names,
+            "aliases": aliases,
+            "alias_names": alias_names,  # canonical display name for alias targets only
+            "built_at": time.time(),
+            "build_s": round(time.perf_counter() - t0, 3),
+        }
+    return status()
+
+
+def try_build():
+    """Startup helper: never raises, the blueprints fall back to name_key queries."""
+    try:
+        return build()
+    except Exception as e:
+        print(f"[lexicon] build failed, using name_key lookups: {e}")
+        return status()
+
+
+def is_loaded():
+    return _LEX is not None
+
+
+def _deep_size(m):
+    total = sys.getsizeof(m)
+    for k, v in m.items():
+        total += sys.getsizeof(k) + sys.getsizeof(v)
+        if isinstance(v, tuple):
+            total += sum(sys.getsizeof(x) for x in v)
+    return total
+
+
+def status():
+    lex = _LEX
+    if lex is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "names": len(lex["names"]),
+        "aliases": len(lex["aliases"]),
+        "built_at": lex["built_at"],
+        "build_s": lex["build_s"],
+        "bytes": _deep_size(lex["names"]) + _deep_size(lex["aliases"]) + _deep_size(lex["alias_names"]),
+    }
+
+
+def lookup(name):
+    """Exact, then alias. Returns {"ids", "name", "via", "score"}; ids == [] on a miss."""
+    lex, key = _LEX, normalize_name(name)
+    if lex is None or not key:
+        return {"ids": [], "name": name, "via": None, "score": 0.0}
+    ids = _ids(lex["names"].get(key))
+    if ids:
+        return {"ids": ids, "name": name, "via": "exact", "score": 1.0}
+    ids = _ids(lex["aliases"].get(key))
+    if ids:
+        return {"ids": ids, "name": lex["alias_names"].get(ids[0], name), "via": "alias", "score": 1.0}
+    return {"ids": [], "name": name, "via": None, "score": 0.0}
+
+
+def _embed_fallback(names):
+    from embeds import resolve_entities
+    try:
+        return resolve_entities(names)
+    except Exception as e:  # no OpenAI key / network: treat as a miss
+        print(f"[lexicon] embedding fallback failed: {e}")
+        return [{"best_name": None, "score": 0.0} for _ in names]
+
+
+def resolve_many(names, embed_fallback=None):
+    """Resolve names in order; misses go to embeddings in one batched call."""
+    out = [lookup(n) for n in names]
+    if embed_fallback is None:
+        embed_fallback = EMBED_FALLBACK
+    miss = [i for i, r in enumerate(out) if not r["ids"]]
+    if not (embed_fallback and miss and is_loaded()):
+        _count(out)
+        return out
+    for i, m in zip(miss, _embed_fallback([names[i] for i in miss])):
+        if m.get("best_name"):
+            hit = lookup(m["best_name"])
+            if hit["ids"]:
+                out[i] = {"ids": hit["ids"], "name": m["best_name"], "via": "embedding",
+                          "score": float(m.get("score") or 0.0)}
+    _count(out)
+    return out
+
+
+def _count(hits):
+    for h in hits:
+        metrics.inc("lexicon_lookups_total", via=h["via"] or "miss")
+
+
+def resolve(name, embed_fallback=None):
+    return resolve_many([name], embed_fallback=embed_fallback)[0]
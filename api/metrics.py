@@ -0,0 +1,377 @@
+# api/metrics.py
+"""
+In-process metrics and an opt-in request profiler.
+
+    metrics.inc("verify_branch_total", branch="direct")
+    metrics.observe("openai_request_seconds", 0.12, op="embeddings")
+    with metrics.timer("embeds_resolve_seconds"):
+        ...
+
+GET /api/_metrics renders everything in the Prometheus text format: the
+counters and histograms recorded here, plus gauges read from the existing
+stats()/status() of graph, embed_cache, embed_batcher, embeds, lexicon,
+neighbors and conversations at scrape time. Each gunicorn worker keeps its
+own numbers; the scraper sees one worker per scrape.
+
+instrument(app) times every request by route template (not raw path). For
+/api/chat that ends when the streamed response starts; the model's first
+token and the whole stream are openai_request_seconds{op="chat_first_token"}
+and {op="chat_stream"}.
+
+Profiling is off unless PROFILE_SAMPLE_RATE > 0 (or POST /api/_profile
+{"rate": 0.01}): that fraction of requests runs under cProfile and is written
+to PROFILE_DIR as <time ns>-<route>.prof (open with `python -m pstats` or
+snakeviz). Only the newest PROFILE_MAX_FILES are kept. Off, it costs one
+float comparison per request.
+
+admin_only guards the ops POSTs (here and in verify.py): with ADMIN_TOKEN set
+the request must send it as X-Admin-Token; without it, only direct loopback
+requests (no X-Forwarded-For) are allowed.
+
+    METRICS_ENABLED       (default 1)
+    PROFILE_SAMPLE_RATE   (default 0)
+    PROFILE_DIR           (default <tmp>/knownet-profiles)
+    PROFILE_MAX_FILES     (default 200)
+    ADMIN_TOKEN           (default unset: loopback only)
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import hmac
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from flask import Blueprint, Response, g, jsonify, request
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROFILE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "knownet-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# seconds; wide enough for a 30 s chat stream, fine enough for 1 ms Cypher
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "http_request_seconds": "Flask request latency by route (streams: until the response starts)",
+    "http_requests_total": "Requests by route, method and status",
+    "neo4j_transaction_seconds": "Read transaction duration by unit of work, retries included",
+    "openai_request_seconds": "OpenAI call duration (embeddings batches, chat first token / full stream)",
+    "openai_admission_total": "OpenAI calls by class (chat, embed) and outcome: admitted, delayed, rejected (429 to the caller), throttled (429 from OpenAI), retried",
+    "openai_admission_wait_seconds": "Time an admitted OpenAI call waited for its key's budget",
+    "embeds_resolve_seconds": "embeds.resolve_entities time by stage: embed (cache/OpenAI) and search (ANN)",
+    "verify_branch_total": "Verified triples by outcome: direct, 2-hop, unsure, timeout, invalid",
+    "recommend_source_total": "Recommend heads answered from the neighbour table or a live query",
+    "lexicon_lookups_total": "Entity name lookups by match type (exact, alias, embedding, miss)",
+    "relation_lookups_total": "Relation strings normalized by source: REL_MAP rule, label table (exact/memo/embedding), or miss",
+    "result_cache_lookups_total": "Verify pair and recommend lookups: hit, miss (queried) or coalesced (waited for another request)",
+    "profiles_written_total": "Request profiles written to PROFILE_DIR",
+    "process_rss_bytes": "Resident memory of this worker, shared pages included",
+    "process_pss_bytes": "Proportional set size: shared pages divided among the processes mapping them",
+    "process_private_bytes": "Pages only this worker maps (copied or allocated after fork)",
+    "process_boot_seconds": "Worker start: fork (or process start) until ready to serve",
+}
+
+_LOCK = threading.Lock()
+_COUNTERS = {}     # (name, labels) -> value
+_HISTOGRAMS = {}   # (name, labels) -> [bucket counts..., +Inf count, sum]
+_BOOT = {"boot_s": None, "preloaded": False}  # set by gunicorn.conf.py in each worker
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, n=1, **labels):
+    if not ENABLED:
+        return
+    k = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[k] = _COUNTERS.get(k, 0) + n
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    k = _key(name, labels)
+    i = bisect_left(BUCKETS, seconds)
+    with _LOCK:
+        h = _HISTOGRAMS.get(k)
+        if h is None:
+            h = _HISTOGRAMS[k] = [0] * (len(BUCKETS) + 2)
+        h[i] += 1
+        h[-1] += seconds
+
+
+@contextmanager
+def timer(name, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+
+def set_boot(seconds, preloaded):
+    _BOOT.update(boot_s=round(seconds, 3), preloaded=bool(preloaded))
+
+
+def process_stats(pid="self"):
+    """
+    Memory of one process from /proc/<pid>/smaps_rollup (Linux), in MB. With a
+    preloaded gunicorn master the workers' rss includes the shared embedding
+    pages; pss splits them between the workers, so sum(pss) is the real total.
+    Elsewhere only peak rss is available.
+    """
+    out = {"pid": os.getpid() if pid == "self" else int(pid), **_BOOT}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            kb = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    kb[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        try:
+            import resource
+            out["rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+        except ImportError:
+            pass
+        return out
+    mb = lambda *keys: round(sum(kb.get(k, 0) for k in keys) / 1024.0, 1)
+    out.update(rss_mb=mb("Rss"), pss_mb=mb("Pss"), shared_mb=mb("Shared_Clean", "Shared_Dirty"),
+               private_mb=mb("Private_Clean", "Private_Dirty"))
+    return out
+
+
+# --- Prometheus text format -------------------------------------------------
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(int(v))
+
+
+def _gauges():
+    """(name, kind, labels, value) read from the modules' own stats at scrape time."""
+    import admission
+    import conversations
+    import embed_batcher
+    import embed_cache
+    import embeds
+    import graph
+    import lexicon
+    import neighbors
+    import relations
+    import result_cache
+
+    out = []
+
+    def add(name, value, kind="gauge"):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            out.append((name + "_total" if kind == "counter" else name, kind, (), value))
+
+    s = graph.stats()
+    add("neo4j_pool_in_use", s["pool"]["in_use"])
+    add("neo4j_pool_peak_in_use", s["pool"]["peak_in_use"])
+    add("neo4j_pool_max_size", s["pool"]["max_size"])
+    for k in ("transactions", "retries", "failures", "timeouts"):
+        add(f"neo4j_{k}", s[k], "counter")
+
+    c = embed_cache.stats()
+    for k in ("mem_hits", "disk_hits", "misses", "deduped", "fetch_calls"):
+        add(f"embed_cache_{k}", c.get(k), "counter")
+    add("embed_cache_mem_items", c.get("mem_items"))
+    add("embed_cache_hit_rate", c.get("hit_rate"))
+    b = embed_batcher.stats()
+    for k in ("requests", "batches", "inputs", "rejected"):
+        add(f"embed_batcher_{k}", b.get(k), "counter")
+    for k in ("queued_inputs", "avg_batch_inputs", "max_wait_ms"):
+        add(f"embed_batcher_{k}", b.get(k))
+
+    e = embeds.status()
+    for k in ("loaded", "rows", "dim", "load_s", "matrix_bytes", "process_peak_rss_mb", "loaded_at", "reloading"):
+        add(f"embeds_{k}", e.get(k))
+
+    p = process_stats()
+    for k in ("rss", "pss", "private"):
+        if p.get(f"{k}_mb") is not None:
+            add(f"process_{k}_bytes", int(p[f"{k}_mb"] * 1024 * 1024))
+    add("process_boot_seconds", p.get("boot_s"))
+
+    r = relations.stats()
+    add("relations_loaded", r["loaded"])
+    for k in ("exact_hits", "memo_hits", "embedded", "embed_calls", "embed_hits", "embed_misses", "errors"):
+        add(f"relations_{k}", r[k], "counter")
+    add("relations_memo_items", r["memo_items"])
+
+    for name, rc in result_cache.stats().items():
+        for k in ("items", "bytes", "in_flight", "hit_rate"):
+            add(f"result_cache_{name}_{k}", rc[k])
+        for k in ("evicted", "expired", "invalidations"):
+            add(f"result_cache_{name}_{k}", rc[k], "counter")
+
+    a = admission.stats()
+    for k in ("keys", "cooling_down", "open_chats"):
+        add(f"openai_admission_{k}", a[k])
+    for cls, n in a["waiting"].items():
+        add(f"openai_admission_{cls}_waiting", n)
+
+    add("lexicon_loaded", lexicon.is_loaded())
+    add("neighbors_loaded", neighbors.status().get("loaded"))
+    add("neighbors_stale", neighbors.is_stale())
+    conv = conversations.stats()
+    for k in ("conversations", "items"):
+        add(f"conversations_{k}", conv[k])
+    for k in ("created", "merged", "evicted", "resets"):
+        add(f"conversations_{k}", conv[k], "counter")
+    return out
+
+
+def render():
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        hists = {k: list(v) for k, v in _HISTOGRAMS.items()}
+    lines, typed = [], set()
+
+    def head(name, kind):
+        if name not in typed:
+            typed.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), v in sorted(counters.items()):
+        head(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {_num(v)}")
+    for (name, labels), h in sorted(hists.items()):
+        head(name, "histogram")
+        cum = 0
+        for le, n in zip(BUCKETS + ("+Inf",), h[:-1]):
+            cum += n
+            lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cum}")
+        lines.append(f"{name}_sum{_labels(labels)} {h[-1]!r}")
+        lines.append(f"{name}_count{_labels(labels)} {cum}")
+    for name, kind, labels, v in _gauges():
+        head(name, kind)
+        lines.append(f"{name}{_labels(labels)} {_num(v)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- request hooks ----------------------------------------------------------
+def _profile_path(route):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    return os.path.join(PROFILE_DIR, f"{time.time_ns()}-{slug}.prof")
+
+
+def _prune_profiles():
+    """Delete the oldest .prof files past PROFILE_MAX_FILES (names start with the time)."""
+    try:
+        files = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".prof"))
+    except OSError:
+        return
+    for f in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, f))
+        except OSError:
+            pass  # another worker got there first
+
+
+def _before():
+    g._t0 = time.perf_counter()
+    if PROFILE_RATE > 0 and random.random() < PROFILE_RATE:
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+            g._prof = prof
+        except ValueError:  # another profiler is active in this thread
+            pass
+
+
+def _after(resp):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    t0 = g.pop("_t0", None)
+    if t0 is not None:
+        observe("http_request_seconds", time.perf_counter() - t0, route=route, method=request.method)
+        inc("http_requests_total", route=route, method=request.method, status=resp.status_code)
+    return resp
+
+
+def _teardown(exc):
+    # runs even when the view raised and after_request was skipped, so the
+    # profiler never stays enabled on this thread
+    prof = g.pop("_prof", None)
+    if prof is None:
+        return
+    prof.disable()
+    try:
+        prof.dump_stats(_profile_path(request.url_rule.rule if request.url_rule else "unmatched"))
+        inc("profiles_written_total")
+        _prune_profiles()
+    except OSError as e:
+        print(f"[metrics] could not write profile: {e}")
+
+
+def instrument(app):
+    """Time every request of `app`; no-op with METRICS_ENABLED=0."""
+    if ENABLED:
+        app.before_request(_before)
+        app.after_request(_after)
+        app.teardown_request(_teardown)
+
+
+def admin_only(view):
+    """Ops endpoint: X-Admin-Token must match ADMIN_TOKEN, or (unset) a direct loopback request."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if ADMIN_TOKEN:
+            ok = hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode())
+        else:
+            ok = (request.remote_addr in ("127.0.0.1", "::1")
+                  and "X-Forwarded-For" not in request.headers)
+        if not ok:
+            return jsonify({"error": "admin endpoint: send X-Admin-Token (or call from localhost)"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@metrics_bp.route("/api/_metrics", methods=["GET"])
+def _metrics():
+    return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@metrics_bp.route("/api/_profile", methods=["GET", "POST"])
+def _profile():
+    """Read (open) or set (admin_only) the sampling rate for this worker: {"rate": 0.0 .. 1.0}."""
+    if request.method == "POST":
+        return _set_profile_rate()
+    return jsonify({"rate": PROFILE_RATE, "dir": PROFILE_DIR, "enabled": ENABLED})
+
+
+@admin_only
+def _set_profile_rate():
+    global PROFILE_RATE
+    data = request.get_json(silent=True) or {}
+    try:
+        rate = float(data.get("rate", 0))
+    except (TypeError, ValueError):
+        rate = -1.0
+    if not 0.0 <= rate <= 1.0:
+        return jsonify({"error": "rate must be a number between 0 and 1"}), 400
+    PROFILE_RATE = rate
+    return jsonify({"rate": PROFILE_RATE, "dir": PROFILE_DIR, "enabled": ENABLED})
@@ -0,0 +1,317 @@
+# api/neighbors.py
+"""
+Precomputed top-neighbour table for /api/recommend.
+
+For every node and relation type the build keeps the NEIGHBORS_TOP_N tails
+with the most evidence (parallel edges), ordered the way the live recommend
+query orders them. recommend() then filters a short, presorted slice instead
+of expanding every relationship of a hub node in Neo4j.
+
+The table is one compressed .npz next to this file (NEIGHBORS_PATH):
+
+    node_ids   (N,)    Neo4j ids, sorted
+    degree     (N,)    relationship count at build time (change detection)
+    names      blob + offsets, display name per node
+    keys       blob + offsets, name_key per node; key_order sorts them
+    head_off   (N+1,)  entries of node i are [head_off[i], head_off[i+1])
+    ent_tail / ent_rel / ent_ev   tail index, relation code, evidence
+
+Staleness: the table records when it was built. Past NEIGHBORS_MAX_AGE_S,
+or for a head the table does not know, recommend falls back to the live
+query and says so in its meta. `update` re-reads node degrees and rebuilds
+only nodes whose degree changed (plus any named with --names); the server
+picks up the new file by mtime.
+
+    python api/neighbors.py build [--top 50]
+    python api/neighbors.py update [--names "Alzheimer's disease" ...]
+    python api/neighbors.py status
+"""
+from bisect import bisect_left
+from pathlib import Path
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from kg_index import normalize_name
+import blobs
+import graph
+
+TOP_N = int(os.getenv("NEIGHBORS_TOP_N", "50"))
+MAX_AGE_S = float(os.getenv("NEIGHBORS_MAX_AGE_S", str(7 * 86400)))
+RELOAD_CHECK_S = float(os.getenv("NEIGHBORS_RELOAD_CHECK_S", "30"))
+BUILD_BATCH = 500
+
+_DEFAULT_PATH = str(Path(__file__).with_name("neighbors.npz"))
+
+_TABLE = None      # dict of arrays + meta, replaced wholesale on load
+_PATH = None
+_LOCK = threading.Lock()
+_LAST_CHECK = 0.0
+
+
+def _path():
+    return os.getenv("NEIGHBORS_PATH", _DEFAULT_PATH)
+
+
+# --- build -----------------------------------------------------------------
+def _read_nodes(tx):
+    return [(int(r["id"]), r["name"] or "", r["key"] or "", int(r["degree"] or 0)) for r in tx.nodes()]
+
+
+def _read_top(tx, ids, top):
+    out = {}
+    for r in tx.top(ids, top):
+        out.setdefault(int(r["hid"]), []).append((r["rtype"], [(int(t), int(e)) for t, e in r["top"]]))
+    return out
+
+
+def _fetch_top(ids, top, log=print):
+    entries = {}
+    for i in range(0, len(ids), BUILD_BATCH):
+        entries.update(graph.read(_read_top, ids[i:i + BUILD_BATCH], top))
+        if log and len(ids) > BUILD_BATCH:
+            log(f"[neighbors] {min(i + BUILD_BATCH, len(ids))}/{len(ids)} heads")
+    return entries
+
+
+def _assemble(nodes, entries, top, built_at=None):
+    """nodes: [(id, name, key, degree)]; entries: id -> [(rtype, [(tail id, evidence)])]."""
+    nodes = sorted(nodes)
+    node_ids = np.array([n[0] for n in nodes], np.int64)
+    pos = {nid: i for i, nid in enumerate(node_ids.tolist())}
+    lower = [n[1].lower() for n in nodes]
+    rel_types = sorted({rt for groups in entries.values() for rt, _ in groups})
+    rel_code = {rt: i for i, rt in enumerate(rel_types)}
+
+    head_off = np.zeros(len(nodes) + 1, np.int64)
+    tails, rels, evs = [], [], []
+    for i, nid in enumerate(node_ids.tolist()):
+        rows = [(-ev, rel_code[rt], lower[pos[t]], t, pos[t], ev)
+                for rt, top_rows in entries.get(nid, ()) for t, ev in top_rows if t in pos]
+        rows.sort()  # live order: evidence desc, relation, tail name, id
+        for _, code, _, _, tidx, ev in rows:
+            tails.append(tidx)
+            rels.append(code)
+            evs.append(ev)
+        head_off[i + 1] = len(tails)
+
+    name_blob, name_off = blobs.pack([n[1] for n in nodes])
+    key_blob, key_off = blobs.pack([n[2] for n in nodes])
+    key_order = np.array(sorted(range(len(nodes)), key=lambda i: nodes[i][2]), np.int64)
+    meta = {"built_at": built_at or time.time(), "updated_at": time.time(), "top_n": top,
+            "rel_types": rel_types, "nodes": len(nodes), "entries": len(tails)}
+    return {
+        "node_ids": node_ids,
+        "degree": np.array([n[3] for n in nodes], np.int64),
+        "name_blob": name_blob, "name_off": name_off,
+        "key_blob": key_blob, "key_off": key_off, "key_order": key_order,
+        "head_off": head_off,
+        "ent_tail": np.array(tails, np.int32),
+        "ent_rel": np.array(rels, np.uint16),
+        "ent_ev": np.array(evs, np.int32),
+        "meta": meta,
+    }
+
+
+def _save(table, path):
+    arrays = {k: v for k, v in table.items() if k != "meta"}
+    tmp = f"{path}.tmp.npz"
+    np.savez_compressed(tmp, meta=np.frombuffer(json.dumps(table["meta"]).encode(), np.uint8), **arrays)
+    os.replace(tmp, path)  # readers never see a half-written table
+
+
+def build(path=None, top=TOP_N, log=print):
+    path = path or _path()
+    t0 = time.perf_counter()
+    nodes = graph.read(_read_nodes)
+    entries = _fetch_top([n[0] for n in nodes], top, log)
+    table = _assemble(nodes, entries, top)
+    _save(table, path)
+    table["meta"]["build_s"] = round(time.perf_counter() - t0, 2)
+    return table["meta"]
+
+
+def _entries_of(table, i):
+    """Stored entries of node index i, back in the GraphTx.top() row shape."""
+    meta, a, b = table["meta"], table["head_off"][i], table["head_off"][i + 1]
+    groups = {}
+    for t, r, e in zip(table["ent_tail"][a:b].tolist(), table["ent_rel"][a:b].tolist(), table["ent_ev"][a:b].tolist()):
+        groups.setdefault(meta["rel_types"][r], []).append((int(table["node_ids"][t]), e))
+    return list(groups.items())
+
+
+def update(path=None, names=(), log=print):
+    """Rebuild only nodes whose degree changed, new nodes, and `names`; drop deleted nodes."""
+    path = path or _path()
+    old = _load_file(path)
+    t0 = time.perf_counter()
+    nodes = graph.read(_read_nodes)
+    old_pos = {nid: i for i, nid in enumerate(old["node_ids"].tolist())}
+    forced = {normalize_name(n) for n in names}
+    changed = [nid for nid, _, key, deg in nodes
+               if nid not in old_pos or int(old["degree"][old_pos[nid]]) != deg or key in forced]
+    top = old["meta"]["top_n"]
+    entries = _fetch_top(changed, top, log)
+    changed_set = set(changed)
+    for nid, _, _, _ in nodes:
+        if nid not in changed_set:
+            entries[nid] = _entries_of(old, old_pos[nid])
+    table = _assemble(nodes, entries, top, built_at=old["meta"]["built_at"])
+    # a full rebuild resets the age; a partial one only moves updated_at
+    if len(changed) == len(nodes):
+        table["meta"]["built_at"] = table["meta"]["updated_at"]
+    _save(table, path)
+    return {**table["meta"], "rebuilt_heads": len(changed), "update_s": round(time.perf_counter() - t0, 2)}
+
+
+# --- serving -----------------------------------------------------------------
+def _load_file(path):
+    with np.load(path) as z:
+        table = {k: z[k] for k in z.files if k != "meta"}
+        table["meta"] = json.loads(bytes(z["meta"]).decode())
+    return table
+
+
+def load(path=None):
+    """Load the table if the file exists; returns True when one is in memory."""
+    global _TABLE, _PATH
+    path = path or _path()
+    with _LOCK:
+        _PATH = path
+        if not os.path.exists(path):
+            return _TABLE is not None
+        try:
+            table = _load_file(path)
+            table["mtime"] = os.path.getmtime(path)
+            _TABLE = table
+        except Exception as e:
+            print(f"[neighbors] could not load {path}: {e}")
+    return _TABLE is not None
+
+
+def maybe_reload():
+    """Rate-limited mtime check so `neighbors.py update` reaches running workers."""
+    global _LAST_CHECK
+    now = time.monotonic()
+    if RELOAD_CHECK_S <= 0 or now - _LAST_CHECK < RELOAD_CHECK_S:
+        return
+    _LAST_CHECK = now
+    path = _PATH or _path()
+    try:
+        if _TABLE is None or os.path.getmtime(path) != _TABLE.get("mtime"):
+            load(path)
+    except OSError:
+        pass
+
+
+def is_stale(table=None):
+    table = table if table is not None else _TABLE
+    return table is None or time.time() - table["meta"]["built_at"] > MAX_AGE_S
+
+
+def _index_of_key(table, key):
+    """Node indices whose name_key equals `key` (binary search over key_order)."""
+    order, blob, off = table["key_order"], table["key_blob"], table["key_off"]
+    at = lambda j: blobs.str_at(blob, off, int(order[j]))
+    j = bisect_left(range(len(order)), key, key=at)
+    out = []
+    while j < len(order) and at(j) == key:
+        out.append(int(order[j]))
+        j += 1
+    return out
+
+
+def lookup(head_ids, head_key, whitelist, exclude, limit):
+    """
+    Recommend rows (same fields as the live query) from the table, or None when
+    the table cannot answer exactly: not loaded, stale, unknown head, or a
+    request that could need more than the stored top-N of a relation type.
+    """
+    table = _TABLE
+    if table is None or is_stale(table):
+        return None
+    if limit + len(exclude) > table["meta"]["top_n"]:
+        return None
+    if head_ids is not None:
+        heads = np.searchsorted(table["node_ids"], head_ids)
+        heads = [int(i) for i, nid in zip(heads, head_ids)
+                 if i < len(table["node_ids"]) and table["node_ids"][i] == nid]
+        if len(heads) != len(head_ids):
+            return None
+    else:
+        heads = _index_of_key(table, head_key)
+        if not heads:
+            return None
+
+    rel_types = table["meta"]["rel_types"]
+    excl = {i for key in exclude for i in _index_of_key(table, key)}
+    allowed = None
+    if whitelist:
+        codes = [i for i, rt in enumerate(rel_types) if rt in set(whitelist)]
+        allowed = np.array(codes, np.uint16)
+
+    names = lambda i: blobs.str_at(table["name_blob"], table["name_off"], i)
+    rows = []
+    for h in heads:
+        a, b = table["head_off"][h], table["head_off"][h + 1]
+        tail, rel, ev = table["ent_tail"][a:b], table["ent_rel"][a:b], table["ent_ev"][a:b]
+        keep = np.ones(len(tail), bool) if allowed is None else np.isin(rel, allowed)
+        if excl:
+            keep &= ~np.isin(tail, np.fromiter(excl, np.int32))
+        hname, hid = names(h), int(table["node_ids"][h])
+        for j in np.flatnonzero(keep)[:limit]:
+            t = int(tail[j])
+            rows.append({"head_name": hname, "head_id": hid, "tail_name": names(t),
+                         "tail_id": int(table["node_ids"][t]), "relation": rel_types[rel[j]],
+                         "evidence": int(ev[j])})
+    if len(heads) > 1:
+        rows.sort(key=lambda r: (-r["evidence"], r["relation"], r["tail_name"].lower()))
+    return rows[:limit]
+
+
+def status():
+    table = _TABLE
+    if table is None:
+        return {"loaded": False, "path": _PATH or _path()}
+    meta = table["meta"]
+    return {
+        "loaded": True,
+        "path": _PATH or _path(),
+        "nodes": meta["nodes"],
+        "entries": meta["entries"],
+        "top_n": meta["top_n"],
+        "built_at": meta["built_at"],
+        "updated_at": meta.get("updated_at"),
+        "age_s": round(time.time() - meta["built_at"], 1),
+        "stale": is_stale(table),
+        "bytes": int(sum(v.nbytes for k, v in table.items() if isinstance(v, np.ndarray))),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or refresh the /api/recommend neighbour table.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--top", type=int, default=TOP_N)
+    u = sub.add_parser("update")
+    u.add_argument("--names", nargs="*", default=[])
+    sub.add_parser("status")
+    for p in (b, u):
+        p.add_argument("--path", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        print(json.dumps(build(args.path, args.top), indent=2))
+    elif args.cmd == "update":
+        print(json.dumps(update(args.path, args.names), indent=2))
+    else:
+        load()
+        print(json.dumps(status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# api/neo4j_graph.py
+"""
+The Neo4j backend: every KG read the blueprints make (kg_backend.GraphTx) as
+Cypher, run in the managed transaction graph.read() opened.
+
+All lookups go through the name_key index (kg_index.py) or id(n) when the
+lexicon resolved a name; relationships are undirected, typed by r.Type or
+type(r), and counted as evidence (one per paper).
+"""
+from kg_backend import GraphTx, by_anchor
+
+# --- verify ----------------------------------------------------------------
+# Fast path: exact match on the indexed, normalized name key (no embeddings)
+Q_DIRECT = """
+MATCH (h:Node {name_key: $hkey}),(t:Node {name_key: $tkey})
+MATCH (h)-[r]-(t)
+WITH toUpper(coalesce(r.Type, type(r))) AS reltype, count(r) AS evidence
+RETURN reltype, evidence
+"""
+
+# 2-hop bridge search with bounded work: expand from the lower-degree end,
+# skip intermediates above $hub_degree relationships, read at most $expand
+# distinct intermediates, then check each one against the other end.
+# Score = edges a-m + edges m-b; ties go to the smaller name.
+_BRIDGE_CALL = """\
+WITH __KEEP__, CASE WHEN COUNT { (h)--() } <= COUNT { (t)--() } THEN [h, t] ELSE [t, h] END AS ends
+WITH __KEEP__, ends[0] AS a, ends[1] AS b
+CALL {
+  WITH a, b
+  MATCH (a)--(m:Node)
+  WHERE m <> a AND m <> b AND COUNT { (m)--() } <= $hub_degree
+  WITH DISTINCT a, b, m LIMIT $expand
+  MATCH (m)-[r2]-(b)
+  WITH a, m, count(r2) AS c2
+  RETURN coalesce(m.Name, m.name, m.name_lc) AS bridge, c2 + COUNT { (a)--(m) } AS weight
+}
+"""
+
+Q_TWO = """
+MATCH (h:Node {name_key: $hkey}),(t:Node {name_key: $tkey})
+""" + _BRIDGE_CALL.replace("__KEEP__, ", "") + """RETURN bridge, weight
+ORDER BY weight DESC, bridge ASC
+LIMIT 1
+"""
+
+# Batched variants: one round-trip for every (head, tail) pair in the request.
+# Each item carries its position so rows can be mapped back to input order.
+# Items are anchored either on name keys or, when the lexicon resolved both
+# names, directly on node ids.
+_ANCHOR_KEYS = "MATCH (h:Node {name_key: item.hkey}),(t:Node {name_key: item.tkey})"
+_ANCHOR_IDS = "MATCH (h:Node) WHERE id(h) IN item.hids\nMATCH (t:Node) WHERE id(t) IN item.tids"
+
+_DIRECT_BATCH = """
+UNWIND $items AS item
+__ANCHOR__
+MATCH (h)-[r]-(t)
+WITH item.idx AS idx,
+     toUpper(coalesce(r.Type, type(r))) AS reltype,
+     count(r) AS evidence
+RETURN idx, reltype, evidence
+"""
+
+_TWO_BATCH = """
+UNWIND $items AS item
+__ANCHOR__
+""" + _BRIDGE_CALL.replace("__KEEP__", "item") + """WITH item.idx AS idx, bridge, weight
+ORDER BY idx, weight DESC, bridge ASC
+WITH idx, collect(bridge)[0] AS bridge
+RETURN idx, bridge
+"""
+
+Q_DIRECT_BATCH = _DIRECT_BATCH.replace("__ANCHOR__", _ANCHOR_KEYS)
+Q_TWO_BATCH = _TWO_BATCH.replace("__ANCHOR__", _ANCHOR_KEYS)
+Q_DIRECT_BATCH_IDS = _DIRECT_BATCH.replace("__ANCHOR__", _ANCHOR_IDS)
+Q_TWO_BATCH_IDS = _TWO_BATCH.replace("__ANCHOR__", _ANCHOR_IDS)
+
+_PROBE_RET = "RETURN labels(n) AS labels, coalesce(n.Name, n.name, n.name_lc) AS Name, n.CUI AS CUI, id(n) AS id LIMIT 5"
+Q_PROBE_IDS = "MATCH (n:Node) WHERE id(n) IN $ids " + _PROBE_RET
+Q_PROBE_KEY = "MATCH (n:Node {name_key: $key}) " + _PROBE_RET
+
+# --- evidence ----------------------------------------------------------------
+# keyset pagination on (PubMed_ID as string, relationship id)
+_EVIDENCE = """
+__ANCHOR__
+MATCH (h)-[r]-(t)
+WHERE toUpper(coalesce(r.Type, type(r))) = $rel
+WITH coalesce(toString(r.PubMed_ID), '') AS pmid, id(r) AS rid
+WHERE pmid > $after_pmid OR (pmid = $after_pmid AND rid > $after_rid)
+RETURN pmid, rid
+ORDER BY pmid, rid
+LIMIT $limit
+"""
+
+Q_EVIDENCE = _EVIDENCE.replace("__ANCHOR__", "MATCH (h:Node {name_key: $hkey}),(t:Node {name_key: $tkey})")
+Q_EVIDENCE_IDS = _EVIDENCE.replace("__ANCHOR__", "MATCH (h:Node) WHERE id(h) IN $hids\nMATCH (t:Node) WHERE id(t) IN $tids")
+
+# --- recommend ---------------------------------------------------------------
+# Head is an index seek on name_key (or an id match via the lexicon);
+# tolerant to either r.Type or type(r). neighbors.py mirrors this ordering.
+_RECOMMEND = """
+__HEAD__
+
+MATCH (h)-[r]-(t)
+WITH h, t, r,
+     toUpper(coalesce(r.Type, type(r))) AS rtype,
+     coalesce(t.name, t.Name, t.name_lc) AS tname,
+     coalesce(h.name, h.Name, h.name_lc) AS hname
+WHERE ($whitelist = [] OR rtype IN $whitelist)
+  AND NOT coalesce(t.name_key, toLower(tname)) IN $exclude
+
+WITH hname, id(h) AS head_id, tname, id(t) AS tail_id, rtype, count(r) AS evidence
+ORDER BY evidence DESC, rtype ASC, toLower(tname) ASC
+LIMIT $limit
+
+RETURN hname AS head_name, head_id,
+       tname AS tail_name, tail_id,
+       rtype AS relation, evidence
+"""
+
+Q_RECOMMEND = _RECOMMEND.replace("__HEAD__", "MATCH (h:Node {name_key: $head_key})")
+Q_RECOMMEND_IDS = _RECOMMEND.replace("__HEAD__", "MATCH (h:Node) WHERE id(h) IN $head_ids")
+
+# Batch form: one round-trip for many heads, each with its own filters and
+# limit. LIMIT cannot vary per row, so rows are collected per item and sliced.
+_RECOMMEND_BATCH = """
+UNWIND $items AS item
+__HEAD__
+
+MATCH (h)-[r]-(t)
+WITH item, h, t, r,
+     toUpper(coalesce(r.Type, type(r))) AS rtype,
+     coalesce(t.name, t.Name, t.name_lc) AS tname,
+     coalesce(h.name, h.Name, h.name_lc) AS hname
+WHERE (item.whitelist = [] OR rtype IN item.whitelist)
+  AND NOT coalesce(t.name_key, toLower(tname)) IN item.exclude
+
+WITH item.idx AS idx, item.limit AS lim,
+     hname, id(h) AS head_id, tname, id(t) AS tail_id, rtype, count(r) AS evidence
+ORDER BY idx, evidence DESC, rtype ASC, toLower(tname) ASC
+WITH idx, lim, collect({head_name: hname, head_id: head_id, tail_name: tname, tail_id: tail_id,
+                        relation: rtype, evidence: evidence}) AS rows
+RETURN idx, rows[0..lim] AS rows
+"""
+
+Q_RECOMMEND_BATCH = _RECOMMEND_BATCH.replace("__HEAD__", "MATCH (h:Node {name_key: item.head_key})")
+Q_RECOMMEND_BATCH_IDS = _RECOMMEND_BATCH.replace("__HEAD__", "MATCH (h:Node) WHERE id(h) IN item.head_ids")
+
+# --- lexicon and neighbour table ------------------------------------------------
+Q_LEXICON = """
+MATCH (n:Node)
+RETURN id(n) AS id,
+       coalesce(n.Name, n.name, n.name_lc) AS name,
+       coalesce(n.aliases, n.Aliases, n.synonyms, n.Synonyms, []) AS aliases
+"""
+
+Q_NODES = """
+MATCH (n:Node)
+RETURN id(n) AS id,
+       coalesce(n.name, n.Name, n.name_lc) AS name,
+       coalesce(n.name_key, toLower(trim(coalesce(n.Name, n.name, n.name_lc, '')))) AS key,
+       COUNT { (n)--() } AS degree
+"""
+
+# same grouping and tie order as Q_RECOMMEND, cut per relation type
+Q_TOP = """
+UNWIND $ids AS hid
+MATCH (h:Node) WHERE id(h) = hid
+MATCH (h)-[r]-(t)
+WITH hid, t, toUpper(coalesce(r.Type, type(r))) AS rtype, count(r) AS evidence
+WITH hid, rtype, id(t) AS tid, toLower(coalesce(t.name, t.Name, t.name_lc)) AS tkey, evidence
+ORDER BY hid, rtype, evidence DESC, tkey ASC, tid ASC
+WITH hid, rtype, collect([tid, evidence])[0..$top] AS top
+RETURN hid, rtype, top
+"""
+
+# --- housekeeping ------------------------------------------------------------
+Q_SHOW_INDEX = """
+SHOW INDEXES YIELD name, state, populationPercent, labelsOrTypes, properties
+WHERE name = $name
+RETURN name, state, populationPercent, labelsOrTypes, properties
+"""
+
+# count-store lookups: constant time in Neo4j, whatever the graph size
+Q_NODE_COUNT = "MATCH (n) RETURN count(n) AS n"
+Q_REL_COUNT = "MATCH ()-[r]->() RETURN count(r) AS n"
+
+# csr_graph.py export
+Q_EXPORT_NODES = """
+MATCH (n:Node)
+RETURN id(n) AS id,
+       coalesce(n.Name, n.name, n.name_lc) AS name,
+       coalesce(n.name_key, toLower(trim(coalesce(n.Name, n.name, n.name_lc, '')))) AS name_key,
+       coalesce(n.aliases, n.Aliases, n.synonyms, n.Synonyms, []) AS aliases,
+       n.CUI AS cui
+"""
+
+Q_EXPORT_EDGES = """
+MATCH (h:Node)-[r]->(t:Node)
+RETURN id(r) AS id, id(h) AS source, id(t) AS target,
+       toUpper(coalesce(r.Type, type(r))) AS type,
+       coalesce(toString(r.PubMed_ID), '') AS pmid
+"""
+
+
+class Neo4jTx(GraphTx):
+    """GraphTx over a managed Neo4j transaction (or anything with the same run())."""
+
+    def __init__(self, tx):
+        self.tx = tx
+
+    def direct_pair(self, hkey, tkey):
+        return self.tx.run(Q_DIRECT, hkey=hkey, tkey=tkey).data()
+
+    def bridge_pair(self, hkey, tkey, expand, hub_degree):
+        rec = self.tx.run(Q_TWO, hkey=hkey, tkey=tkey, expand=expand, hub_degree=hub_degree).single()
+        return rec["bridge"] if rec else None
+
+    def direct(self, items):
+        out = {}
+        # at most one query per anchor kind, in the same transaction
+        for q, group in zip((Q_DIRECT_BATCH_IDS, Q_DIRECT_BATCH), by_anchor(items)):
+            if group:
+                for row in self.tx.run(q, items=group).data():
+                    out.setdefault(row["idx"], []).append({"reltype": row["reltype"], "evidence": row["evidence"]})
+        return out
+
+    def bridges(self, items, expand, hub_degree):
+        out = {}
+        for q, group in zip((Q_TWO_BATCH_IDS, Q_TWO_BATCH), by_anchor(items)):
+            if group:
+                rows = self.tx.run(q, items=group, expand=expand, hub_degree=hub_degree).data()
+                out.update({row["idx"]: row["bridge"] for row in rows if row.get("bridge")})
+        return out
+
+    def evidence(self, anchor, rel, after, limit):
+        q = Q_EVIDENCE_IDS if "hids" in anchor else Q_EVIDENCE
+        return self.tx.run(q, **anchor, rel=rel, after_pmid=after[0], after_rid=after[1], limit=limit).data()
+
+    def recommend(self, head_ids, head_key, whitelist, exclude, limit):
+        q = Q_RECOMMEND_IDS if head_ids is not None else Q_RECOMMEND
+        return self.tx.run(q, head_ids=head_ids or [], head_key=head_key, whitelist=whitelist,
+                           exclude=exclude, limit=limit).data()
+
+    def recommend_batch(self, items):
+        out = {}
+        by_ids = [it for it in items if it["head_ids"] is not None]
+        by_key = [{k: v for k, v in it.items() if k != "head_ids"} for it in items if it["head_ids"] is None]
+        for q, group in ((Q_RECOMMEND_BATCH_IDS, by_ids), (Q_RECOMMEND_BATCH, by_key)):
+            if group:
+                out.update({rec["idx"]: rec["rows"] for rec in self.tx.run(q, items=group).data()})
+        return out
+
+    def probe(self, ids=None, key=None):
+        if ids:
+            return self.tx.run(Q_PROBE_IDS, ids=ids).data()
+        return self.tx.run(Q_PROBE_KEY, key=key).data()
+
+    def lexicon(self):
+        return self.tx.run(Q_LEXICON)
+
+    def nodes(self):
+        return self.tx.run(Q_NODES).data()
+
+    def top(self, ids, top):
+        return self.tx.run(Q_TOP, ids=ids, top=top).data()
+
+    def index_status(self, name):
+        return self.tx.run(Q_SHOW_INDEX, name=name).single()
+
+    def stamp(self):
+        counts = [self.tx.run(q).single()["n"] for q in (Q_NODE_COUNT, Q_REL_COUNT)]
+        return "counts:{}:{}".format(*counts)
+
+    # Neo4j only: the source of a CSR build
+    def export_nodes(self):
+        return self.tx.run(Q_EXPORT_NODES).data()
+
+    def export_edges(self):
+        return self.tx.run(Q_EXPORT_EDGES).data()
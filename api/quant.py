@@ -0,0 +1,69 @@
+# api/quant.py
+"""
+Compact storage for the normalized embedding matrix.
+
+  float32  the matrix as loaded (no wrapper)
+  float16  half the bytes; cosine error per score is below ~1e-3
+  int8     a quarter of the bytes; each row is scaled by max|x| / 127, score
+           error is typically below ~1e-2
+
+CompactMatrix behaves like the float32 matrix where ann.py touches it (shape,
+slicing, fancy indexing) and dequantizes only the rows asked for, so the same
+ExactIndex / IVFIndex code runs on it. Because first-pass scores are
+approximate, embeds wraps the index in ann.RerankIndex, which re-scores a
+shortlist against the full-precision rows (kept on disk and memory-mapped).
+"""
+import numpy as np
+
+MODES = ("float32", "float16", "int8")
+
+# dequantized blocks are float32 temporaries, so scan in smaller row blocks
+BLOCK_ROWS = 8192
+
+
+class CompactMatrix:
+    def __init__(self, data, scale, mode):
+        self.data = data      # (N, D) float16 or int8
+        self.scale = scale    # (N, 1) float32 for int8, else None
+        self.mode = mode
+        self.block_rows = BLOCK_ROWS
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return int(self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, idx):
+        rows = self.data[idx].astype(np.float32)
+        if self.scale is not None:
+            rows *= self.scale[idx]
+        return rows
+
+
+def quantize(mat, mode):
+    """Return `mat` itself for float32, else a CompactMatrix."""
+    if mode not in MODES:
+        raise ValueError(f"unknown storage mode {mode!r}; expected one of {MODES}")
+    if mode == "float32":
+        return mat
+    if mode == "float16":
+        return CompactMatrix(mat.astype(np.float16), None, mode)
+    data = np.empty(mat.shape, np.int8)
+    scale = np.empty((mat.shape[0], 1), np.float32)
+    for start in range(0, mat.shape[0], BLOCK_ROWS):
+        block = mat[start:start + BLOCK_ROWS]
+        s = np.abs(block).max(axis=1, keepdims=True) / 127.0
+        s[s == 0] = 1.0
+        scale[start:start + BLOCK_ROWS] = s
+        data[start:start + BLOCK_ROWS] = np.rint(block / s).astype(np.int8)
+    return CompactMatrix(data, scale, mode)
+
+
+def storage_mode(mat):
+    return getattr(mat, "mode", "float32")
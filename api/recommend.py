@@ -1,17 +1,19 @@
 # api/recommend.py
 from flask import Blueprint, request, jsonify
-from neo4j import GraphDatabase
 import os
 
 # keep health-only import; no hot-path embedding calls here
 from embeds import status as embeds_status
+from kg_index import normalize_name
+import graph
+import lexicon
+import metrics
+import neighbors
+import result_cache
 
 recommend_bp = Blueprint("recommend_bp", __name__)
 
-NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "knowpass123")
-_driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+MAX_HEADS = int(os.getenv("RECOMMEND_MAX_HEADS", "50"))
 
 
 def _node_name(n):
@@ -19,58 +21,37 @@ def _node_name(n):
     return n.get("name") or n.get("Name") or n.get("name_lc") or ""
 
 
-@recommend_bp.route("/api/recommend", methods=["POST"])
-def recommend():
-    data = request.get_json(force=True) or {}
-
-    head_raw = (data.get("head") or "").strip()
+def _spec(d):
+    """Request options for one head; raises ValueError on bad input."""
+    head_raw = (d.get("head") or "").strip()
     if not head_raw:
-        return jsonify({"error": "head (node name) is required"}), 400
-
-    # Use the raw head name directly (fast; no external embeddings)
-    head_resolved = head_raw
-    sim = 1.0  # trivial similarity since we didn't fuzzy-resolve
-
-    k = int(data.get("k", 5))
-    # direction is ignored because edges are undirected in this KG
-    whitelist = [w.upper() for w in (data.get("whitelist") or [])]
-    per_type_cap = int(data.get("per_type_cap", 2))  # kept for API compatibility
-    exclude = [str(x).strip().lower() for x in (data.get("exclude") or [])]
-
-    pool_limit = max(k * 6, 30)
-
-    # Tolerant to Name/name/name_lc and to either property r.Type or relationship type(r)
-    cypher = """
-    MATCH (h)
-    WHERE toLower(coalesce(h.name, h.Name, h.name_lc)) = toLower($head)
-
-    MATCH (h)-[r]-(t)
-    WITH h, t, r,
-         toUpper(coalesce(r.Type, type(r))) AS rtype,
-         coalesce(t.name, t.Name, t.name_lc) AS tname,
-         coalesce(h.name, h.Name, h.name_lc) AS hname
-    WHERE ($whitelist = [] OR rtype IN $whitelist)
-      AND NOT toLower(tname) IN $exclude
-
-    WITH hname, id(h) AS head_id, tname, id(t) AS tail_id, rtype, count(r) AS evidence
-    ORDER BY evidence DESC, rtype ASC, toLower(tname) ASC
-    LIMIT $limit
-
-    RETURN hname AS head_name, head_id,
-           tname AS tail_name, tail_id,
-           rtype AS relation, evidence
-    """
-
-    params = {
-        "head": head_resolved,
-        "whitelist": whitelist,
-        "exclude": exclude,
-        "limit": pool_limit,
+        raise ValueError("head (node name) is required")
+    k = int(d.get("k", 5))
+    return {
+        "head": head_raw,
+        "k": k,
+        # direction is ignored because edges are undirected in this KG
+        "whitelist": [w.upper() for w in (d.get("whitelist") or [])],
+        "per_type_cap": int(d.get("per_type_cap", 2)),  # kept for API compatibility
+        "exclude": [normalize_name(str(x)) for x in (d.get("exclude") or [])],
+        "limit": max(k * 6, 30),
     }
 
-    with _driver.session() as session:
-        rows = session.run(cypher, **params).data()
 
+def _resolve(specs):
+    """
+    Lexicon hit (exact/alias, embeddings only on a miss) gives node ids directly;
+    without a lexicon, or for a name it cannot place (a node added since it was
+    built), fall back to the raw name on the name_key index.
+    Returns [(resolved name, similarity, ids or None)], one embedding batch at most.
+    """
+    if not lexicon.is_loaded():
+        return [(s["head"], 1.0, None) for s in specs]
+    return [(hit["name"], hit["score"], hit["ids"] or None)
+            for hit in lexicon.resolve_many([s["head"] for s in specs])]
+
+
+def _pick(rows, k, per_type_cap):
     # There’s effectively one node label; keep a stable "types" field for UI
     for r in rows:
         r["tail_labels"] = ["Node"]
@@ -101,19 +82,146 @@ def recommend():
                 picked.append(r)
                 if len(picked) >= k:
                     break
+    return picked
+
 
-    suggestions = [{
+def _suggestion(r):
+    return {
         "text": f"Show me more about {r['head_name']} and {r['tail_name']}",
         "head": {"id": f"neo4j:{r['head_id']}", "name": r["head_name"], "types": ["Node"]},
         "relation": {"type": r["relation"], "direction": "--"},  # undirected
         "tail": {"id": f"neo4j:{r['tail_id']}", "name": r["tail_name"], "types": r.get("tail_labels") or ["Node"]},
         "count": int(r["evidence"] or 0),
         "source": "1-hop"
-    } for r in picked]
+    }
+
+
+def _cache_key(head_ids, head_key, spec):
+    """Everything a live recommend query depends on (shared by single and batch requests)."""
+    return (tuple(head_ids) if head_ids is not None else head_key, tuple(spec["whitelist"]),
+            tuple(spec["exclude"]), spec["limit"])
+
+
+def _meta(sources):
+    return {"embeddings": embeds_status(), "lexicon": lexicon.is_loaded(),
+            "neighbors": {"source": sources, "stale": neighbors.is_stale()}}
+
+
+@recommend_bp.route("/api/recommend", methods=["POST"])
+def recommend():
+    data = request.get_json(force=True) or {}
+    if "heads" in data:
+        return _recommend_batch(data)
+
+    try:
+        spec = _spec(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    (head_resolved, sim, head_ids), = _resolve([spec])
+
+    head_key = normalize_name(head_resolved)
+    args = (head_ids, head_key, spec["whitelist"], spec["exclude"], spec["limit"])
+
+    neighbors.maybe_reload()
+    rows = neighbors.lookup(*args)
+    source = "table"
+    if rows is None:
+        rows = result_cache.RECOMMEND.get(_cache_key(head_ids, head_key, spec),
+                                          lambda: graph.call("recommend", *args))
+        source = "live"
+    metrics.inc("recommend_source_total", source=source)
+
+    # rows may be the neighbour table's or result_cache's shared lists, and _pick annotates them; copy
+    suggestions = [_suggestion(r) for r in _pick([dict(r) for r in rows], spec["k"], spec["per_type_cap"])]
 
     return jsonify({
         "resolved_head": head_resolved,
         "similarity": sim,
-        "meta": {"embeddings": embeds_status()},
+        "meta": _meta(source),
         "suggestions": suggestions
     })
+
+
+def _recommend_batch(data):
+    """
+    {"heads": [{"head", "k", "whitelist", "exclude", "per_type_cap"}, ...]}
+    -> {"results": {head: {...}}, "nodes": {node id: {"name", "types"}}}
+
+    Heads the neighbour table can answer cost nothing in Neo4j; the rest come
+    from result_cache.RECOMMEND or share at most two queries (id-anchored and
+    name_key-anchored) in one transaction.
+    Identical requests are computed once, and suggestions refer to heads and
+    tails by id so a tail shared by several heads is sent once in "nodes".
+    A head listed twice with different options is a 400.
+    """
+    heads = data.get("heads")
+    if not isinstance(heads, list) or not heads:
+        return jsonify({"error": "heads must be a non-empty list"}), 400
+    if len(heads) > MAX_HEADS:
+        return jsonify({"error": f"at most {MAX_HEADS} heads per request"}), 400
+    try:
+        specs = [_spec(h if isinstance(h, dict) else {"head": h}) for h in heads]
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    # results are keyed by head: the same head twice must not ask for two different things
+    by_head = {}
+    for spec in specs:
+        if by_head.setdefault(spec["head"], spec) != spec:
+            return jsonify({"error": f"head {spec['head']!r} is listed twice with different options"}), 400
+
+    resolved = _resolve(specs)
+    neighbors.maybe_reload()
+
+    # one work item per distinct (head ids or key, filters, limit)
+    items, item_of, rows_of, sources = [], [], {}, {}
+    seen = {}
+    for spec, (name, _, ids) in zip(specs, resolved):
+        key = normalize_name(name)
+        sig = _cache_key(ids, key, spec)
+        if sig not in seen:
+            idx = seen[sig] = len(items)
+            items.append({"idx": idx, "head_ids": ids, "head_key": key, "whitelist": spec["whitelist"],
+                          "exclude": spec["exclude"], "limit": spec["limit"], "sig": sig})
+            rows = neighbors.lookup(ids, key, spec["whitelist"], spec["exclude"], spec["limit"])
+            if rows is not None:
+                rows_of[idx], sources[idx] = rows, "table"
+        item_of.append(seen[sig])
+
+    live = [it for it in items if it["idx"] not in rows_of]
+    if live:
+        by_sig = {it["sig"]: it for it in live}
+
+        def fetch(sigs):
+            todo = [{k: v for k, v in by_sig[s].items() if k != "sig"} for s in sigs]
+            found = graph.call("recommend_batch", todo)
+            return {s: found.get(by_sig[s]["idx"], []) for s in sigs}
+
+        for it, rows in zip(live, result_cache.RECOMMEND.get_many([it["sig"] for it in live], fetch)):
+            rows_of[it["idx"]], sources[it["idx"]] = rows, "live"
+    for idx in item_of:
+        metrics.inc("recommend_source_total", source=sources[idx])
+
+    results, nodes = {}, {}
+    for spec, (name, sim, _), idx in zip(specs, resolved, item_of):
+        suggestions = []
+        # rows are shared between identical items, and _pick annotates them; copy
+        for r in _pick([dict(r) for r in rows_of[idx]], spec["k"], spec["per_type_cap"]):
+            hid, tid = f"neo4j:{r['head_id']}", f"neo4j:{r['tail_id']}"
+            nodes.setdefault(hid, {"name": r["head_name"], "types": ["Node"]})
+            nodes.setdefault(tid, {"name": r["tail_name"], "types": r.get("tail_labels") or ["Node"]})
+            suggestions.append({
+                "text": f"Show me more about {r['head_name']} and {r['tail_name']}",
+                "head": hid,
+                "relation": {"type": r["relation"], "direction": "--"},
+                "tail": tid,
+                "count": int(r["evidence"] or 0),
+                "source": "1-hop",
+            })
+        results[spec["head"]] = {"resolved_head": name, "similarity": sim,
+                                 "source": sources[idx], "suggestions": suggestions}
+
+    return jsonify({
+        "meta": _meta(sorted(set(sources.values()))),
+        "results": results,
+        "nodes": nodes,
+    })
@@ -0,0 +1,289 @@
+# api/relations.py
+"""
+Relation-label table for verify.normalize_relation.
+
+REL_MAP (verify.py) only knows a few dozen spellings, so paraphrases such as
+"helps slow" or "reduces" used to become HELPS_SLOW / REDUCES, miss every
+direct edge and fall through to the 2-hop search. The build embeds each
+canonical label and its known surface forms (REL_MAP, SURFACE_FORMS below,
+optionally a TSV of extra "form<TAB>LABEL" lines) once, offline. At request
+time, for a string the rules do not map:
+
+  1. an exact surface form in the table        no network
+  2. the memo: strings already resolved        no network
+  3. embed the string (through the embedding cache and batcher), take the
+     nearest form; >= REL_EQUIV_THRESHOLD maps to its label, otherwise miss.
+     Hits and misses are both memoized for the table's version.
+
+The table is a small .npz next to this file (RELATIONS_PATH):
+
+    labels   canonical relation types
+    forms    normalized surface forms; form_label indexes labels
+    vecs     (F, D) unit-norm float32 embeddings of the forms
+    meta     model, version (hash of model + forms), built_at
+
+Queries are embedded with the table's own model, whatever OPENAI_EMBED_MODEL
+says now. A missing table leaves normalize_relation rule-only.
+
+    python api/relations.py build [--forms extra.tsv]
+    python api/relations.py status
+    python api/relations.py match "helps slow" "reduces"
+
+    RELATIONS_PATH            (default api/relations.npz)
+    REL_EQUIV_THRESHOLD       (default 0.94)
+    RELATIONS_EMBED_FALLBACK  (default 1; 0 = exact forms only, never call OpenAI)
+    RELATIONS_MEMO_ITEMS      (default 10000)
+"""
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-ada-002")
+THRESHOLD = float(os.getenv("REL_EQUIV_THRESHOLD", "0.94"))
+EMBED_FALLBACK = os.getenv("RELATIONS_EMBED_FALLBACK", "1") == "1"
+MEMO_ITEMS = int(os.getenv("RELATIONS_MEMO_ITEMS", "10000"))
+RETRY_S = 60.0  # after a failed embedding call, stay table-only this long
+
+_DEFAULT_PATH = str(Path(__file__).with_name("relations.npz"))
+
+# paraphrases seen in model answers, beyond verify.REL_MAP
+SURFACE_FORMS = {
+    "INHIBITS": ["reduce", "reduces", "lower", "lowers", "decrease", "decreases", "slow", "slows",
+                 "helps slow", "block", "blocks", "attenuate", "attenuates", "downregulate",
+                 "downregulates", "diminish", "diminishes"],
+    "AUGMENTS": ["improve", "improves", "boost", "boosts", "raise", "raises", "elevate", "elevates",
+                 "increase levels of", "increases levels of"],
+    "STIMULATES": ["promote", "promotes", "upregulate", "upregulates", "induce expression of"],
+    "PREVENTS": ["reduce the risk of", "reduces the risk of", "lower the risk of", "lowers the risk of",
+                 "protect against", "protects against", "guard against", "guards against"],
+    "TREATS": ["alleviate", "alleviates", "relieve", "relieves", "ameliorate", "ameliorates",
+               "manage", "manages", "cure", "cures", "is used to treat", "therapy for"],
+    "CAUSES": ["lead to", "leads to", "induce", "induces", "trigger", "triggers", "result in",
+               "results in", "contribute to", "contributes to"],
+    "ASSOCIATED_WITH": ["linked to", "is linked to", "correlated with", "is correlated with",
+                        "related to", "is related to", "is associated with"],
+    "INTERACTS_WITH": ["interact with", "reacts with", "has interactions with"],
+    "AFFECTS": ["influence", "influences", "modulate", "modulates", "regulate", "regulates",
+                "alter", "alters", "has an effect on"],
+    "PRODUCES": ["generate", "generates", "yield", "yields", "synthesize", "synthesizes",
+                 "release", "releases"],
+    "COEXISTS_WITH": ["co-occurs with", "occurs with", "accompanies"],
+    "DISRUPTS": ["damage", "damages", "interfere with", "interferes with"],
+    "PREDISPOSES": ["increase the risk of", "increases the risk of", "raises the risk of",
+                    "increases risk of"],
+    "COMPLICATES": ["worsen", "worsens", "aggravate", "aggravates", "exacerbate", "exacerbates"],
+}
+
+_TABLE = None      # {"labels", "forms", "form_label", "vecs", "meta", "exact"}
+_PATH = None
+_LOCK = threading.Lock()
+_MEMO = {}         # relation key -> label or None, for the loaded table
+_FAILED_AT = 0.0
+_STATS = {"exact_hits": 0, "memo_hits": 0, "embedded": 0, "embed_calls": 0,
+          "embed_hits": 0, "embed_misses": 0, "errors": 0}
+
+
+def _path():
+    return os.getenv("RELATIONS_PATH", _DEFAULT_PATH)
+
+
+def relation_key(rel):
+    """Lowercase, punctuation dropped, "_"/whitespace runs -> one space: the key REL_MAP and the table use."""
+    s = re.sub(r"[^\w\s-]", "", (rel or "").strip().lower())
+    return re.sub(r"[_\s]+", " ", s).strip()
+
+
+def _count(k, n=1):
+    with _LOCK:
+        _STATS[k] += n
+
+
+# --- build ---------------------------------------------------------------------
+def surface_forms(extra=None):
+    """{form key: label} from the canonical labels, verify.REL_MAP, SURFACE_FORMS and `extra`."""
+    from verify import REL_MAP
+    pairs = {}
+    for label in sorted({*REL_MAP.values(), *SURFACE_FORMS}):
+        pairs[relation_key(label)] = label
+    for form, label in REL_MAP.items():
+        pairs.setdefault(relation_key(form), label)
+    for label, forms in SURFACE_FORMS.items():
+        for form in forms:
+            pairs.setdefault(relation_key(form), label)
+    for form, label in (extra or {}).items():
+        pairs[relation_key(form)] = label.strip().upper()
+    return pairs
+
+
+def _read_tsv(path):
+    out = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                form, label = line.rstrip("\n").split("\t")[:2]
+                out[form] = label
+    return out
+
+
+def _unit(vecs):
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+def build(path=None, model=None, extra=None, log=print):
+    """Embed every surface form and write the table; returns its meta."""
+    from embedding_utils import get_embeddings
+    path, model = path or _path(), model or MODEL
+    t0 = time.perf_counter()
+    pairs = surface_forms(extra)
+    forms = sorted(pairs)
+    labels = sorted(set(pairs.values()))
+    log(f"[relations] embedding {len(forms)} forms of {len(labels)} labels with {model}")
+    vecs = _unit(get_embeddings(forms, model=model))
+    digest = hashlib.sha1(json.dumps([model, [[f, pairs[f]] for f in forms]]).encode()).hexdigest()[:12]
+    meta = {"model": model, "version": digest, "built_at": time.time(), "forms": len(forms),
+            "labels": len(labels), "dim": int(vecs.shape[1])}
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, labels=np.array(labels), forms=np.array(forms),
+             form_label=np.array([labels.index(pairs[f]) for f in forms], dtype=np.int16),
+             vecs=vecs, meta=np.frombuffer(json.dumps(meta).encode(), np.uint8))
+    os.replace(tmp, path)
+    meta["build_s"] = round(time.perf_counter() - t0, 2)
+    return meta
+
+
+# --- serving ---------------------------------------------------------------------
+def load(path=None):
+    """Load the table if the file exists; returns True when one is in memory."""
+    global _TABLE, _PATH
+    path = path or _path()
+    with _LOCK:
+        _PATH = path
+        if not os.path.exists(path):
+            return _TABLE is not None
+        try:
+            with np.load(path) as z:
+                table = {k: z[k] for k in ("labels", "forms", "form_label", "vecs")}
+                table["meta"] = json.loads(bytes(z["meta"]).decode())
+            labels = table["labels"].tolist()
+            table["exact"] = {f: labels[i] for f, i in zip(table["forms"].tolist(), table["form_label"].tolist())}
+            _TABLE = table
+            _MEMO.clear()
+        except Exception as e:
+            print(f"[relations] could not load {path}: {e}")
+    return _TABLE is not None
+
+
+def is_loaded():
+    return _TABLE is not None
+
+
+def _embed(table, keys):
+    """Nearest label per key, or None below THRESHOLD; raises when the embedding call fails."""
+    from embedding_utils import get_embeddings
+    _count("embed_calls")
+    _count("embedded", len(keys))
+    sims = _unit(get_embeddings(keys, model=table["meta"]["model"])) @ table["vecs"].T
+    best = sims.argmax(axis=1)
+    labels = table["labels"].tolist()
+    out = []
+    for i, j in enumerate(best.tolist()):
+        ok = float(sims[i, j]) >= THRESHOLD
+        _count("embed_hits" if ok else "embed_misses")
+        out.append(labels[int(table["form_label"][j])] if ok else None)
+    return out
+
+
+def match_many(keys, embed=True):
+    """Canonical label (or None) for each relation key; one embedding call for the unknown ones."""
+    global _FAILED_AT
+    table = _TABLE
+    if table is None:
+        return [None] * len(keys)
+    out, todo = [], []
+    for i, k in enumerate(keys):
+        if k in table["exact"]:
+            _count("exact_hits")
+            out.append(table["exact"][k])
+        elif k in _MEMO:
+            _count("memo_hits")
+            out.append(_MEMO[k])
+        else:
+            out.append(None)
+            todo.append(i)
+    if not todo or not embed or not EMBED_FALLBACK or time.monotonic() - _FAILED_AT < RETRY_S:
+        return out
+    fresh = list(dict.fromkeys(keys[i] for i in todo))
+    try:
+        found = dict(zip(fresh, _embed(table, fresh)))
+    except Exception as e:  # no OpenAI key / network: rules and exact forms only for a while
+        _count("errors")
+        _FAILED_AT = time.monotonic()
+        print(f"[relations] embedding lookup failed: {e}")
+        return out
+    if table is _TABLE:
+        if len(_MEMO) + len(found) > MEMO_ITEMS:
+            _MEMO.clear()
+        _MEMO.update(found)
+    for i in todo:
+        out[i] = found[keys[i]]
+    return out
+
+
+def match(key, embed=True):
+    return match_many([key], embed)[0]
+
+
+def stats():
+    table = _TABLE
+    with _LOCK:
+        s = dict(_STATS)
+    looked_up = s["embed_hits"] + s["embed_misses"]
+    return {
+        "loaded": table is not None,
+        "path": _PATH or _path(),
+        **({k: table["meta"][k] for k in ("model", "version", "built_at", "forms", "labels")} if table else {}),
+        "threshold": THRESHOLD,
+        "embed_fallback": EMBED_FALLBACK,
+        "memo_items": len(_MEMO),
+        **s,
+        "embed_hit_rate": round(s["embed_hits"] / looked_up, 3) if looked_up else None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or inspect the relation-label embedding table.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--forms", default=None, help='TSV of extra "surface form<TAB>LABEL" lines')
+    b.add_argument("--model", default=MODEL)
+    b.add_argument("--path", default=None)
+    sub.add_parser("status")
+    m = sub.add_parser("match")
+    m.add_argument("relations", nargs="+")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        extra = _read_tsv(args.forms) if args.forms else None
+        print(json.dumps(build(args.path, args.model, extra), indent=2))
+    elif args.cmd == "status":
+        load()
+        print(json.dumps(stats(), indent=2))
+    else:
+        from verify import normalize_relation
+        load()
+        for rel in args.relations:
+            print(f"{rel!r:>30} -> {normalize_relation(rel)}")
+
+
+if __name__ == "__main__":
+    main()
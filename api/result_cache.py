@@ -0,0 +1,195 @@
+# api/result_cache.py
+"""
+Result caches for KG lookups that many users repeat (verify pairs, live
+recommend rows), with single-flight: concurrent requests for the same key
+share one database query instead of each sending their own.
+
+Entries are keyed by the caller (verify: the anchored (head, tail) pair;
+recommend: head + filters + limit) and live under graph.kg_version(). When
+the version changes (driver swapped, KG counts changed, KG_VERSION bumped)
+the cache is emptied, so an old graph's answers are never served. Values
+are stored JSON-encoded: a hit is a private copy, and the stored size is what
+"bytes" reports. LRU eviction past RESULT_CACHE_ITEMS entries or
+RESULT_CACHE_MAX_MB, and a TTL so a change the version stamp cannot see
+(an edit that keeps the counts) ages out.
+
+    RESULT_CACHE            (default 1; 0 = every lookup goes to the graph)
+    RESULT_CACHE_ITEMS      (default 20000 per cache)
+    RESULT_CACHE_MAX_MB     (default 64 per cache)
+    RESULT_CACHE_TTL_S      (default 600)
+    RESULT_CACHE_WAIT_S     (default 30; then a waiting request queries itself)
+"""
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+import graph
+import metrics
+
+ENABLED = os.getenv("RESULT_CACHE", "1") == "1"
+ITEMS = int(os.getenv("RESULT_CACHE_ITEMS", "20000"))
+MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "600"))
+WAIT_S = float(os.getenv("RESULT_CACHE_WAIT_S", "30"))
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    def __init__(self, name, items=ITEMS, max_bytes=MAX_BYTES, ttl_s=TTL_S):
+        self.name = name
+        self.items = int(items)
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = float(ttl_s)
+        self._lru = OrderedDict()   # key -> (expires at, JSON bytes)
+        self._bytes = 0
+        self._flights = {}          # key -> _Flight of the request computing it
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evicted": 0,
+                       "invalidations": 0, "uncacheable": 0, "errors": 0}
+
+    def _count(self, outcome, n):
+        if n:
+            self._stats[outcome] += n
+            metrics.inc("result_cache_lookups_total", n, cache=self.name, outcome=outcome)
+
+    def _drop(self, key):
+        _, blob = self._lru.pop(key)
+        self._bytes -= len(blob)
+
+    def _put(self, key, blob, version):
+        if version != self._version or len(blob) > self.max_bytes:
+            return
+        if key in self._lru:
+            self._drop(key)
+        self._lru[key] = (time.monotonic() + self.ttl_s, blob)
+        self._bytes += len(blob)
+        while len(self._lru) > self.items or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._lru)))
+            self._stats["evicted"] += 1
+
+    def get_many(self, keys, compute, cacheable=None):
+        """
+        One value per key, in order. `compute(missing keys) -> {key: value}` is
+        called at most once, for the keys that are neither cached nor being
+        computed by another request; those are waited for. Values must be
+        JSON-serializable; `cacheable(value)` False hands a value to the waiting
+        requests without storing it (e.g. a timed-out search).
+        """
+        uniq = list(dict.fromkeys(keys))
+        if not ENABLED:
+            found = compute(uniq) if uniq else {}
+            return [found[k] for k in keys]
+        version = graph.kg_version()
+        now = time.monotonic()
+        blobs, mine, theirs = {}, {}, {}
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self._stats["invalidations"] += 1
+                self._lru.clear()
+                self._bytes = 0
+                self._flights = {}
+                self._version = version
+            expired = 0
+            for k in uniq:
+                entry = self._lru.get(k)
+                if entry is not None and entry[0] <= now:
+                    self._drop(k)
+                    expired += 1
+                    entry = None
+                if entry is not None:
+                    self._lru.move_to_end(k)
+                    blobs[k] = entry[1]
+                elif k in self._flights:
+                    theirs[k] = self._flights[k]
+                else:
+                    mine[k] = self._flights[k] = _Flight()
+            self._count("hits", len(blobs))
+            self._count("coalesced", len(theirs))
+            self._count("misses", len(mine))
+            self._stats["expired"] += expired
+
+        found = {k: json.loads(b) for k, b in blobs.items()}
+        if mine:
+            found.update(self._compute(mine, compute, cacheable, version))
+        late = []
+        for k, flight in theirs.items():
+            if not flight.event.wait(WAIT_S):
+                late.append(k)
+            elif flight.error is not None:
+                raise flight.error
+            else:
+                found[k] = json.loads(flight.value)
+        if late:  # the other request is stuck: do not wait any longer, ask the graph
+            found.update(compute(late))
+        return [found[k] for k in keys]
+
+    def _compute(self, flights, compute, cacheable, version):
+        try:
+            values = compute(list(flights))
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                for k, flight in flights.items():
+                    if self._flights.get(k) is flight:
+                        del self._flights[k]
+            for flight in flights.values():
+                flight.error = e
+                flight.event.set()
+            raise
+        with self._lock:
+            for k, flight in flights.items():
+                flight.value = blob = json.dumps(values[k]).encode()
+                if cacheable is None or cacheable(values[k]):
+                    self._put(k, blob, version)
+                else:
+                    self._stats["uncacheable"] += 1
+                if self._flights.get(k) is flight:
+                    del self._flights[k]
+        for flight in flights.values():
+            flight.event.set()
+        return values
+
+    def get(self, key, compute, cacheable=None):
+        return self.get_many([key], lambda ks: {ks[0]: compute()}, cacheable)[0]
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s.update(items=len(self._lru), bytes=self._bytes, in_flight=len(self._flights))
+        lookups = s["hits"] + s["misses"] + s["coalesced"]
+        return {
+            "enabled": ENABLED,
+            **s,
+            "hit_rate": round(s["hits"] / lookups, 4) if lookups else 0.0,
+            # lookups that did not reach the graph themselves
+            "saved_rate": round((s["hits"] + s["coalesced"]) / lookups, 4) if lookups else 0.0,
+            "max_items": self.items,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "kg_version": {"generation": self._version[0], "stamp": self._version[1]} if self._version else None,
+        }
+
+
+VERIFY = ResultCache("verify")
+RECOMMEND = ResultCache("recommend")
+
+
+def stats():
+    return {c.name: c.stats() for c in (VERIFY, RECOMMEND)}
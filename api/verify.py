@@ -1,19 +1,21 @@
 from flask import Blueprint, request, jsonify
 # from flask_cors import cross_origin   # ← remove per-route CORS
-from neo4j import GraphDatabase
 import os, re, traceback
 
-from embeds import status as embeds_status  # keep health endpoint; no hot-path embeddings
+from embeds import status as embeds_status, reload as embeds_reload  # no hot-path embeddings
+from kg_index import normalize_name
+import graph
+import evidence
+import lexicon
+import metrics
+import relations
+import result_cache
 
 verify_bp = Blueprint("verify_bp", __name__)
 
-NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "knowpass123")
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-ada-002")
-REL_EQUIV_THRESHOLD = float(os.getenv("REL_EQUIV_THRESHOLD", "0.94"))
+# used by the relation-label table (relations.py) for strings REL_MAP does not know
+OPENAI_EMBED_MODEL = relations.MODEL
+REL_EQUIV_THRESHOLD = relations.THRESHOLD
 
 REL_MAP = {
     "interact": "INTERACTS_WITH","interacts": "INTERACTS_WITH","interacts with": "INTERACTS_WITH",
@@ -33,44 +35,317 @@ REL_MAP = {
     "associated with": "ASSOCIATED_WITH","associate": "ASSOCIATED_WITH","associates with": "ASSOCIATED_WITH",
 }
 
-def normalize_relation(rel: str) -> str:
-    if not rel: return ""
-    s = re.sub(r"[^\w\s-]", "", rel.strip().lower())
-    s = re.sub(r"[_\s]+", " ", s).strip()
+_LABEL_RE = re.compile(r"^[A-Z][A-Z0-9]*(_[A-Z0-9]+)*$")
+
+
+def _rule(s):
     if s in REL_MAP: return REL_MAP[s]
     if s.endswith("ing") and s[:-3] in REL_MAP: return REL_MAP[s[:-3]]
     if s.endswith("ed") and s[:-2] in REL_MAP: return REL_MAP[s[:-2]]
     if s.endswith("s") and s[:-1] in REL_MAP: return REL_MAP[s[:-1]]
-    return s.upper().replace(" ", "_")
+    return None
+
+
+def _embeddable(rel):
+    # an UPPER_SNAKE label may be a KG type we do not list: exact table forms only, no nearest match
+    return not _LABEL_RE.match(rel.strip())
+
+
+def normalize_relation(rel: str) -> str:
+    if not rel: return ""
+    s = relations.relation_key(rel)
+    canon, via = _rule(s), "rule"
+    if canon is None and s:
+        canon, via = relations.match(s, embed=_embeddable(rel)), "table"
+    metrics.inc("relation_lookups_total", via=via if canon else "miss")
+    return canon or s.upper().replace(" ", "_")
+
+
+def _prefetch_relations(triples):
+    """Resolve this batch's unmapped relation strings with one embedding call."""
+    keys = []
+    for t in triples:
+        if isinstance(t, (list, tuple)) and len(t) == 3 and isinstance(t[1], str):
+            s = relations.relation_key(t[1])
+            if s and _rule(s) is None and _embeddable(t[1]):
+                keys.append(s)
+    if keys and relations.is_loaded():
+        relations.match_many(keys)
 
 def _rel_text(canon: str) -> str:
     return (canon or "").replace("_", " ").lower().strip()
 
-@verify_bp.route("/api/_health", methods=["GET"])
-def _health():
-    emb = embeds_status()
-    return jsonify({
-        "embeddings": emb,
-        "neo4j_uri": NEO4J_URI,
-        "model": OPENAI_EMBED_MODEL,
-        "entity_threshold": os.getenv("ENTITY_SIM_THRESHOLD", "0.80"),
-        "loaded": bool(emb.get("loaded")),
-    })
-
 @verify_bp.route("/api/_probe_node", methods=["GET"])
 def _probe_node():
     name = (request.args.get("name") or "").strip()
     if not name:
         return jsonify({"error": "name query param required"}), 400
-    q =  """
-    MATCH (n:Node)
-    WHERE toLower(coalesce(n.Name, n.name, n.name_lc)) = toLower($name)
-    RETURN labels(n) AS labels, coalesce(n.Name, n.name, n.name_lc) AS Name, n.CUI AS CUI, id(n) AS id
-    LIMIT 5
+    hit = lexicon.lookup(name)
+    rows = graph.call("probe", ids=hit["ids"], key=normalize_name(name))
+    return jsonify({"matches": rows, "via": hit["via"] or "name_key"})
+
+
+@verify_bp.route("/api/_embeddings/reload", methods=["POST"])
+@metrics.admin_only  # rebuilds the whole matrix
+def _embeddings_reload():
+    # builds in the background; poll /api/_health for "reloading" / "loaded_at"
+    started = embeds_reload()
+    return jsonify({"started": started, **embeds_status()}), (202 if started else 409)
+
+
+@verify_bp.route("/api/_lexicon/refresh", methods=["POST"])
+@metrics.admin_only  # a full scan of the KG
+def _lexicon_refresh():
+    try:
+        return jsonify(lexicon.build())
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e), **lexicon.status()}), 500
+
+# 2-hop bridge search bounds (see neo4j_graph.py): intermediates read per
+# pair, and the relationship count above which an intermediate is skipped.
+BRIDGE_EXPAND = int(os.getenv("BRIDGE_EXPAND", "2000"))
+BRIDGE_HUB_DEGREE = int(os.getenv("BRIDGE_HUB_DEGREE", "5000"))
+# per-request limit on the bridge transaction; 0 disables. Requests may send
+# {"bridge_budget_ms": ...}. Pairs not answered in time come back "unsure".
+BRIDGE_BUDGET_MS = float(os.getenv("BRIDGE_BUDGET_MS", "2000"))
+
+# "batch" (default) or "per_triple"; a request can override with {"mode": ...}
+VERIFY_MODE = os.getenv("VERIFY_MODE", "batch")
+
+
+def _missing_result():
+    return {"head": None,"relation": None,"tail": None,
+            "rel_norm": "","status":"unsure","count":0,"papers":[],
+            "ui_hint":"missing","resolved":{}}
+
+
+def _parse_triple(t):
+    """Return (head, rel, tail, rel_norm) or None for malformed input."""
+    if not (isinstance(t, (list, tuple)) and len(t) == 3):
+        return None
+    head_raw, rel_raw, tail_raw = (t[0] or "").strip(), (t[1] or "").strip(), (t[2] or "").strip()
+    return head_raw, rel_raw, tail_raw, normalize_relation(rel_raw)
+
+
+def _best(rows_):
+    return max(rows_, key=lambda x: int(x.get("evidence") or 0)) if rows_ else None
+
+
+def _evidence(top, anchor):
+    # papers are paged from /api/evidence; the cursor names the pair and relation
+    return {"count": int(top["evidence"] or 0),
+            "cursor": evidence.encode_cursor(anchor, top["reltype"]) if anchor else None}
+
+
+def _direct_result(parsed, rows, names=None, anchor=None):
+    """Build a result from direct-edge rows; None when 2-hop search is needed."""
+    head_raw, rel_raw, tail_raw, rel_norm = parsed
+    head_res, tail_res = names or (head_raw, tail_raw)
+    same = [r for r in rows if (r.get("reltype") or "").upper() == rel_norm]
+    if same:
+        top = _best(same)
+        return {
+            "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
+            "status": "supported", "count": int(top["evidence"] or 0),
+            "papers": [], "evidence": _evidence(top, anchor), "ui_hint": "solid",
+            "resolved": {"head": head_res, "tail": tail_res}
+        }
+    if rows:
+        top = _best(rows)
+        return {
+            "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
+            "status": "relevant", "count": int(top["evidence"] or 0),
+            "papers": [], "evidence": _evidence(top, anchor), "ui_hint": "weak",
+            "resolved": {"head": head_res, "tail": tail_res, "alt_rel": top["reltype"]}
+        }
+    return None
+
+
+def _bridge_result(parsed, bridge, names=None):
+    head_raw, rel_raw, tail_raw, rel_norm = parsed
+    head_res, tail_res = names or (head_raw, tail_raw)
+    if bridge:
+        return {
+            "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
+            "status": "relevant", "count": 0, "papers": [], "ui_hint": "weak",
+            "resolved": {"head": head_res, "tail": tail_res, "bridge": bridge}
+        }
+    return {
+        "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
+        "status": "unsure", "count": 0, "papers": [], "ui_hint": "missing",
+        "resolved": {"head": head_res, "tail": tail_res}
+    }
+
+
+def _verify_per_triple(tx, triples):
+    """Original strategy: up to two round-trips per triple."""
+    results = []
+    for t in triples:
+        parsed = _parse_triple(t)
+        if parsed is None:
+            results.append(_missing_result())
+            continue
+        head_raw, _, tail_raw, _ = parsed
+        hkey, tkey = normalize_name(head_raw), normalize_name(tail_raw)
+        rows = tx.direct_pair(hkey, tkey)
+        res = _direct_result(parsed, rows, anchor={"hkey": hkey, "tkey": tkey})
+        if res is None:
+            res = _bridge_result(parsed, tx.bridge_pair(hkey, tkey, BRIDGE_EXPAND, BRIDGE_HUB_DEGREE))
+        results.append(res)
+    return results
+
+
+def _resolve_names(parsed):
+    """name_key -> lexicon hit for every distinct head/tail (one embedding batch for misses)."""
+    raw = {}
+    for p in parsed:
+        if p is not None:
+            for name in (p[0], p[2]):
+                raw.setdefault(normalize_name(name), name)
+    keys = list(raw)
+    return dict(zip(keys, lexicon.resolve_many([raw[k] for k in keys])))
+
+
+def _plan_batch(triples):
+    """Parse, resolve names and list every distinct (head, tail) pair; no DB access."""
+    parsed = [_parse_triple(t) for t in triples]
+    use_ids = lexicon.is_loaded()
+    hits = _resolve_names(parsed) if use_ids else {}
+
+    # dedupe (head, tail) pairs on their name keys; several triples often share one
+    pair_idx, items = {}, []
+    for p in parsed:
+        if p is None:
+            continue
+        key = (normalize_name(p[0]), normalize_name(p[2]))
+        if key in pair_idx:
+            continue
+        pair_idx[key] = len(items)
+        if not use_ids:
+            items.append({"idx": len(items), "hkey": key[0], "tkey": key[1]})
+            continue
+        h, t = hits[key[0]], hits[key[1]]
+        # a name the lexicon cannot place may be a node added since it was built: ask by name_key
+        items.append({"idx": len(items), "hids": h["ids"], "tids": t["ids"]} if h["ids"] and t["ids"]
+                     else {"idx": len(items), "hkey": key[0], "tkey": key[1]})
+    return {"parsed": parsed, "use_ids": use_ids, "hits": hits, "pair_idx": pair_idx, "items": items}
+
+
+def _pair_key(item):
+    """Result-cache key of a work item: what the queries are anchored on."""
+    if "hids" in item:
+        return "ids", tuple(item["hids"]), tuple(item["tids"])
+    return "key", item["hkey"], item["tkey"]
+
+
+def _direct_rows(tx, items):
+    return tx.direct(items)
+
+
+def _bridge_rows(tx, items):
+    return tx.bridges(items, BRIDGE_EXPAND, BRIDGE_HUB_DEGREE)
+
+
+def _lookup_pairs(items, budget_ms):
+    """
+    Direct edges for every pair, then the bridge search for pairs with none:
+    {pair key: {"direct": rows, "bridge": name or None, "timeout": bool}}.
+    Id- and name_key-anchored items share each transaction.
+    """
+    items = [{**it, "idx": i} for i, it in enumerate(items)]
+    direct = graph.read(_direct_rows, items)
+    # the bridge search only runs for pairs with no direct edge at all
+    need_two = [it for it in items if it["idx"] not in direct]
+    bridges, timed_out = {}, False
+    if need_two:
+        budget = BRIDGE_BUDGET_MS if budget_ms is None else float(budget_ms)
+        try:
+            if budget > 0:
+                bridges = graph.read_within(budget / 1000.0, _bridge_rows, need_two)
+            else:
+                bridges = graph.read(_bridge_rows, need_two)
+        except Exception as e:
+            if not graph.is_timeout(e):
+                raise
+            timed_out = True
+    return {_pair_key(it): {"direct": direct.get(it["idx"], []), "bridge": bridges.get(it["idx"]),
+                            "timeout": timed_out and it["idx"] not in direct}
+            for it in items}
+
+
+def _finish_batch(plan, found):
+    hits, results = plan["hits"], []
+    for p in plan["parsed"]:
+        if p is None:
+            results.append(_missing_result())
+            continue
+        hkey, tkey = normalize_name(p[0]), normalize_name(p[2])
+        idx = plan["pair_idx"][(hkey, tkey)]
+        names = None
+        if plan["use_ids"]:
+            names = tuple(hits[k]["name"] if hits[k]["via"] in ("alias", "embedding") else raw
+                          for k, raw in ((hkey, p[0]), (tkey, p[2])))
+        item = plan["items"][idx]
+        anchor = ({"hids": item["hids"], "tids": item["tids"]} if "hids" in item
+                  else {"hkey": item["hkey"], "tkey": item["tkey"]})
+        pair = found.get(idx) or {"direct": [], "bridge": None, "timeout": False}
+        res = _direct_result(p, pair["direct"], names, anchor)
+        if res is None:
+            res = _bridge_result(p, pair["bridge"], names)
+            if pair["timeout"]:
+                res["bridge_search"] = "timeout"
+        results.append(res)
+    return results
+
+
+def _verify_batch(triples, budget_ms=None):
     """
-    with driver.session() as s:
-        rows = s.run(q, name=name).data()
-    return jsonify({"matches": rows})
+    At most two round-trips for the whole request, results in input order.
+    Direct edges and the bridge search run in separate read transactions so
+    the bridge one can carry a server-side timeout without losing the direct
+    results; on timeout the affected triples stay "unsure".
+
+    Pairs go through result_cache.VERIFY: cached pairs cost no query, and a
+    pair another request is already looking up is waited for. Timed-out
+    searches are not cached.
+    """
+    plan = _plan_batch(triples)
+    found = {}
+    if plan["items"]:
+        # aliases can resolve to the same nodes: one lookup per key, every item gets its value
+        groups = {}
+        for it in plan["items"]:
+            groups.setdefault(_pair_key(it), []).append(it)
+        pairs = result_cache.VERIFY.get_many(
+            list(groups), lambda keys: _lookup_pairs([groups[k][0] for k in keys], budget_ms),
+            cacheable=lambda v: not v["timeout"])
+        found = {it["idx"]: v for k, v in zip(groups, pairs) for it in groups[k]}
+    return _finish_batch(plan, found)
+
+
+def verify_list(triples, mode=None, budget_ms=None):
+    """Verify [head, relation, tail] triples; usable outside a request (e.g. /api/chat)."""
+    _prefetch_relations(triples)
+    if mode == "per_triple":
+        # one managed read transaction; retried as a whole on transient errors
+        results = graph.read(_verify_per_triple, triples)
+    else:
+        results = _verify_batch(triples, budget_ms)
+    for res in results:
+        metrics.inc("verify_branch_total", branch=_branch(res))
+    return results
+
+
+def _branch(res):
+    if res.get("head") is None:
+        return "invalid"
+    if res.get("bridge_search") == "timeout":
+        return "timeout"
+    if "bridge" in res.get("resolved", {}):
+        return "2-hop"
+    return "unsure" if res["status"] == "unsure" else "direct"
+
 
 @verify_bp.route("/api/verify", methods=["POST"])
 def verify_triples():
@@ -80,88 +355,17 @@ def verify_triples():
         if not isinstance(triples, list):
             return jsonify({"error": "triples must be a list of [head, relation, tail]"}), 400
 
-        results = []
-        with driver.session() as session:
-            for t in triples:
-                if not (isinstance(t, (list, tuple)) and len(t) == 3):
-                    results.append({"head": None,"relation": None,"tail": None,
-                                    "rel_norm": "","status":"unsure","count":0,"papers":[],
-                                    "ui_hint":"missing","resolved":{}})
-                    continue
-
-                head_raw, rel_raw, tail_raw = (t[0] or "").strip(), (t[1] or "").strip(), (t[2] or "").strip()
-                rel_norm = normalize_relation(rel_raw)
-
-                # Fast path: exact, case-insensitive match using raw names (no embeddings)
-                q_direct = """
-                MATCH (h:Node),(t:Node)
-                WHERE toLower(coalesce(h.Name, h.name, h.name_lc)) = toLower($hname)
-                  AND toLower(coalesce(t.Name, t.name, t.name_lc)) = toLower($tname)
-                MATCH (h)-[r]-(t)
-                WITH toUpper(coalesce(r.Type, type(r))) AS reltype,
-                     count(r) AS evidence,
-                     collect(r.PubMed_ID)[0..50] AS papers
-                RETURN reltype, evidence, papers
-                """
-                rows = session.run(q_direct, hname=head_raw, tname=tail_raw).data()
-                same = [r for r in rows if (r.get("reltype") or "").upper() == rel_norm]
-
-                def best(rows_):
-                    return max(rows_, key=lambda x: int(x.get("evidence") or 0)) if rows_ else None
-
-                if same:
-                    top = best(same)
-                    results.append({
-                        "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
-                        "status": "supported", "count": int(top["evidence"] or 0),
-                        "papers": top.get("papers") or [], "ui_hint": "solid",
-                        "resolved": {"head": head_raw, "tail": tail_raw}
-                    })
-                    continue
-
-                if rows:
-                    top = best(rows)
-                    results.append({
-                        "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
-                        "status": "relevant", "count": int(top["evidence"] or 0),
-                        "papers": top.get("papers") or [], "ui_hint": "weak",
-                        "resolved": {"head": head_raw, "tail": tail_raw, "alt_rel": top["reltype"]}
-                    })
-                    continue
-
-                q_two = """
-                MATCH (h:Node),(t:Node)
-                WHERE toLower(coalesce(h.Name, h.name, h.name_lc)) = toLower($hname)
-                  AND toLower(coalesce(t.Name, t.name, t.name_lc)) = toLower($tname)
-                MATCH (h)-[r1]-(m:Node)-[r2]-(t)
-                WITH m,
-                     toUpper(coalesce(r1.Type, type(r1))) AS r1_type,
-                     toUpper(coalesce(r2.Type, type(r2))) AS r2_type,
-                     count(r1) AS c1, count(r2) AS c2
-                RETURN coalesce(m.Name, m.name, m.name_lc) AS bridge, r1_type, r2_type, (c1 + c2) AS total_weight
-                ORDER BY total_weight DESC
-                LIMIT 1
-                """
-                hop2 = session.run(q_two, hname=head_raw, tname=tail_raw).single()
-                if hop2:
-                    results.append({
-                        "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
-                        "status": "relevant", "count": 0, "papers": [], "ui_hint": "weak",
-                        "resolved": {"head": head_raw, "tail": tail_raw, "bridge": hop2["bridge"]}
-                    })
-                    continue
-
-                results.append({
-                    "head": head_raw, "relation": rel_raw, "tail": tail_raw, "rel_norm": rel_norm,
-                    "status": "unsure", "count": 0, "papers": [], "ui_hint": "missing",
-                    "resolved": {"head": head_raw, "tail": tail_raw}
-                })
+        mode = "per_triple" if (data.get("mode") or VERIFY_MODE) == "per_triple" else "batch"
+        results = verify_list(triples, mode, data.get("bridge_budget_ms"))
 
         return jsonify({
-            "meta": {"impl": "verify-direct-v1", **embeds_status()},
+            "meta": {"impl": "verify-direct-v1", "mode": mode, **embeds_status()},
             "results": results
         }), 200
 
+    except graph.GraphUnavailable as e:
+        # retries exhausted: the KG is down, not a bug in this request
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
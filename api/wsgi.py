@@ -0,0 +1,44 @@
+# api/wsgi.py
+"""
+Production entry point:
+
+    gunicorn -c api/gunicorn.conf.py wsgi:app
+
+create_app() does every startup step eagerly: index.py's (name index
+check, lexicon, neighbour table, CSR graph) plus the embedding matrix, name
+table and ANN index that embeds.py otherwise loads on the first request. With
+preload_app (the default in gunicorn.conf.py) that runs once in the master;
+the workers inherit it over fork() and share the pages copy-on-write. The
+arrays are marked read-only, so nothing writes to (and so copies) them.
+"""
+import time
+
+import numpy as np
+
+import embeds
+
+
+def _read_only(obj, depth=2):
+    """Flag the numpy arrays in obj (matrix, quant.CompactMatrix, ann index) read-only."""
+    if isinstance(obj, np.ndarray):
+        obj.flags.writeable = False
+    elif depth and hasattr(obj, "__dict__"):
+        for v in vars(obj).values():
+            _read_only(v, depth - 1)
+
+
+def create_app():
+    t0 = time.perf_counter()
+    from index import app
+    if embeds.load():
+        _, mat, _, index = embeds._SNAP
+        _read_only(mat)
+        _read_only(index)
+    app.config["BOOT_S"] = round(time.perf_counter() - t0, 3)
+    emb = embeds.status()
+    print(f"[wsgi] app ready in {app.config['BOOT_S']} s; embeddings: {emb['rows']} rows, "
+          f"{(emb.get('matrix_bytes') or 0) / 1e6:.0f} MB")
+    return app
+
+
+app = create_app()
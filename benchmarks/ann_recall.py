@@ -0,0 +1,82 @@
+# benchmarks/ann_recall.py
+"""
+Recall and latency of the ANN backends in api/ann.py vs exact search.
+
+    python benchmarks/ann_recall.py --n 100000 1000000 --dim 128
+
+Vectors are a synthetic Gaussian mixture (entity embeddings cluster by
+topic), queries are noisy copies of random rows. 1M x 1536 float32 is ~6 GB,
+so the default dimension is smaller; pass --dim 1536 on a big box.
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+import fakegraph  # noqa: F401  (puts api/ on sys.path)
+import ann
+
+
+def synthetic(n, dim, n_clusters=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    mat = np.empty((n, dim), np.float32)
+    step = 100_000
+    for s in range(0, n, step):
+        m = min(step, n - s)
+        mat[s:s + m] = centers[rng.integers(0, n_clusters, m)] + 1.0 * rng.standard_normal((m, dim), dtype=np.float32)
+    mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat
+
+
+def queries(mat, q, seed=1):
+    rng = np.random.default_rng(seed)
+    x = mat[rng.integers(0, mat.shape[0], q)] + (0.5 / np.sqrt(mat.shape[1])) * rng.standard_normal((q, mat.shape[1]), dtype=np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def timed(index, qs, k, **kw):
+    times, ids = [], []
+    for q in qs:  # one request at a time, as resolve_entities sees them
+        t0 = time.perf_counter()
+        i, _ = index.search(q[None, :], k=k, **kw)
+        times.append((time.perf_counter() - t0) * 1000)
+        ids.append(i[0])
+    return np.array(ids), statistics.median(times)
+
+
+def recall(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = ap.parse_args()
+
+    for n in args.n:
+        mat = synthetic(n, args.dim)
+        qs = queries(mat, args.queries)
+        exact = ann.ExactIndex(mat)
+        truth, exact_ms = timed(exact, qs, args.k)
+        t0 = time.perf_counter()
+        ivf = ann.IVFIndex.train(mat)
+        build_s = time.perf_counter() - t0
+
+        print(f"\nN={n:,} dim={args.dim} nlist={ivf.centroids.shape[0]} (build {build_s:.1f}s)")
+        print(f"{'backend':>14} {'p50 ms':>8} {'recall@1':>9} {'recall@' + str(args.k):>10}")
+        print(f"{'exact':>14} {exact_ms:>8.2f} {1.0:>9.3f} {1.0:>10.3f}")
+        for p in args.nprobe:
+            found, ms = timed(ivf, qs, args.k, nprobe=p)
+            print(f"{'ivf/' + str(p):>14} {ms:>8.2f} {recall(found[:, :1], truth[:, :1]):>9.3f} "
+                  f"{recall(found, truth):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
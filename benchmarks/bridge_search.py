@@ -0,0 +1,89 @@
+# benchmarks/bridge_search.py
+"""
+2-hop bridge search on a power-law stand-in graph: work done by the old
+unbounded (h)-[r1]-(m)-[r2]-(t) pattern vs the bounded, low-degree-first
+search, and what the per-request time budget does to hub-to-hub pairs.
+
+    python benchmarks/bridge_search.py --nodes 50000 --rel-us 0.5
+
+"work" is relationships read. The stand-in charges --rel-us of simulated
+server time per relationship, so latency follows work; the old query is only
+estimated (it is no longer in the code).
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fakegraph import FakeDriver, powerlaw_graph
+
+import graph
+import lexicon
+import verify
+
+
+def _pairs(g, heads, tails, n, rng):
+    out = []
+    while len(out) < n:
+        h, t = rng.choice(heads), rng.choice(tails)
+        if h != t and not g.mult(h, t):  # no direct edge, so the bridge search runs
+            out.append((h, t))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=50000)
+    ap.add_argument("--avg-degree", type=int, default=10)
+    ap.add_argument("--pairs", type=int, default=20)
+    ap.add_argument("--max-parallel", type=int, default=200, help="cap on parallel edges (papers) per pair")
+    ap.add_argument("--rel-us", type=float, default=0.5)
+    ap.add_argument("--budget-ms", type=float, default=10.0)
+    args = ap.parse_args()
+
+    rng = random.Random(2)
+    g = powerlaw_graph(args.nodes, args.avg_degree, max_parallel=args.max_parallel)
+    driver = FakeDriver(g, rtt_ms=0.5, rel_us=args.rel_us)
+    graph.set_driver(driver)
+    lexicon._LEX = None
+    lexicon.EMBED_FALLBACK = False
+
+    by_degree = sorted(g.names, key=g.degree, reverse=True)
+    hubs, leaves = by_degree[:20], by_degree[len(by_degree) // 2:]
+    print(f"graph: {args.nodes} nodes, top hub degree {g.degree(hubs[0])}, "
+          f"hub-degree cap {verify.BRIDGE_HUB_DEGREE}, expand cap {verify.BRIDGE_EXPAND}")
+
+    def run(pairs, budget_ms):
+        times, works, unsure, timeouts = [], [], 0, 0
+        for h, t in pairs:
+            t0 = time.perf_counter()
+            res = verify.verify_list([[g.names[h], "treats", g.names[t]]], budget_ms=budget_ms)[0]
+            times.append((time.perf_counter() - t0) * 1000)
+            works.append(g.cost)
+            unsure += res["status"] == "unsure"
+            timeouts += res.get("bridge_search") == "timeout"
+        return statistics.median(times), max(times), statistics.median(works), unsure, timeouts
+
+    print(f"{'pairs':>10} {'old work':>10} {'old ms':>8} {'found':>6} | {'new work':>8} {'new ms':>7} {'found':>6}")
+    for name, heads, tails in (("hub-hub", hubs, hubs), ("hub-leaf", hubs, leaves), ("leaf-leaf", leaves, leaves)):
+        pairs = _pairs(g, heads, tails, args.pairs, rng)
+        old = statistics.median(g.unbounded_cost([h], [t]) for h, t in pairs)
+        old_found = sum(g.bridge_ids([h], [t]) is not None for h, t in pairs)
+        _, _, work, unsure, _ = run(pairs, 0)
+        print(f"{name:>10} {old:>10.0f} {old * args.rel_us / 1000:>8.2f} {old_found:>3}/{len(pairs)} | {work:>8.0f} "
+              f"{work * args.rel_us / 1000:>7.2f} {len(pairs) - unsure:>3}/{len(pairs)}")
+    print("(ms = median simulated server time at --rel-us per relationship read; bridges through\n"
+          " intermediates above the hub-degree cap are skipped on purpose)")
+
+    # budget: lift the caps so hub pairs are expensive, then cap the time instead
+    verify.BRIDGE_HUB_DEGREE, verify.BRIDGE_EXPAND = 10 ** 9, 10 ** 9
+    pairs = _pairs(g, hubs, hubs, args.pairs, rng)
+    for budget in (0, args.budget_ms):
+        p50, mx, work, unsure, timeouts = run(pairs, budget)
+        label = f"budget {budget:g}ms" if budget else "no budget"
+        print(f"uncapped hub-hub, {label:>14}: p50 {p50:.2f} ms, max {mx:.2f} ms, "
+              f"{timeouts}/{len(pairs)} timed out -> unsure")
+
+
+if __name__ == "__main__":
+    main()
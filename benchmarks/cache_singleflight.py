@@ -0,0 +1,162 @@
+# benchmarks/cache_singleflight.py
+"""
+Verify / recommend result cache and single-flight (api/result_cache.py)
+against the local stand-in graph.
+
+    python benchmarks/cache_singleflight.py --requests 400 --rtt-ms 2 --concurrent 32
+
+  repeat      --requests verify calls (5 triples each) and recommend calls
+              drawn from a skewed pool of popular pairs / heads, cache off vs
+              on: p50 latency, graph round-trips, hit rate, bytes held
+  concurrent  --concurrent threads send the same verify request at once (the
+              bridge search costs --bridge-ms): graph round-trips with and
+              without single-flight
+  version     an edge is added to the graph behind a cached "unsure" pair;
+              time until verify reports it (KG_VERSION_CHECK_S=--check-s),
+              and set_driver() invalidating at once
+"""
+import os
+
+os.environ["RESULT_CACHE"] = "1"  # fakegraph turns it off for the other benchmarks
+os.environ.setdefault("KG_VERSION_CHECK_S", "0.5")
+
+import argparse  # noqa: E402
+import random  # noqa: E402
+import statistics  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+
+from fakegraph import FakeDriver, recommend_handlers, synthetic_graph, verify_handlers  # noqa: E402
+
+from flask import Flask  # noqa: E402
+
+import graph  # noqa: E402
+import lexicon  # noqa: E402
+import neo4j_graph  # noqa: E402
+import neighbors  # noqa: E402
+import recommend  # noqa: E402
+import result_cache  # noqa: E402
+import verify  # noqa: E402
+
+
+def _skewed(rng, pool, n, s=1.1):
+    weights = [1.0 / (i + 1) ** s for i in range(len(pool))]
+    return rng.choices(pool, weights=weights, k=n)
+
+
+def repeat(args, g, driver, client, rng):
+    names = list(g.names.values())
+    pairs = [[rng.choice(names), rng.choice(["treats", "inhibits", "causes"]), rng.choice(names)]
+             for _ in range(args.pool)]
+    verify_reqs = [_skewed(rng, pairs, 5) for _ in range(args.requests)]
+    heads = _skewed(rng, names[:args.pool], args.requests)
+
+    print(f"{'cache':>6} {'endpoint':>9} {'p50 ms':>8} {'round-trips':>12} {'hit rate':>9} {'items':>6} {'KB':>7}")
+    for enabled in (False, True):
+        result_cache.ENABLED = enabled
+        for c in (result_cache.VERIFY, result_cache.RECOMMEND):
+            c.clear()
+        for name, run in (("verify", lambda i: verify.verify_list(verify_reqs[i])),
+                          ("recommend", lambda i: client.post("/api/recommend", json={"head": heads[i], "k": 5}))):
+            cache = result_cache.VERIFY if name == "verify" else result_cache.RECOMMEND
+            before = cache.stats()
+            driver.round_trips, lat = 0, []
+            for i in range(args.requests):
+                t0 = time.perf_counter()
+                run(i)
+                lat.append((time.perf_counter() - t0) * 1000)
+            s = cache.stats()
+            hits = s["hits"] - before["hits"]
+            lookups = hits + s["misses"] - before["misses"] + s["coalesced"] - before["coalesced"]
+            print(f"{'on' if enabled else 'off':>6} {name:>9} {statistics.median(lat):>8.2f} "
+                  f"{driver.round_trips:>12} {hits / lookups if lookups else 0:>9.1%} {s['items']:>6} "
+                  f"{s['bytes'] / 1024:>7.1f}")
+
+
+def concurrent(args, g, driver):
+    names = list(g.names.values())
+    triples = [[names[i], "treats", names[-1 - i]] for i in range(5)]
+    # make the bridge search expensive so the requests overlap
+    two = driver.handlers[neo4j_graph.Q_TWO_BATCH]
+    driver.handlers[neo4j_graph.Q_TWO_BATCH] = lambda g_, p: (time.sleep(args.bridge_ms / 1000), two(g_, p))[1]
+    print(f"\n{args.concurrent} concurrent identical verify requests (bridge search {args.bridge_ms:.0f} ms)")
+    for enabled in (False, True):
+        result_cache.ENABLED = enabled
+        result_cache.VERIFY.clear()
+        before = result_cache.VERIFY.stats()
+        barrier = threading.Barrier(args.concurrent)
+        out, lat = [], []
+
+        def one():
+            barrier.wait()
+            t0 = time.perf_counter()
+            out.append(verify.verify_list(triples))
+            lat.append((time.perf_counter() - t0) * 1000)
+
+        driver.round_trips = 0
+        threads = [threading.Thread(target=one) for _ in range(args.concurrent)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        same = all(o == out[0] for o in out)
+        coalesced = result_cache.VERIFY.stats()["coalesced"] - before["coalesced"]
+        print(f"  cache {'on ' if enabled else 'off'}: round-trips {driver.round_trips:>4}, "
+              f"p50 {statistics.median(lat):7.1f} ms, max {max(lat):7.1f} ms, "
+              f"coalesced {coalesced}, identical results {same}")
+    driver.handlers[neo4j_graph.Q_TWO_BATCH] = two
+
+
+def version(args, g, driver):
+    result_cache.ENABLED = True
+    ids = list(g.names)
+    h, t = next((a, b) for a, b in zip(ids, reversed(ids)) if not g.direct_ids([a], [b]))
+    triple = [[g.names[h], "treats", g.names[t]]]
+    print(f"\nversion stamp (KG_VERSION_CHECK_S={graph.KG_VERSION_CHECK_S})")
+    first = verify.verify_list(triple)[0]["status"]
+    hits = result_cache.VERIFY.stats()["hits"]
+    again = verify.verify_list(triple)[0]["status"]
+    print(f"  before: {first}, again: {again} (from cache: {result_cache.VERIFY.stats()['hits'] > hits})")
+    g.add_edge(h, t, "TREATS", 99999999)
+    t0 = time.perf_counter()
+    while verify.verify_list(triple)[0]["status"] != "supported":
+        time.sleep(0.01)
+    print(f"  edge added: reported after {time.perf_counter() - t0:.2f} s "
+          f"(invalidations {result_cache.VERIFY.stats()['invalidations']})")
+    g.edges.pop()
+    g.adj[h].pop()
+    g.adj[t].pop()
+    g._mult.pop(h, None)
+    g._mult.pop(t, None)
+    graph.set_driver(driver)  # e.g. a reloaded graph: no wait
+    print(f"  edge removed + set_driver: {verify.verify_list(triple)[0]['status']} immediately")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=2000)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--pool", type=int, default=200, help="distinct popular pairs / heads")
+    ap.add_argument("--rtt-ms", type=float, default=2.0)
+    ap.add_argument("--concurrent", type=int, default=32)
+    ap.add_argument("--bridge-ms", type=float, default=50)
+    args = ap.parse_args()
+
+    lexicon.EMBED_FALLBACK = False
+    neighbors._TABLE = None
+    neighbors.RELOAD_CHECK_S = 0
+    rng = random.Random(4)
+    g = synthetic_graph(args.nodes)
+    driver = FakeDriver(g, rtt_ms=args.rtt_ms, handlers={**verify_handlers(), **recommend_handlers()})
+    graph.set_driver(driver)
+    app = Flask(__name__)
+    app.register_blueprint(recommend.recommend_bp)
+
+    repeat(args, g, driver, app.test_client(), rng)
+    concurrent(args, g, driver)
+    version(args, g, driver)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+# benchmarks/chat_concurrency.py
+"""
+Concurrent /api/chat streams per server process: gunicorn with sync
+threads (api/gunicorn.conf.py, wsgi:app) against the ASGI app (api/asgi.py
+under uvicorn).
+
+    python benchmarks/chat_concurrency.py --streams 8 32 128 --stream-s 5 --threads 8
+
+Each server is one process on a synthetic KG (CSR backend, no Neo4j) and the
+fake OpenAI server, whose answers take --stream-s seconds to stream. For
+every level in --streams, that many chats start at once; while they run,
+/api/recommend is probed one request at a time. Reported per level:
+  ttfb p50/p95    time to the first streamed byte
+  done s          until the last stream finished
+  recommend p95   graph endpoint latency while the streams are open
+
+With sync threads, streams past --threads wait for a free thread, and so do
+the graph requests. The ASGI app holds streams on the event loop and serves
+graph requests from its own pool.
+"""
+import argparse
+import http.client
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from fake_openai import CHAT_TEXT, FakeOpenAI
+from fakegraph import export, powerlaw_graph
+from prefork_memory import _free_port, _write_embeddings
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+
+
+def _post(port, path, body, headers=None, timeout=120):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json", **(headers or {})})
+    return conn, conn.getresponse()
+
+
+def _chat(port, out):
+    t0 = time.perf_counter()
+    try:
+        conn, resp = _post(port, "/api/chat", {"messages": [{"role": "user", "content": "omega-3?"}]},
+                           {"x-openai-key": "fake"})
+        resp.read(1)
+        ttfb = time.perf_counter() - t0
+        resp.read()
+        conn.close()
+        out.append((ttfb, time.perf_counter() - t0))
+    except OSError:
+        out.append(None)
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+def level(port, n, heads, probe_s):
+    results = []
+    threads = [threading.Thread(target=_chat, args=(port, results)) for _ in range(n)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    probes, i = [], 0
+    time.sleep(0.2)
+    while time.perf_counter() - t0 < probe_s and any(t.is_alive() for t in threads):
+        p0 = time.perf_counter()
+        try:
+            conn, resp = _post(port, "/api/recommend", {"head": heads[i % len(heads)], "k": 5}, timeout=60)
+            resp.read()
+            conn.close()
+            probes.append(time.perf_counter() - p0)
+        except OSError:
+            pass
+        i += 1
+    for t in threads:
+        t.join()
+    ok = [r for r in results if r]
+    return {"ok": len(ok), "ttfb_p50": _pct([r[0] for r in ok], 0.5), "ttfb_p95": _pct([r[0] for r in ok], 0.95),
+            "done_s": time.perf_counter() - t0, "rec_p50": _pct(probes, 0.5), "rec_p95": _pct(probes, 0.95),
+            "probes": len(probes)}
+
+
+def _wait_up(proc, port, timeout=120):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/_ping")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--streams", type=int, nargs="+", default=[8, 32, 128])
+    ap.add_argument("--stream-s", type=float, default=5.0, help="length of one fake answer")
+    ap.add_argument("--first-token-ms", type=float, default=300)
+    ap.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    ap.add_argument("--nodes", type=int, default=5000)
+    ap.add_argument("--servers", nargs="+", choices=["gthread", "asgi"], default=["gthread", "asgi"])
+    args = ap.parse_args()
+
+    chunks = -(-len(CHAT_TEXT) // 4)
+    server = FakeOpenAI(first_token_ms=args.first_token_ms,
+                        token_ms=max(0.0, (args.stream_s * 1000 - args.first_token_ms) / chunks)).start()
+    tmp = tempfile.mkdtemp(prefix="knownet-chat-")
+    g = powerlaw_graph(args.nodes, 8)
+    heads = [g.names[n] for n in list(g.names)[:200]]
+    _write_embeddings(2000, 64, os.path.join(tmp, "embeddings.parquet"))
+    env = {**os.environ,
+           "GRAPH_BACKEND": "csr",
+           "GRAPH_CSR_PATH": export(g, os.path.join(tmp, "kg")),
+           "EMBEDDINGS_PATH": os.path.join(tmp, "embeddings.parquet"),
+           "NEIGHBORS_PATH": os.path.join(tmp, "neighbors.npz"),
+           "EMBED_CACHE_PATH": "",
+           "OPENAI_BASE_URL": server.base_url,
+           "OPENAI_API_KEY": "fake",
+           "OPENAI_CHAT_CONCURRENCY": "0",  # one key for every stream: measure the server, not the key limit
+           "GUNICORN_WORKERS": "1",
+           "GUNICORN_THREADS": str(args.threads)}
+    commands = {
+        "gthread": [sys.executable, "-m", "gunicorn", "-c", str(API_DIR / "gunicorn.conf.py"), "wsgi:app"],
+        "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--app-dir", str(API_DIR), "--host", "127.0.0.1",
+                 "--log-level", "warning", "--backlog", "1024"],
+    }
+
+    print(f"one process each; answers stream for {args.stream_s} s; gunicorn threads={args.threads}\n")
+    print(f"{'server':>8} {'streams':>8} {'ok':>5} {'ttfb p50':>9} {'ttfb p95':>9} {'done s':>7} "
+          f"{'recommend p50 ms':>17} {'p95 ms':>8}")
+    for name in args.servers:
+        port = _free_port()
+        cmd = commands[name] + (["--port", str(port)] if name == "asgi" else [])
+        proc = subprocess.Popen(cmd, env={**env, "PORT": str(port)}, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        try:
+            _wait_up(proc, port)
+            _chat(port, [])  # first-use imports and client creation
+            for n in args.streams:
+                r = level(port, n, heads, probe_s=args.stream_s)
+                print(f"{name:>8} {n:>8} {r['ok']:>5} {r['ttfb_p50']:>9.2f} {r['ttfb_p95']:>9.2f} "
+                      f"{r['done_s']:>7.1f} {r['rec_p50'] * 1000:>17.1f} {r['rec_p95'] * 1000:>8.1f}")
+        finally:
+            proc.terminate()
+            proc.wait(30)
+    server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
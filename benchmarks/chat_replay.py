@@ -0,0 +1,127 @@
+# benchmarks/chat_replay.py
+"""
+Replay recorded /api/chat streams through annotations.stream_with_verification.
+
+    python benchmarks/chat_replay.py                      # all of benchmarks/streams/*.json
+    python benchmarks/chat_replay.py --check              # exit 1 on any mismatch
+    python benchmarks/chat_replay.py --events omega3.json # print the SSE events
+
+A recording is {"deltas": [...], "triples": [[h, r, t], ...]}: the text chunks
+exactly as GPT-4o streamed them and the triples the answer contains. The
+verifier is a stub and runs inline, so the event sequence is deterministic.
+--check also re-chunks each answer at every size from 1 to --max-chunk
+characters to make sure no annotation is lost at a delta boundary.
+"""
+from concurrent.futures import Future
+import argparse
+import json
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+from annotations import AnnotationParser, stream_with_verification  # noqa: E402
+
+STREAMS = Path(__file__).resolve().parent / "streams"
+
+
+class InlineExecutor:
+    """Runs submitted work immediately so verify events follow their triples."""
+
+    def submit(self, fn, *args):
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+
+def stub_verify(triples):
+    return [{"triple": t, "status": "replayed"} for t in triples]
+
+
+def parse_events(stream):
+    events = []
+    for block in "".join(stream).split("\n\n"):
+        if block:
+            head, data = block.split("\n", 1)
+            events.append((head[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def triples_for(deltas):
+    parser = AnnotationParser()
+    out = []
+    for d in deltas:
+        out += parser.feed(d)["triples"]
+    return out
+
+
+def replay(rec):
+    events = parse_events(stream_with_verification(iter(rec["deltas"]), stub_verify, InlineExecutor()))
+    streamed = [t for name, data in events if name == "triples" for t in data["triples"]]
+    verified = [r["triple"] for name, data in events if name == "verify" for r in data["results"]]
+    text = "".join(data["text"] for name, data in events if name == "delta")
+    problems = []
+    if text != "".join(rec["deltas"]):
+        problems.append("delta events do not reproduce the answer text")
+    if streamed != rec["triples"]:
+        problems.append(f"triples {streamed} != expected {rec['triples']}")
+    if verified != streamed:
+        problems.append("verify events do not cover the streamed triples")
+    if events[-1][0] != "done":
+        problems.append("stream does not end with a done event")
+    return events, problems
+
+
+def rechunk_problems(rec, max_chunk):
+    text = "".join(rec["deltas"])
+    problems = []
+    for size in range(1, max_chunk + 1):
+        got = triples_for(text[i:i + size] for i in range(0, len(text), size))
+        if got != rec["triples"]:
+            problems.append(f"chunk size {size}: got {got}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("recordings", nargs="*", help="file names under benchmarks/streams (default: all)")
+    ap.add_argument("--check", action="store_true")
+    ap.add_argument("--events", action="store_true", help="print every SSE event")
+    ap.add_argument("--max-chunk", type=int, default=16)
+    args = ap.parse_args()
+
+    paths = [STREAMS / r for r in args.recordings] or sorted(STREAMS.glob("*.json"))
+    failed = 0
+    for path in paths:
+        rec = json.loads(path.read_text())
+        events, problems = replay(rec)
+        if args.check:
+            problems += rechunk_problems(rec, args.max_chunk)
+        # how far into the text the first verification result is sent
+        chars, first_verify = 0, None
+        for name, data in events:
+            if name == "delta":
+                chars += len(data["text"])
+            elif name == "verify" and first_verify is None:
+                first_verify = chars
+        total = len("".join(rec["deltas"]))
+        at = f"{first_verify / total:.0%}" if first_verify is not None else "-"
+        print(f"{path.name:<24} deltas={len(rec['deltas']):<4} triples={len(rec['triples']):<3} "
+              f"first verify at {at:>4} of text  {'FAIL' if problems else 'ok'}")
+        for p in problems:
+            print(f"    {p}")
+        if args.events:
+            for name, data in events:
+                print(f"    {name:<8} {json.dumps(data)}")
+        failed += bool(problems)
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
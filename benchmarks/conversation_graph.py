@@ -0,0 +1,120 @@
+# benchmarks/conversation_graph.py
+"""
+/api/data cost per turn as a conversation grows: rebuilding and re-sending the
+whole graph every turn vs merging only the new triples and sending the diff.
+
+    python benchmarks/conversation_graph.py --turns 200 --per-turn 12
+    python benchmarks/conversation_graph.py --conversations 2000 --max-items 50000
+
+Verification is a stub that sleeps --verify-us per triple, standing in for the
+KG lookups, so the numbers show how much work each strategy repeats. The
+second form fills the store past its budget and reports eviction and memory.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+import conversations  # noqa: E402
+
+
+def make_verify(cost_s):
+    def verify(triples):
+        if cost_s:
+            time.sleep(cost_s * len(triples))
+        return [{"rel_norm": r.upper().replace(" ", "_"), "status": "supported", "count": 1,
+                 "evidence": {"count": 1, "cursor": f"{h}|{r}|{t}"},
+                 "resolved": {"head": h, "tail": t}} for h, r, t in triples]
+    return verify
+
+
+def turns(n_turns, per_turn, vocab, rng):
+    """Each turn mentions some earlier entities again, like a real follow-up question."""
+    names = [f"entity {i}" for i in range(vocab)]
+    rels = ["treats", "prevents", "affects", "interacts with", "causes"]
+    history = []
+    for _ in range(n_turns):
+        turn = []
+        for _ in range(per_turn):
+            if history and rng.random() < 0.3:
+                turn.append(list(rng.choice(history)))  # repeated triple
+            else:
+                turn.append([rng.choice(names), rng.choice(rels), rng.choice(names)])
+        history += turn
+        yield turn
+
+
+def scaling(args):
+    rng = random.Random(3)
+    verify = make_verify(args.verify_us / 1e6)
+    conversations._STORE = conversations.ConversationStore()
+    report_at = {t for t in (1, 10, 25, 50, 100, 200, 400, 800) if t <= args.turns} | {args.turns}
+    all_triples = []
+    print(f"{'turn':>5} {'nodes':>6} {'edges':>6} | {'rebuild ms':>10} {'bytes':>9} | {'diff ms':>8} {'bytes':>7}")
+    for i, turn in enumerate(turns(args.turns, args.per_turn, args.vocab, rng), 1):
+        all_triples += turn
+        # rebuild: fresh graph from every triple so far, whole graph in the response
+        t0 = time.perf_counter()
+        conversations._STORE.drop("rebuild")
+        full, names, _ = conversations.update("rebuild", "new_conversation", all_triples, verify)
+        rebuild_body = json.dumps({"vis_res": full, "node_name_mapping": names})
+        rebuild_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        kind = "new_conversation" if i == 1 else "continue_conversation"
+        vis, names, diff = conversations.update("incremental", kind, turn, verify)
+        diff_body = json.dumps({"vis_res": vis, "node_name_mapping": names, "diff": diff})
+        diff_ms = (time.perf_counter() - t0) * 1000
+
+        if i in report_at:
+            g, _ = conversations._STORE.get("incremental")
+            print(f"{i:>5} {len(g.nodes):>6} {len(g.edges):>6} | {rebuild_ms:>10.2f} {len(rebuild_body):>9} "
+                  f"| {diff_ms:>8.2f} {len(diff_body):>7}")
+    conversations._STORE.drop("rebuild")
+    assert conversations._STORE.get("incremental")[0].full() == conversations.update(
+        "check", "new_conversation", all_triples, verify)[0], "incremental graph differs from rebuild"
+
+
+def eviction(args):
+    rng = random.Random(5)
+    verify = make_verify(0)
+    store = conversations._STORE = conversations.ConversationStore(args.max_conversations, args.max_items)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for c in range(args.conversations):
+        for i, turn in enumerate(turns(args.turns, args.per_turn, args.vocab, rng)):
+            conversations.update(f"c{c}", "new_conversation" if i == 0 else "continue_conversation", turn, verify)
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    s = store.stats()
+    print(f"conversations={args.conversations} kept={s['conversations']} evicted={s['evicted']} "
+          f"items={s['items']} (budget {s['max_items']})")
+    print(f"memory now {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB, "
+          f"{elapsed / args.conversations * 1000:.2f} ms per conversation")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--turns", type=int, default=200)
+    ap.add_argument("--per-turn", type=int, default=12)
+    ap.add_argument("--vocab", type=int, default=800)
+    ap.add_argument("--verify-us", type=float, default=50.0)
+    ap.add_argument("--conversations", type=int, default=0, help="run the eviction test with this many")
+    ap.add_argument("--max-conversations", type=int, default=conversations.MAX_CONVERSATIONS)
+    ap.add_argument("--max-items", type=int, default=conversations.MAX_ITEMS)
+    args = ap.parse_args()
+    if args.conversations:
+        eviction(args)
+    else:
+        scaling(args)
+
+
+if __name__ == "__main__":
+    main()
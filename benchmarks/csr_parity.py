@@ -0,0 +1,170 @@
+# benchmarks/csr_parity.py
+"""
+Parity and latency of the embedded CSR backend (api/csr_graph.py) against
+the graph it replaces.
+
+    python benchmarks/csr_parity.py --nodes 20000 --requests 200 --rtt-ms 1
+    python benchmarks/csr_parity.py --neo4j --export kg_export/
+
+By default the reference is the Cypher stand-in (fakegraph.py) with a
+simulated round-trip. The synthetic KG is exported to parquet and loaded
+into CSR arrays through the same path a real export takes. With --neo4j the
+reference is the live database at NEO4J_URI, and the CSR side is built from
+--export (see `python api/csr_graph.py export`).
+
+The same requests go to /api/verify (batch and per-triple), /api/recommend
+(single and batch) and /api/evidence (every page), with and without the
+lexicon. Every response must be identical. Evidence is compared as the paged
+PubMed ids, because relationship ids inside `next` cursors are backend
+specific. Exits 1 on any mismatch.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from fakegraph import FakeDriver, export, powerlaw_graph, recommend_handlers, verify_handlers
+
+from flask import Flask
+
+import csr_graph
+import evidence
+import graph
+import lexicon
+import neighbors
+import recommend
+import verify
+
+
+def _requests(g, n, rng):
+    """[(scenario, body)] drawn from the CSR graph (names, real edges, relation types)."""
+    nodes = list(range(len(g.node_ids)))
+    with_edges = [i for i in nodes if g.degree[i]]
+    rel_types = g.rel_types
+
+    def edge():
+        h = rng.choice(with_edges)
+        j = rng.randrange(g.indptr[h], g.indptr[h + 1])
+        return g.name(h), rel_types[g.hrel[j]], g.name(int(g.nbr[j]))
+
+    def triple():
+        if rng.random() < 0.5:
+            h, rel, t = edge()
+            return [h, rel.lower().replace("_", " ") if rng.random() < 0.5 else rel, t]
+        return [g.name(rng.choice(nodes)), rng.choice(rel_types), g.name(rng.choice(nodes))]
+
+    def head():
+        spec = {"head": g.name(rng.choice(with_edges)), "k": rng.choice([3, 5, 8])}
+        if rng.random() < 0.3:
+            spec["whitelist"] = rng.sample(rel_types, min(3, len(rel_types)))
+        if rng.random() < 0.3:
+            spec["exclude"] = [g.name(rng.choice(nodes)) for _ in range(2)]
+        return spec
+
+    out = []
+    for i in range(n):
+        kind = i % 5
+        if kind == 0:
+            out.append(("verify", {"triples": [triple() for _ in range(10)]}))
+        elif kind == 1:
+            out.append(("verify_per_triple", {"triples": [triple() for _ in range(4)], "mode": "per_triple"}))
+        elif kind == 2:
+            out.append(("recommend", head()))
+        elif kind == 3:
+            out.append(("recommend_batch", {"heads": [head() for _ in range(5)]}))
+        else:
+            h, rel, t = edge()
+            out.append(("evidence", {"head": h, "relation": rel, "tail": t, "limit": 3}))
+    return out
+
+
+def _call(client, scenario, body):
+    """Response JSON, with evidence pages followed and flattened to their ids."""
+    if scenario == "evidence":
+        papers, resp = [], client.post("/api/evidence", json=body).get_json()
+        while True:
+            papers += resp.get("papers", [])
+            if not resp.get("next"):
+                return {"papers": papers, "error": resp.get("error")}
+            resp = client.get("/api/evidence", query_string={"cursor": resp["next"], "limit": 3}).get_json()
+    path = "/api/verify" if scenario.startswith("verify") else "/api/recommend"
+    return client.post(path, json=body).get_json()
+
+
+def run(app, driver, reqs, use_lexicon):
+    graph.set_driver(driver)
+    lexicon._LEX = None
+    if use_lexicon:
+        lexicon.build()
+    client = app.test_client()
+    out, times = [], {}
+    for scenario, body in reqs:
+        t0 = time.perf_counter()
+        out.append(_call(client, scenario, body))
+        times.setdefault(scenario, []).append((time.perf_counter() - t0) * 1000)
+    return out, times
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=20000)
+    ap.add_argument("--avg-degree", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--rtt-ms", type=float, default=1.0, help="stand-in round-trip")
+    ap.add_argument("--neo4j", action="store_true", help="compare against the live database instead")
+    ap.add_argument("--export", default=None, help="KG export directory for the CSR side (--neo4j)")
+    args = ap.parse_args()
+
+    lexicon.EMBED_FALLBACK = False  # names come from the graph; never call OpenAI here
+    neighbors._TABLE = None
+    neighbors.RELOAD_CHECK_S = 0
+    if args.neo4j:
+        if not args.export:
+            ap.error("--neo4j needs --export (python api/csr_graph.py export --out DIR)")
+        reference = ("neo4j", graph.get_driver())
+        src = args.export
+    else:
+        fake = powerlaw_graph(args.nodes, args.avg_degree, max_parallel=4)
+        src = export(fake, tempfile.mkdtemp(prefix="knownet-kg-"))
+        reference = ("stand-in", FakeDriver(fake, rtt_ms=args.rtt_ms,
+                                            handlers={**verify_handlers(), **recommend_handlers()}))
+
+    t0 = time.perf_counter()
+    npz = f"{tempfile.mkdtemp(prefix='knownet-csr-')}/kg.csr.npz"
+    meta = csr_graph.build(src, npz)
+    g = csr_graph.load(npz)
+    print(f"csr: {meta['nodes']} nodes, {meta['edges']} relationships, {len(g.rel_types)} types, "
+          f"{g.nbytes / 1e6:.1f} MB, build {meta['build_s']} s, load {g.meta['load_s']} s "
+          f"({time.perf_counter() - t0:.1f} s total)")
+
+    app = Flask(__name__)
+    for bp in (verify.verify_bp, recommend.recommend_bp, evidence.evidence_bp):
+        app.register_blueprint(bp)
+    reqs = _requests(g, args.requests, random.Random(5))
+    backends = [reference, ("csr", csr_graph.CSRDriver(g))]
+
+    mismatches = 0
+    print(f"\n{'lexicon':>8} {'scenario':>18} " + " ".join(f"{name + ' p50':>13}" for name, _ in backends) + f" {'speedup':>8}")
+    for use_lexicon in (False, True):
+        results = [run(app, drv, reqs, use_lexicon) for _, drv in backends]
+        (ref_out, ref_t), (csr_out, csr_t) = results
+        for (scenario, body), a, b in zip(reqs, ref_out, csr_out):
+            if a != b:
+                mismatches += 1
+                if mismatches <= 3:
+                    print(f"MISMATCH ({scenario}, lexicon={use_lexicon}): {json.dumps(body)[:200]}\n"
+                          f"  {backends[0][0]}: {json.dumps(a)[:400]}\n  csr: {json.dumps(b)[:400]}")
+        for scenario in ref_t:
+            p_ref, p_csr = statistics.median(ref_t[scenario]), statistics.median(csr_t[scenario])
+            print(f"{'on' if use_lexicon else 'off':>8} {scenario:>18} {p_ref:>13.2f} {p_csr:>13.2f} {p_ref / p_csr:>7.1f}x")
+
+    total = 2 * len(reqs)
+    print(f"\nparity: {total - mismatches}/{total} responses identical")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
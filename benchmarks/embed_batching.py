@@ -0,0 +1,68 @@
+# benchmarks/embed_batching.py
+"""
+Throughput of the embedding micro-batcher against the fake OpenAI server.
+
+    python benchmarks/embed_batching.py --threads 32 --requests 400 --latency-ms 80
+
+Each worker thread sends small embedding requests (as concurrent /api/verify
+or entity-resolution calls would). Compares direct calls with the
+EmbeddingDispatcher at a few window sizes, and checks every caller got the
+vectors for its own texts.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+from openai import OpenAI
+
+from fake_openai import FakeOpenAI, fake_vector
+import fakegraph  # noqa: F401  (puts api/ on sys.path)
+from embed_batcher import EmbeddingDispatcher
+
+
+def run(server, client, window_ms, threads, requests, per_request):
+    server.calls = server.inputs = 0
+    disp = EmbeddingDispatcher(window_ms=window_ms)
+    rng = random.Random(window_ms)
+
+    def fetch(texts):
+        resp = client.embeddings.create(input=texts, model="text-embedding-3-small")
+        return [d.embedding for d in resp.data]
+
+    def one(i):
+        texts = [f"entity {i}-{j}-{rng.random()}" for j in range(per_request)]
+        t0 = time.perf_counter()
+        vecs = disp.embed(texts, "text-embedding-3-small", fetch)
+        ms = (time.perf_counter() - t0) * 1000
+        assert all(abs(v[0] - fake_vector(t, server.dim)[0]) < 1e-6 for t, v in zip(texts, vecs))
+        return ms
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as ex:
+        lat = sorted(ex.map(one, range(requests)))
+    wall = time.perf_counter() - t0
+    return requests / wall, lat[len(lat) // 2], lat[int(len(lat) * 0.95)], server.calls, disp.stats()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--per-request", type=int, default=3)
+    ap.add_argument("--latency-ms", type=float, default=80)
+    ap.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 20])
+    args = ap.parse_args()
+
+    server = FakeOpenAI(latency_ms=args.latency_ms, per_input_ms=0.02).start()
+    client = OpenAI(api_key="fake", base_url=server.base_url, max_retries=0)
+    print(f"{'window ms':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'API calls':>10} {'avg batch':>10}")
+    for w in args.windows:
+        rps, p50, p95, calls, st = run(server, client, w, args.threads, args.requests, args.per_request)
+        avg = st.get("avg_batch_inputs") or args.per_request
+        print(f"{w:>9g} {rps:>8.1f} {p50:>8.1f} {p95:>8.1f} {calls:>10} {avg:>10}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
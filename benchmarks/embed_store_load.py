@@ -0,0 +1,139 @@
+# benchmarks/embed_store_load.py
+"""
+Cold start from the parquet vs. the memory-mapped embedding store
+(api/embed_store.py), plus a delta segment.
+
+    python benchmarks/embed_store_load.py --rows 200000 --dim 256 --delta 5000
+
+On a synthetic parquet, each configuration is loaded in a fresh process
+(embeds.load(), then resolve_entities on --queries noisy copies of matrix
+rows) and reports:
+  load s      embeds.load() wall time
+  rss MB      resident set after the load and the queries
+  parity      top-5 names identical to the parquet load's, per query
+
+Then --delta rows (half new names, half already in the store) are appended
+as a delta segment; the reloaded store must resolve every new row to its own
+name, also through an IVF index trained before the append. The page cache is
+warm in every run (the files were just written), so "store" is the
+best case for a restart and parquet the best case for its decode.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import fakegraph  # noqa: F401  (puts api/ on sys.path)
+from prefork_memory import _write_embeddings
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def child(queries_path, k):
+    import embeds
+    qs = np.load(queries_path)
+    t0 = time.perf_counter()
+    ok = embeds.load()
+    load_s = time.perf_counter() - t0
+    res = embeds.resolve_entities([str(i) for i in range(len(qs))], k=k, threshold="0",
+                                  embed_fn=lambda names, model=None: qs[[int(n) for n in names]])
+    st = embeds.status()
+    print(json.dumps({"ok": ok, "load_s": load_s, "rss_mb": _rss_mb(), "rows": st["rows"],
+                      "source": st.get("source"), "index": st["index"]["kind"],
+                      "top": [[c["name"] for c in r["candidates"]] for r in res]}))
+
+
+def run(env, queries_path, k):
+    out = subprocess.run([sys.executable, __file__, "--child", queries_path, "--k", str(k)],
+                         env={**os.environ, **env}, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _queries(mat_rows, path, rng, noise=0.05):
+    q = mat_rows + noise * rng.standard_normal(mat_rows.shape, dtype=np.float32)
+    np.save(path, q.astype(np.float32))
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--delta", type=int, default=5000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.child, args.k)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    import ann
+    import embed_store
+    import embeds
+
+    tmp = tempfile.mkdtemp(prefix="knownet-store-")
+    parquet = os.path.join(tmp, "embeddings.parquet")
+    _write_embeddings(args.rows, args.dim, parquet)
+    base_env = {"EMBEDDINGS_PATH": parquet, "EMBEDDINGS_RELOAD_CHECK_S": "0", "EMBEDDINGS_INDEX": "exact",
+                "EMBED_CACHE_PATH": ""}
+    rng = np.random.default_rng(1)
+    names, mat = embeds._read_matrix(parquet)
+    sample = rng.choice(args.rows, args.queries, replace=False)
+    queries = _queries(mat[sample], os.path.join(tmp, "q.npy"), rng)
+
+    t0 = time.perf_counter()
+    embed_store.build(parquet, log=lambda *_: None)
+    build_s = time.perf_counter() - t0
+    size_mb = os.path.getsize(embed_store.store_path(parquet)) / 2**20
+    print(f"{args.rows} x {args.dim}; parquet {os.path.getsize(parquet) / 2**20:.0f} MB, "
+          f"store {size_mb:.0f} MB built in {build_s:.1f} s\n")
+
+    runs = {
+        "parquet": run({**base_env, "EMBEDDINGS_USE_STORE": "0"}, queries, args.k),
+        "store": run(base_env, queries, args.k),
+        "store int8": run({**base_env, "EMBEDDINGS_STORAGE": "int8"}, queries, args.k),
+    }
+    ref = runs["parquet"]["top"]
+    print(f"{'load':<12} {'source':>8} {'load s':>8} {'rss MB':>8} {'parity':>8}")
+    for name, r in runs.items():
+        same = sum(a == b for a, b in zip(r["top"], ref))
+        print(f"{name:<12} {r['source']:>8} {r['load_s']:>8.3f} {r['rss_mb']:>8.0f} {same:>4}/{len(ref)}")
+
+    # delta: half new concepts, half names the store already has
+    ivf = ann.IVFIndex.train(np.asarray(mat / np.linalg.norm(mat, axis=1, keepdims=True)), iters=5)
+    ivf.save(ann.index_path(parquet), args.rows, os.path.getmtime(parquet))
+    new = rng.standard_normal((args.delta, args.dim), dtype=np.float32)
+    new_names = [f"new concept {i}" if i % 2 == 0 else names.iloc[i] for i in range(args.delta)]
+    delta = os.path.join(tmp, "delta.parquet")
+    pq.write_table(pa.table({"Name": new_names,
+                             "embedding": pa.FixedSizeListArray.from_arrays(pa.array(new.reshape(-1)), args.dim)}),
+                   delta)
+    t0 = time.perf_counter()
+    header = embed_store.append(delta, embed_store.store_path(parquet), log=lambda *_: None)
+    append_s = time.perf_counter() - t0
+    fresh = np.arange(0, args.delta, 2)[:args.queries]
+    dq = _queries(new[fresh], os.path.join(tmp, "dq.npy"), rng, noise=0.0)
+    print(f"\nappended {header['rows']} of {args.delta} delta rows in {append_s:.2f} s (base untouched)")
+    for mode in ("exact", "ivf"):
+        r = run({**base_env, "EMBEDDINGS_INDEX": mode}, dq, 2)
+        found = sum(t[0] == f"new concept {i}" for t, i in zip(r["top"], fresh))
+        print(f"  {mode:<6} rows {r['rows']}, load {r['load_s']:.3f} s, new concepts resolved {found}/{len(fresh)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
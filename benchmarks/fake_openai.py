@@ -0,0 +1,182 @@
+# benchmarks/fake_openai.py
+"""
+Local stand-in for the OpenAI HTTP API: embeddings and streamed chat.
+
+    server = FakeOpenAI(latency_ms=80, per_input_ms=0.05).start()
+    client = OpenAI(api_key="fake", base_url=server.base_url)
+
+Vectors are deterministic per text (seeded from a hash) and unit-norm, so
+callers can check that every response went back to the right request.
+`server.calls` / `server.inputs` count what actually hit the "network".
+
+Chat completions replay `chat_text` (default: a qaPrompt-style annotated
+answer) as `stream=True` chunks of `chunk_chars` characters: the first one
+after `first_token_ms`, then one every `token_ms`.
+
+With `limit_rps` set, each API key (the bearer token) may make that many
+requests per second (a bucket holding one second of them); past it the
+server answers 429 with retry-after / retry-after-ms, like the real API.
+`server.rejected` counts those.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import threading
+import time
+
+import numpy as np
+
+
+def fake_vector(text, dim=64):
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+CHAT_TEXT = (
+    "[Omega-3 fatty acids|Dietary Supplement]($N1) are widely studied for heart health. "
+    "Trials show they can [reduce]($R1, $N1, $N2) [triglycerides|Physiology]($N2) and may "
+    "[prevent]($R2, $N1, $N3) [cardiovascular disease|Disease]($N3) in high-risk adults. "
+    "Combined with [statins|Drug]($N4) they do not appear to [interact with]($R3, $N4, $N1) "
+    "each other in a clinically relevant way. || [Omega-3 fatty acids]($N1)"
+)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # many concurrent clients in the benchmarks
+
+
+class FakeOpenAI:
+    def __init__(self, latency_ms=50.0, per_input_ms=0.0, dim=64, host="127.0.0.1", port=0,
+                 first_token_ms=300.0, token_ms=20.0, chat_text=None, chunk_chars=4, limit_rps=None):
+        self.latency = latency_ms / 1000.0
+        self.per_input = per_input_ms / 1000.0
+        self.dim = dim
+        self.first_token = first_token_ms / 1000.0
+        self.token = token_ms / 1000.0
+        self.chat_text = chat_text or CHAT_TEXT
+        self.chunk_chars = chunk_chars
+        self.limit_rps = limit_rps
+        self.chats = 0
+        self.calls = 0
+        self.inputs = 0
+        self.rejected = 0
+        self._buckets = {}  # bearer token -> [level, last refill]
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._handler())
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, code, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                wait = fake._limited(self.headers.get("Authorization") or "")
+                if wait:
+                    body = json.dumps({"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                                 "code": "rate_limit_exceeded"}}).encode()
+                    self.send_response(429)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("retry-after", str(max(1, round(wait))))
+                    self.send_header("retry-after-ms", str(int(wait * 1000)))
+                    self.end_headers()
+                    return self.wfile.write(body)
+                if self.path.endswith("/embeddings"):
+                    return fake.embeddings(self, req)
+                if self.path.endswith("/chat/completions"):
+                    return fake.chat(self, req)
+                self._json(404, {"error": {"message": f"no fake route for {self.path}"}})
+
+        return Handler
+
+    def _limited(self, key):
+        """0 if this request fits the key's rate, else the seconds until one would."""
+        if not self.limit_rps:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.setdefault(key, [float(self.limit_rps), now])
+            b[0] = min(float(self.limit_rps), b[0] + (now - b[1]) * self.limit_rps)
+            b[1] = now
+            if b[0] >= 1:
+                b[0] -= 1
+                return 0
+            self.rejected += 1
+            return (1 - b[0]) / self.limit_rps
+
+    def embeddings(self, h, req):
+        inputs = req.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self._lock:
+            self.calls += 1
+            self.inputs += len(inputs)
+        time.sleep(self.latency + self.per_input * len(inputs))
+        h._json(200, {
+            "object": "list",
+            "model": req.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_vector(t, self.dim)}
+                     for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        })
+
+    def chat(self, h, req):
+        with self._lock:
+            self.chats += 1
+        text, step = self.chat_text, self.chunk_chars
+        if not req.get("stream"):
+            time.sleep(self.first_token + self.token * (len(text) // step))
+            return h._json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": req.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+            })
+        h.send_response(200)
+        h.send_header("Content-Type", "text/event-stream")
+        h.send_header("Connection", "close")  # no length: the stream ends when the socket does
+        h.end_headers()
+        h.close_connection = True
+        time.sleep(self.first_token)
+        try:
+            for i in range(0, len(text), step):
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": req.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}],
+                }
+                h.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                h.wfile.flush()
+                if i + step < len(text):
+                    time.sleep(self.token)
+            h.wfile.write(b"data: [DONE]\n\n")
+            h.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading (e.g. a time-to-first-byte probe)
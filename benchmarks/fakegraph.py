@@ -0,0 +1,365 @@
+# benchmarks/fakegraph.py
+"""
+Local stand-in for the Neo4j KG used by the benchmarks.
+
+FakeDriver mimics the tiny slice of the neo4j driver API that
+neo4j_graph.Neo4jTx uses (driver.session() -> session.run(query, **params) ->
+.data() / .single()). Each neo4j_graph.Q_* query is mapped to a Python handler
+that computes the same rows against an in-memory graph, and every run() sleeps for a fixed
+round-trip time so the number of Bolt round-trips shows up in latency.
+"""
+from collections import Counter, defaultdict
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+from kg_index import normalize_name  # noqa: E402
+
+# the benchmarks time the query paths, which api/result_cache.py would skip for
+# repeated lookups; benchmarks/cache_singleflight.py measures the cache itself
+os.environ.setdefault("RESULT_CACHE", "0")
+
+REL_TYPES = [
+    "INTERACTS_WITH", "AFFECTS", "TREATS", "PREVENTS", "INHIBITS", "STIMULATES",
+    "ASSOCIATED_WITH", "CAUSES", "AUGMENTS", "PRODUCES", "COEXISTS_WITH",
+]
+
+
+class FakeGraph:
+    """Undirected multigraph: node id -> name, plus (h, t, type, pmid) edges."""
+
+    def __init__(self):
+        self.names = {}                 # id -> Name
+        self.by_name = defaultdict(list)  # name_key -> [id]
+        self.adj = defaultdict(list)    # id -> [(other_id, type, pmid)]
+        self.edges = []                 # (h, t, type, pmid) in insertion order
+        self._mult = {}
+        self.cost = 0                   # relationships read by handlers (see FakeDriver.rel_us)
+
+    def add_node(self, nid, name):
+        self.names[nid] = name
+        self.by_name[normalize_name(name)].append(nid)
+
+    def add_edge(self, h, t, rtype, pmid):
+        self._mult.pop(h, None)
+        self._mult.pop(t, None)
+        self.edges.append((h, t, rtype, pmid))
+        self.adj[h].append((t, rtype, pmid))
+        if h != t:
+            self.adj[t].append((h, rtype, pmid))
+
+    def ids(self, key):
+        return self.by_name.get(key, [])
+
+    # --- query semantics (arguments are name keys) -----------------------
+    def direct(self, hkey, tkey):
+        return self.direct_ids(self.ids(hkey), self.ids(tkey))
+
+    def direct_ids(self, hids, tids):
+        groups = {}
+        tids = set(tids)
+        for h in hids:
+            for other, rtype, _ in self.adj[h]:
+                if other in tids:
+                    g = groups.setdefault(rtype, {"reltype": rtype, "evidence": 0})
+                    g["evidence"] += 1
+        return list(groups.values())
+
+    def evidence_ids(self, hids, tids, rel, after, limit):
+        """neo4j_graph.Q_EVIDENCE(_IDS) rows; the edge's position in adj stands in for id(r)."""
+        tids = set(tids)
+        rows = sorted((pmid, h * 1_000_003 + i) for h in hids
+                      for i, (other, rtype, pmid) in enumerate(self.adj[h])
+                      if other in tids and rtype == rel)
+        self.cost += sum(len(self.adj[h]) for h in hids)
+        return [{"pmid": p, "rid": r} for p, r in rows if (p, r) > after][:limit]
+
+    def bridge(self, hkey, tkey, expand=None, hub_degree=None):
+        return self.bridge_ids(self.ids(hkey), self.ids(tkey), expand, hub_degree)
+
+    def degree(self, n):
+        return len(self.adj.get(n, ()))
+
+    def mult(self, u, v):
+        """Number of parallel edges u-v (cached per node)."""
+        c = self._mult.get(u)
+        if c is None:
+            c = self._mult[u] = Counter(o for o, _, _ in self.adj.get(u, ()))
+        return c.get(v, 0)
+
+    def bridge_ids(self, hids, tids, expand=None, hub_degree=None):
+        """neo4j_graph.Q_TWO semantics; adds the relationships it reads to self.cost."""
+        best = None  # (-weight, name)
+        for h in hids:
+            for t in tids:
+                a, b = (h, t) if self.degree(h) <= self.degree(t) else (t, h)
+                seen = set()
+                for m, _, _ in self.adj.get(a, ()):
+                    self.cost += 1
+                    if m in (a, b) or m in seen:
+                        continue
+                    if hub_degree is not None and self.degree(m) > hub_degree:
+                        continue
+                    seen.add(m)
+                    # expand-into: the planner walks the smaller side
+                    self.cost += min(self.degree(m), self.degree(b))
+                    c2 = self.mult(m, b)
+                    if c2:
+                        cand = (-(c2 + self.mult(a, m)), self.names[m])
+                        best = cand if best is None or cand < best else best
+                    if expand is not None and len(seen) >= expand:
+                        break
+        return best[1] if best else None
+
+    def unbounded_cost(self, hids, tids):
+        """
+        Relationships the old (h)-[r1]-(m)-[r2]-(t) pattern reads: every r1 out
+        of h, then an expand-into m-t per r1 row, then one row per r1 x r2 path.
+        """
+        return sum(1 + min(self.degree(m), self.degree(t)) + self.mult(m, t)
+                   for h in hids for m, _, _ in self.adj.get(h, ()) for t in tids)
+
+
+def export(g, out):
+    """Write g as a KG export (nodes.parquet / edges.parquet) for csr_graph.py."""
+    import pandas as pd
+    Path(out).mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"id": list(g.names), "name": list(g.names.values()),
+                  "name_key": [normalize_name(n) for n in g.names.values()]}).to_parquet(Path(out) / "nodes.parquet")
+    pd.DataFrame(g.edges, columns=["source", "target", "type", "pmid"]).rename_axis("id").reset_index() \
+        .to_parquet(Path(out) / "edges.parquet")
+    return out
+
+
+def synthetic_graph(n_nodes=2000, avg_degree=8, seed=7):
+    """Random graph with a few hubs so 2-hop lookups do real work."""
+    rng = random.Random(seed)
+    g = FakeGraph()
+    for i in range(n_nodes):
+        g.add_node(i, f"Entity {i}")
+    hubs = list(range(min(20, n_nodes)))
+    for e in range(n_nodes * avg_degree // 2):
+        h = rng.choice(hubs) if rng.random() < 0.2 else rng.randrange(n_nodes)
+        t = rng.randrange(n_nodes)
+        g.add_edge(h, t, rng.choice(REL_TYPES), str(10_000_000 + e))
+    return g
+
+
+def powerlaw_graph(n_nodes=20000, avg_degree=8, exponent=2.1, seed=11, max_parallel=1):
+    """
+    Preferential-attachment-like graph: a handful of hubs with thousands of
+    edges. With max_parallel > 1 each pair gets a Pareto-distributed number of
+    parallel edges (one per paper), as in the real KG.
+    """
+    rng = random.Random(seed)
+    g = FakeGraph()
+    for i in range(n_nodes):
+        g.add_node(i, f"Entity {i}")
+    # Zipf-style weights: node rank r is picked with probability ~ r^(-1/(exponent-1))
+    weights = [(r + 1) ** (-1.0 / (exponent - 1)) for r in range(n_nodes)]
+    order = list(range(n_nodes))
+    rng.shuffle(order)
+    n_edges = n_nodes * avg_degree // 2
+    heads = rng.choices(order, weights=weights, k=n_edges)
+    pmid = 20_000_000
+    for h in heads:
+        t, rtype = rng.randrange(n_nodes), rng.choice(REL_TYPES)
+        copies = min(int(rng.paretovariate(1.5)), max_parallel) if max_parallel > 1 else 1
+        for _ in range(copies):
+            g.add_edge(h, t, rtype, str(pmid))
+            pmid += 1
+    return g
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def data(self):
+        return list(self._rows)
+
+    def single(self):
+        return self._rows[0] if self._rows else None
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self._deadline = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, *args, **kwargs):
+        # the session doubles as the transaction: same run() / data() / single()
+        timeout = getattr(work, "timeout", None)  # set by neo4j.unit_of_work
+        self._deadline = time.perf_counter() + timeout if timeout else None
+        return work(self, *args, **kwargs)
+
+    def run(self, query, **params):
+        self.driver.round_trips += 1
+        if self.driver.rtt:
+            time.sleep(self.driver.rtt)
+        handler = self.driver.handlers.get(query)
+        if handler is None:
+            raise KeyError(f"no stand-in handler for query:\n{query}")
+        g = self.driver.graph
+        g.cost = 0
+        rows = handler(g, params)
+        work_s = g.cost * self.driver.rel_us / 1e6
+        if self._deadline is not None and time.perf_counter() + work_s > self._deadline:
+            time.sleep(max(0.0, self._deadline - time.perf_counter()))
+            raise _timeout_error()
+        if work_s:
+            time.sleep(work_s)
+        return _Result(rows)
+
+
+def _timeout_error():
+    from neo4j.exceptions import Neo4jError
+    return Neo4jError._hydrate_neo4j(
+        code="Neo.ClientError.Transaction.TransactionTimedOutClientConfiguration",
+        message="The transaction has been terminated (stand-in timeout)")
+
+
+class FakeDriver:
+    def __init__(self, graph, rtt_ms=1.0, handlers=None, rel_us=0.0):
+        self.graph = graph
+        self.rtt = rtt_ms / 1000.0
+        self.rel_us = rel_us   # simulated server time per relationship a handler reads
+        self.handlers = {**version_handlers(), **dict(handlers or verify_handlers())}
+        self.round_trips = 0
+
+    def session(self, **_):
+        return FakeSession(self)
+
+
+def recommend_rows(g, head_ids, whitelist, exclude, limit):
+    """Rows of neo4j_graph.Q_RECOMMEND(_IDS) for the given head ids."""
+    counts = {}
+    for h in head_ids:
+        for t, rtype, _ in g.adj.get(h, ()):
+            if whitelist and rtype not in whitelist:
+                continue
+            if normalize_name(g.names[t]) in exclude:
+                continue
+            counts[(h, t, rtype)] = counts.get((h, t, rtype), 0) + 1
+    rows = [{"head_name": g.names[h], "head_id": h, "tail_name": g.names[t], "tail_id": t,
+             "relation": rtype, "evidence": ev} for (h, t, rtype), ev in counts.items()]
+    rows.sort(key=lambda r: (-r["evidence"], r["relation"], r["tail_name"].lower(), r["tail_id"]))
+    return rows[:limit]
+
+
+def version_handlers():
+    """graph.kg_version() reads node and relationship counts."""
+    import neo4j_graph
+    return {
+        neo4j_graph.Q_NODE_COUNT: lambda g, p: [{"n": len(g.names)}],
+        neo4j_graph.Q_REL_COUNT: lambda g, p: [{"n": len(g.edges)}],
+    }
+
+
+def recommend_handlers():
+    import neo4j_graph
+
+    def live(g, p):
+        hids = p["head_ids"] if p["head_ids"] else g.ids(p["head_key"])
+        return recommend_rows(g, hids, p["whitelist"], p["exclude"], p["limit"])
+
+    def live_batch(g, p):
+        out = []
+        for it in p["items"]:
+            hids = it["head_ids"] if it.get("head_ids") is not None else g.ids(it["head_key"])
+            rows = recommend_rows(g, hids, it["whitelist"], it["exclude"], it["limit"])
+            if rows:
+                out.append({"idx": it["idx"], "rows": rows})
+        return out
+
+    def nodes(g, p):
+        return [{"id": i, "name": n, "key": normalize_name(n), "degree": len(g.adj.get(i, ()))}
+                for i, n in g.names.items()]
+
+    def top(g, p):
+        out = []
+        for h in p["ids"]:
+            counts = {}
+            for t, rtype, _ in g.adj.get(h, ()):
+                counts[(rtype, t)] = counts.get((rtype, t), 0) + 1
+            groups = {}
+            for (rtype, t), ev in sorted(counts.items(), key=lambda x: (x[0][0], -x[1], g.names[x[0][1]].lower(), x[0][1])):
+                groups.setdefault(rtype, []).append([t, ev])
+            out += [{"hid": h, "rtype": rt, "top": rows[:p["top"]]} for rt, rows in groups.items()]
+        return out
+
+    return {
+        neo4j_graph.Q_RECOMMEND: live,
+        neo4j_graph.Q_RECOMMEND_IDS: live,
+        neo4j_graph.Q_RECOMMEND_BATCH: live_batch,
+        neo4j_graph.Q_RECOMMEND_BATCH_IDS: live_batch,
+        neo4j_graph.Q_NODES: nodes,
+        neo4j_graph.Q_TOP: top,
+    }
+
+
+def verify_handlers():
+    import neo4j_graph
+
+    def direct(g, p):
+        return g.direct(p["hkey"], p["tkey"])
+
+    def two(g, p):
+        b = g.bridge(p["hkey"], p["tkey"], p["expand"], p["hub_degree"])
+        return [{"bridge": b}] if b else []
+
+    def direct_batch(g, p):
+        return [{"idx": it["idx"], **row}
+                for it in p["items"] for row in g.direct(it["hkey"], it["tkey"])]
+
+    def two_batch(g, p):
+        out = []
+        for it in p["items"]:
+            b = g.bridge(it["hkey"], it["tkey"], p["expand"], p["hub_degree"])
+            if b:
+                out.append({"idx": it["idx"], "bridge": b})
+        return out
+
+    def direct_batch_ids(g, p):
+        return [{"idx": it["idx"], **row}
+                for it in p["items"] for row in g.direct_ids(it["hids"], it["tids"])]
+
+    def two_batch_ids(g, p):
+        out = []
+        for it in p["items"]:
+            b = g.bridge_ids(it["hids"], it["tids"], p["expand"], p["hub_degree"])
+            if b:
+                out.append({"idx": it["idx"], "bridge": b})
+        return out
+
+    def evidence_rows(g, p):
+        hids = p["hids"] if "hids" in p else g.ids(p["hkey"])
+        tids = p["tids"] if "tids" in p else g.ids(p["tkey"])
+        return g.evidence_ids(hids, tids, p["rel"], (p["after_pmid"], p["after_rid"]), p["limit"])
+
+    return {
+        neo4j_graph.Q_EVIDENCE: evidence_rows,
+        neo4j_graph.Q_EVIDENCE_IDS: evidence_rows,
+        neo4j_graph.Q_LEXICON: lambda g, p: [{"id": i, "name": n, "aliases": []} for i, n in g.names.items()],
+        neo4j_graph.Q_DIRECT_BATCH_IDS: direct_batch_ids,
+        neo4j_graph.Q_TWO_BATCH_IDS: two_batch_ids,
+        neo4j_graph.Q_DIRECT: direct,
+        neo4j_graph.Q_TWO: two,
+        neo4j_graph.Q_DIRECT_BATCH: direct_batch,
+        neo4j_graph.Q_TWO_BATCH: two_batch,
+    }
@@ -0,0 +1,169 @@
+# benchmarks/openai_admission.py
+"""
+OpenAI calls under 429s: the old retry loop against api/admission.py.
+
+    python benchmarks/openai_admission.py --duration 10 --limit-rps 20 --embed-threads 16 --chat-threads 4
+
+The fake OpenAI server allows --limit-rps requests per second per key and
+answers 429 (with retry-after) past that. For --duration seconds,
+--embed-threads threads send one-text embedding batches back to back
+(background work) while --chat-threads threads stream chats, all on the
+same key. Each configuration runs in a fresh process:
+  legacy      the code before admission: tenacity-style retries (6 attempts,
+              random exponential 1..20 s) and the SDK's own 2 retries
+  reactive    admission.py, no client-side buckets: cool-downs from 429s only
+  buckets     admission.py with OPENAI_RPM at 90% of the server's limit
+
+Reported per class: calls that succeeded, calls refused (RateLimited for
+admission, the final error for legacy), p95 and max time a caller was held
+(max = how long a request thread can be pinned), chat time to first chunk,
+and the 429s the server sent. Legacy callers still sleeping when the time is
+up are waited for, which is why that run takes longer.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from fake_openai import FakeOpenAI
+import fakegraph  # noqa: F401  (puts api/ on sys.path)
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 1) if values else None
+
+
+def _legacy(base_url):
+    from openai import OpenAI, RateLimitError
+    client = OpenAI(api_key="fake", base_url=base_url)
+
+    def retried(fn):
+        for attempt in range(6):
+            try:
+                return fn()
+            except RateLimitError:
+                if attempt == 5:
+                    raise
+                time.sleep(random.uniform(1, min(20, 2 ** (attempt + 1))))
+
+    def embed(text):
+        return retried(lambda: client.embeddings.create(input=[text], model="text-embedding-3-small"))
+
+    def chat_first(messages):
+        res = client.chat.completions.create(model="gpt-4o", messages=messages, stream=True)
+        for chunk in res:
+            yield chunk.choices[0].delta.content if chunk.choices else ""
+
+    return embed, chat_first, Exception
+
+
+def _admitted():
+    import admission
+    import chat
+    import embedding_utils
+
+    def embed(text):
+        return embedding_utils._create_embeddings([text])
+
+    return embed, lambda messages: chat.open_deltas("fake", messages), admission.RateLimited
+
+
+def child(mode, base_url, duration, embed_threads, chat_threads):
+    embed, chat_stream, refused = _legacy(base_url) if mode == "legacy" else _admitted()
+    res = {"embed": {"ok": 0, "refused": 0, "held": []}, "chat": {"ok": 0, "refused": 0, "held": [], "ttfc": []}}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def record(cls, ok, held, ttfc=None):
+        with lock:
+            r = res[cls]
+            r["ok" if ok else "refused"] += 1
+            r["held"].append(held)
+            if ttfc is not None:
+                r["ttfc"].append(ttfc)
+
+    def embedder(i):
+        n = 0
+        while time.monotonic() < stop:
+            t0 = time.monotonic()
+            try:
+                embed(f"text {i} {n}")
+                record("embed", True, time.monotonic() - t0)
+            except refused:
+                record("embed", False, time.monotonic() - t0)
+                time.sleep(0.2)  # callers back off (lexicon: a miss, relations: 60 s)
+            n += 1
+
+    def chatter(i):
+        while time.monotonic() < stop:
+            t0 = time.monotonic()
+            try:
+                gen = chat_stream([{"role": "user", "content": f"question {i}"}])
+                next(gen)
+                ttfc = time.monotonic() - t0
+                for _ in gen:
+                    pass
+                record("chat", True, time.monotonic() - t0, ttfc)
+            except refused:
+                record("chat", False, time.monotonic() - t0)
+                time.sleep(0.2)  # a browser would show the 429 and let the user retry
+
+    threads = [threading.Thread(target=embedder, args=(i,)) for i in range(embed_threads)]
+    threads += [threading.Thread(target=chatter, args=(i,)) for i in range(chat_threads)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out = {"wall_s": round(time.monotonic() - t0, 1)}
+    for cls, r in res.items():
+        out[cls] = {"ok": r["ok"], "refused": r["refused"], "held_p95_ms": _pct(r["held"], 95),
+                    "held_max_ms": _pct(r["held"], 100)}
+        if cls == "chat":
+            out[cls]["ttfc_p50_ms"] = _pct(r["ttfc"], 50)
+            out[cls]["ttfc_p95_ms"] = _pct(r["ttfc"], 95)
+    print(json.dumps(out))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--limit-rps", type=float, default=20.0, help="server-side requests per second per key")
+    ap.add_argument("--embed-threads", type=int, default=16)
+    ap.add_argument("--chat-threads", type=int, default=4)
+    ap.add_argument("--modes", nargs="+", default=["legacy", "reactive", "buckets"])
+    ap.add_argument("--child", nargs=2, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.child[0], args.child[1], args.duration, args.embed_threads, args.chat_threads)
+
+    env = {"OPENAI_API_KEY": "fake", "EMBED_CACHE_PATH": "", "OPENAI_EMBED_MAX_WAIT_S": "2",
+           "OPENAI_CHAT_MAX_WAIT_S": "5"}
+    configs = {"legacy": {}, "reactive": {},
+               "buckets": {"OPENAI_RPM": str(args.limit_rps * 60 * 0.9)}}
+    print(f"{'mode':<9} {'class':<6} {'ok':>6} {'refused':>8} {'held p95':>9} {'held max':>9} "
+          f"{'ttfc p50':>9} {'ttfc p95':>9} {'429s':>6} {'wall s':>7}")
+    for mode in args.modes:
+        server = FakeOpenAI(latency_ms=30, first_token_ms=100, token_ms=2, chunk_chars=64,
+                            limit_rps=args.limit_rps).start()
+        cmd = [sys.executable, __file__, "--child", mode, server.base_url, "--duration", str(args.duration),
+               "--embed-threads", str(args.embed_threads), "--chat-threads", str(args.chat_threads)]
+        out = subprocess.run(cmd, env={**os.environ, **env, **configs[mode], "OPENAI_BASE_URL": server.base_url},
+                             capture_output=True, text=True, check=True)
+        server.stop()
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        for cls in ("chat", "embed"):
+            c = r[cls]
+            print(f"{mode:<9} {cls:<6} {c['ok']:>6} {c['refused']:>8} {c['held_p95_ms']!s:>9} "
+                  f"{c['held_max_ms']!s:>9} {c.get('ttfc_p50_ms', '')!s:>9} {c.get('ttfc_p95_ms', '')!s:>9} "
+                  f"{server.rejected if cls == 'chat' else '':>6} {r['wall_s'] if cls == 'chat' else '':>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# benchmarks/prefork_memory.py
+"""
+Per-worker memory and boot time of the gunicorn deployment (api/gunicorn.conf.py),
+with the app preloaded in the master and without.
+
+    python benchmarks/prefork_memory.py --rows 200000 --dim 256 --workers 4
+
+Starts gunicorn on a synthetic embeddings parquet, a synthetic KG served by
+the CSR backend (no Neo4j) and the fake OpenAI server. Once every worker has
+booted it sends --requests /api/verify calls with unseen names, so each
+worker embeds them and scans the matrix, then reads /proc/<pid>/smaps_rollup
+of the master and every worker. Linux only.
+
+rss counts shared pages in every process that maps them; pss divides them
+between those processes, so the pss column sums to what the deployment
+really uses.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from fake_openai import FakeOpenAI
+from fakegraph import export, powerlaw_graph
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+
+
+def _write_embeddings(rows, dim, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    vals = np.random.default_rng(0).standard_normal((rows, dim), dtype=np.float32)
+    emb = pa.FixedSizeListArray.from_arrays(pa.array(vals.reshape(-1)), dim)
+    names = pa.array([f"entity {i}" for i in range(rows)])
+    pq.write_table(pa.table({"Name": names, "embedding": emb}), path)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _smaps(pid):
+    kb = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                kb[parts[0].rstrip(":")] = int(parts[1])
+    return {"rss": kb["Rss"] / 1024, "pss": kb["Pss"] / 1024,
+            "private": (kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024}
+
+
+def _children(pid):
+    out = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            out += [int(c) for c in f.read().split()]
+    return out
+
+
+def run(preload, args, env):
+    port = _free_port()
+    env = {**env, "PORT": str(port), "GUNICORN_WORKERS": str(args.workers),
+           "GUNICORN_PRELOAD": "1" if preload else "0"}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", str(API_DIR / "gunicorn.conf.py"), "wsgi:app"],
+                            env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True)
+    boots, ready = {}, threading.Event()
+
+    def read_log():
+        for line in proc.stderr:
+            if args.verbose:
+                sys.stderr.write(line)
+            if " booted in " in line:
+                pid, secs = line.split("worker ", 1)[1].split(" booted in ")
+                boots[int(pid)] = float(secs.split()[0])
+                if len(boots) == args.workers:
+                    ready.set()
+
+    threading.Thread(target=read_log, daemon=True).start()
+    try:
+        if not ready.wait(args.boot_timeout):
+            raise RuntimeError(f"workers not up after {args.boot_timeout} s (rerun with --verbose)")
+        all_up = time.perf_counter() - t0
+        url = f"http://127.0.0.1:{port}/api/verify"
+        for i in range(args.requests):
+            body = json.dumps({"triples": [[f"unseen head {i}", "TREATS", f"unseen tail {i}"]]}).encode()
+            req = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+            urllib.request.urlopen(req, timeout=60).read()
+        master = _smaps(proc.pid)
+        workers = {pid: _smaps(pid) for pid in _children(proc.pid)}
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+    return all_up, boots, master, workers
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--nodes", type=int, default=20000, help="synthetic KG size")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--requests", type=int, default=40, help="/api/verify calls after boot")
+    ap.add_argument("--boot-timeout", type=float, default=300)
+    ap.add_argument("--verbose", action="store_true", help="echo the gunicorn log")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="knownet-prefork-")
+    _write_embeddings(args.rows, args.dim, os.path.join(tmp, "embeddings.parquet"))
+    kg = export(powerlaw_graph(args.nodes, 8), os.path.join(tmp, "kg"))
+    server = FakeOpenAI(latency_ms=5, dim=args.dim).start()
+    env = {**os.environ,
+           "GRAPH_BACKEND": "csr",
+           "GRAPH_CSR_PATH": kg,
+           "EMBEDDINGS_PATH": os.path.join(tmp, "embeddings.parquet"),
+           "EMBEDDINGS_RELOAD_CHECK_S": "0",
+           "EMBEDDINGS_INDEX": "exact",
+           "NEIGHBORS_PATH": os.path.join(tmp, "neighbors.npz"),
+           "EMBED_CACHE_PATH": "",
+           "OPENAI_BASE_URL": server.base_url,
+           "OPENAI_API_KEY": "fake",
+           "GUNICORN_THREADS": "2"}
+    print(f"embeddings {args.rows} x {args.dim} float32 = {args.rows * args.dim * 4 / 1e6:.0f} MB, "
+          f"{args.workers} workers\n")
+
+    print(f"{'preload':>8} {'all up s':>9} {'boot s (max)':>13} {'worker rss':>11} {'worker pss':>11} "
+          f"{'private':>8} {'master pss':>11} {'total pss MB':>13}")
+    for preload in (False, True):
+        all_up, boots, master, workers = run(preload, args, env)
+        n = len(workers) or 1
+        avg = {k: sum(w[k] for w in workers.values()) / n for k in ("rss", "pss", "private")}
+        total = master["pss"] + sum(w["pss"] for w in workers.values())
+        print(f"{'on' if preload else 'off':>8} {all_up:>9.2f} {max(boots.values()):>13.2f} {avg['rss']:>11.0f} "
+              f"{avg['pss']:>11.0f} {avg['private']:>8.0f} {master['pss']:>11.0f} {total:>13.0f}")
+    server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
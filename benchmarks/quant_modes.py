@@ -0,0 +1,53 @@
+# benchmarks/quant_modes.py
+"""
+Memory and throughput of the embedding storage modes in api/quant.py.
+
+    python benchmarks/quant_modes.py --n 200000 --dim 384
+
+For each mode: resident matrix bytes, exact-search queries/s, and how close
+results are to float32 before and after the full-precision re-rank.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ann_recall import queries, synthetic
+import ann
+import quant
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--shortlist", type=int, default=32)
+    args = ap.parse_args()
+
+    mat = synthetic(args.n, args.dim)
+    qs = queries(mat, args.queries)
+    truth_i, truth_s = ann.ExactIndex(mat).search(qs, k=args.k)
+
+    print(f"N={args.n:,} dim={args.dim} k={args.k} shortlist={args.shortlist}")
+    print(f"{'mode':>8} {'MB':>8} {'q/s':>8} {'top1 agree':>11} {'max |dscore| raw':>17} {'after rerank':>13}")
+    for mode in quant.MODES:
+        store = quant.quantize(mat, mode)
+        first = ann.ExactIndex(store)
+        index = first if mode == "float32" else ann.RerankIndex(first, mat, args.shortlist)
+        t0 = time.perf_counter()
+        for q in qs:
+            index.search(q[None, :], k=args.k)
+        qps = len(qs) / (time.perf_counter() - t0)
+
+        raw_i, raw_s = first.search(qs, k=args.k)
+        ids, scores = index.search(qs, k=args.k)
+        agree = float(np.mean(ids[:, 0] == truth_i[:, 0]))
+        print(f"{mode:>8} {store.nbytes / 2**20:>8.1f} {qps:>8.1f} {agree:>11.3f} "
+              f"{float(np.max(np.abs(raw_s[:, 0] - truth_s[:, 0]))):>17.2e} "
+              f"{float(np.max(np.abs(scores[:, 0] - truth_s[:, 0]))):>13.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/recommend_batch.py
+"""
+Page-load cost of recommendations for a rendered graph: one /api/recommend
+call per entity vs a single batch call with every head.
+
+    python benchmarks/recommend_batch.py --heads 5 15 30 --rtt-ms 2
+
+Runs without the neighbour table so every head costs Neo4j work, and checks
+that each head's batch suggestions match its single-head response, and that
+a head added after the lexicon was built still gets suggestions.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fakegraph import FakeDriver, REL_TYPES, powerlaw_graph, recommend_handlers
+
+from flask import Flask
+
+import graph
+import lexicon
+import neo4j_graph
+import neighbors
+import recommend
+
+
+def _flatten(batch, head):
+    """Batch result for one head, back in the single-head suggestion shape."""
+    nodes = batch["nodes"]
+    out = []
+    for s in batch["results"][head]["suggestions"]:
+        h, t = nodes[s["head"]], nodes[s["tail"]]
+        out.append({**s, "head": {"id": s["head"], **h}, "tail": {"id": s["tail"], **t}})
+    return out
+
+
+def _lexicon_handler(driver):
+    driver.handlers[neo4j_graph.Q_LEXICON] = lambda g, p: [{"id": i, "name": n, "aliases": []}
+                                                       for i, n in g.names.items()]
+
+
+def _check_new_node(g, driver, client):
+    """A head the lexicon does not know (added since it was built) is looked up by name_key."""
+    loaded = lexicon.is_loaded()
+    _lexicon_handler(driver)
+    lexicon.build()
+    nid = max(g.names) + 1
+    g.add_node(nid, "Entity added later")
+    g.add_edge(nid, next(iter(g.names)), REL_TYPES[0], "999999")
+    try:
+        single = client.post("/api/recommend", json={"head": "Entity added later"}).get_json()
+        assert single["suggestions"], single
+        batch = client.post("/api/recommend", json={"heads": ["Entity added later"]}).get_json()
+        assert batch["results"]["Entity added later"]["suggestions"], batch
+    finally:
+        if not loaded:
+            lexicon._LEX = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=20000)
+    ap.add_argument("--heads", type=int, nargs="+", default=[5, 15, 30])
+    ap.add_argument("--rtt-ms", type=float, default=2.0)
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--lexicon", action="store_true", help="anchor on lexicon ids instead of name_key")
+    args = ap.parse_args()
+
+    rng = random.Random(8)
+    g = powerlaw_graph(args.nodes)
+    driver = FakeDriver(g, rtt_ms=args.rtt_ms, handlers=recommend_handlers())
+    graph.set_driver(driver)
+    neighbors._TABLE = None
+    neighbors.RELOAD_CHECK_S = 0
+    lexicon.EMBED_FALLBACK = False
+    if args.lexicon:
+        _lexicon_handler(driver)
+        lexicon.build()
+
+    app = Flask(__name__)
+    app.register_blueprint(recommend.recommend_bp)
+    client = app.test_client()
+
+    print(f"{'heads':>6} {'mode':>8} {'p50 ms':>9} {'round-trips':>12} {'resp bytes':>11}")
+    for n in args.heads:
+        names = [g.names[i] for i in rng.sample(range(args.nodes), n)]
+        bodies = [{"head": h, "k": rng.choice([3, 5]),
+                   "whitelist": rng.sample(REL_TYPES, 4) if rng.random() < 0.3 else []} for h in names]
+        singles, batch = {}, None
+        for mode in ("single", "batch"):
+            times = []
+            for _ in range(args.repeat):
+                driver.round_trips, size = 0, 0
+                t0 = time.perf_counter()
+                if mode == "single":
+                    for b in bodies:
+                        r = client.post("/api/recommend", json=b)
+                        singles[b["head"]] = r.get_json()["suggestions"]
+                        size += len(r.data)
+                else:
+                    r = client.post("/api/recommend", json={"heads": bodies})
+                    batch = r.get_json()
+                    size = len(r.data)
+                times.append((time.perf_counter() - t0) * 1000)
+            print(f"{n:>6} {mode:>8} {statistics.median(times):>9.2f} {driver.round_trips:>12} {size:>11}")
+        for b in bodies:
+            assert _flatten(batch, b["head"]) == singles[b["head"]], f"batch differs for {b['head']}"
+
+    # results are keyed by head: a repeated head is fine, conflicting options are not
+    h = names[0]
+    assert client.post("/api/recommend", json={"heads": [{"head": h, "k": 3}, {"head": h, "k": 3}]}).status_code == 200
+    r = client.post("/api/recommend", json={"heads": [{"head": h, "k": 3}, {"head": h, "whitelist": ["TREATS"]}]})
+    assert r.status_code == 400, r.get_json()
+    _check_new_node(g, driver, client)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/recommend_table.py
+"""
+/api/recommend served from the precomputed neighbour table vs the live
+expansion, on a power-law stand-in graph where a few hubs hold most edges.
+
+    python benchmarks/recommend_table.py --nodes 20000 --rtt-ms 1
+
+Checks that both paths return identical suggestions for random heads,
+whitelists and excludes, then adds edges and verifies that
+`neighbors.update` rebuilds only the touched heads and restores parity.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from fakegraph import REL_TYPES, FakeDriver, powerlaw_graph, recommend_handlers
+
+from flask import Flask
+
+import graph
+import neighbors
+import recommend
+
+
+def _client():
+    app = Flask(__name__)
+    app.register_blueprint(recommend.recommend_bp)
+    return app.test_client()
+
+
+def _ask(client, body):
+    r = client.post("/api/recommend", json=body)
+    out = r.get_json()
+    return out["suggestions"], out["meta"]["neighbors"]["source"]
+
+
+def _timed(client, bodies):
+    times, sources = [], set()
+    for body in bodies:
+        t0 = time.perf_counter()
+        _, source = _ask(client, body)
+        times.append((time.perf_counter() - t0) * 1000)
+        sources.add(source)
+    return statistics.median(times), max(times), sources
+
+
+def _parity(client, bodies):
+    """(mismatches, requests the table handed to the live query)."""
+    bad = fallback = 0
+    for body in bodies:
+        neighbors._TABLE, saved = None, neighbors._TABLE
+        live, _ = _ask(client, body)
+        neighbors._TABLE = saved
+        table, source = _ask(client, body)
+        bad += live != table
+        fallback += source != "table"
+    return bad, fallback
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=20000)
+    ap.add_argument("--avg-degree", type=int, default=8)
+    ap.add_argument("--rtt-ms", type=float, default=1.0)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    rng = random.Random(4)
+    g = powerlaw_graph(args.nodes, args.avg_degree)
+    graph.set_driver(FakeDriver(g, rtt_ms=args.rtt_ms, handlers=recommend_handlers()))
+    neighbors.RELOAD_CHECK_S = 0
+    client = _client()
+
+    by_degree = sorted(g.names, key=lambda i: len(g.adj.get(i, ())), reverse=True)
+    hubs, typical = by_degree[:10], by_degree[len(by_degree) // 2:]
+
+    def body(nid):
+        b = {"head": g.names[nid], "k": rng.choice([3, 5, 8])}
+        if rng.random() < 0.3:
+            b["whitelist"] = rng.sample(REL_TYPES, 3)
+        if rng.random() < 0.3:
+            b["exclude"] = [g.names[rng.choice(by_degree[:200])] for _ in range(3)]
+        return b
+
+    hub_bodies = [body(rng.choice(hubs)) for _ in range(args.queries // 4)]
+    typ_bodies = [body(rng.choice(typical)) for _ in range(args.queries)]
+    print(f"graph: {args.nodes} nodes, hub degree {len(g.adj[hubs[0]])}, "
+          f"median degree {len(g.adj[by_degree[len(by_degree) // 2]])}")
+
+    path = os.path.join(tempfile.mkdtemp(), "neighbors.npz")
+    neighbors._TABLE = None
+    live_hub = _timed(client, hub_bodies)
+    live_typ = _timed(client, typ_bodies)
+
+    t0 = time.perf_counter()
+    meta = neighbors.build(path, log=None)
+    neighbors.load(path)
+    print(f"build: {time.perf_counter() - t0:.1f}s, {meta['entries']} entries, "
+          f"{neighbors.status()['bytes'] / 2**20:.1f} MiB in memory, {os.path.getsize(path) / 2**20:.1f} MiB on disk")
+    tab_hub = _timed(client, hub_bodies)
+    tab_typ = _timed(client, typ_bodies)
+
+    print(f"{'heads':>8} {'live p50':>9} {'live max':>9} {'table p50':>10} {'table max':>10}")
+    for name, live, tab in (("hubs", live_hub, tab_hub), ("typical", live_typ, tab_typ)):
+        print(f"{name:>8} {live[0]:>9.2f} {live[1]:>9.2f} {tab[0]:>10.2f} {tab[1]:>10.2f}   sources {sorted(tab[2])}")
+
+    n = len(hub_bodies) + len(typ_bodies)
+    bad, fallback = _parity(client, hub_bodies + typ_bodies)
+    print(f"parity: {n - bad}/{n} identical ({fallback} needed more than top-{meta['top_n']} and went live)")
+    assert not bad
+
+    # change a few nodes, then refresh incrementally
+    touched = rng.sample(typical, 5)
+    for h in touched:
+        for _ in range(3):
+            g.add_edge(h, hubs[0], "TREATS", "99999999")
+    t0 = time.perf_counter()
+    upd = neighbors.update(path, log=None)
+    neighbors.load(path)
+    bad, _ = _parity(client, [{"head": g.names[h], "k": 5} for h in touched + hubs[:1]])
+    print(f"update: rebuilt {upd['rebuilt_heads']} heads in {time.perf_counter() - t0:.2f}s, "
+          f"parity mismatches after update: {bad}")
+    assert not bad
+
+
+if __name__ == "__main__":
+    main()
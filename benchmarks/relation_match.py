@@ -0,0 +1,82 @@
+# benchmarks/relation_match.py
+"""
+Cost of normalize_relation with the relation-label table (api/relations.py).
+
+    python benchmarks/relation_match.py --latency-ms 80
+
+Builds a table against the fake OpenAI server, then reports:
+  - how many relation strings of a paraphrase corpus map to a canonical
+    label with REL_MAP only and with the table's exact surface forms
+  - per-call latency of each path: REL_MAP rule, exact table form, a
+    first-seen string (one embedding call), and the same string memoized
+  - embedding calls for a /api/verify batch of triples with unseen relations
+    (the batch shares one call)
+
+The fake server's vectors carry no meaning, so unseen strings never clear
+REL_EQUIV_THRESHOLD here: this measures cost, not match quality. For that,
+build against OpenAI and try `python api/relations.py match "helps slow" ...`.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from fake_openai import FakeOpenAI
+import fakegraph  # noqa: F401  (puts api/ on sys.path)
+
+
+def _us(fn, arg, n):
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn(arg)
+        lat.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(lat)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--latency-ms", type=float, default=80, help="fake embeddings latency")
+    ap.add_argument("--triples", type=int, default=10, help="triples per verify batch")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    server = FakeOpenAI(latency_ms=args.latency_ms).start()
+    os.environ.update({"OPENAI_BASE_URL": server.base_url, "OPENAI_API_KEY": "fake", "EMBED_CACHE_PATH": ""})
+    import relations
+    import verify
+
+    path = os.path.join(tempfile.mkdtemp(prefix="knownet-rel-"), "relations.npz")
+    meta = relations.build(path, log=lambda *_: None)
+    relations.load(path)
+    print(f"table: {meta['forms']} forms, {meta['labels']} labels, version {meta['version']}, "
+          f"build {meta['build_s']} s\n")
+
+    corpus = [f for forms in relations.SURFACE_FORMS.values() for f in forms]
+    corpus += [f.title() for f in corpus[::3]] + [f.replace(" ", "_").upper() for f in corpus[1::3]]
+    rule_only = sum(verify._rule(relations.relation_key(r)) is not None for r in corpus)
+    labels = set(relations.SURFACE_FORMS) | set(verify.REL_MAP.values())
+    with_table = sum(verify.normalize_relation(r) in labels for r in corpus)
+    print(f"paraphrase corpus: {len(corpus)} strings; canonical with REL_MAP only {rule_only} "
+          f"({rule_only / len(corpus):.0%}), with the table {with_table} ({with_table / len(corpus):.0%})\n")
+
+    print(f"{'path':<28} {'median us':>10}")
+    print(f"{'REL_MAP rule':<28} {_us(verify.normalize_relation, 'inhibits', args.repeat):>10.1f}")
+    print(f"{'exact table form':<28} {_us(verify.normalize_relation, 'helps slow', args.repeat):>10.1f}")
+    t0 = time.perf_counter()
+    verify.normalize_relation("is thought to modulate")
+    print(f"{'first seen (embedding call)':<28} {(time.perf_counter() - t0) * 1e6:>10.1f}")
+    print(f"{'memoized':<28} {_us(verify.normalize_relation, 'is thought to modulate', args.repeat):>10.1f}")
+
+    before = relations.stats()["embed_calls"]
+    verify._prefetch_relations([["a", f"appears to act on ({i})", "b"] for i in range(args.triples)])
+    calls = relations.stats()["embed_calls"] - before
+    print(f"\nverify batch with {args.triples} unseen relations: {calls} embedding call(s)")
+    server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# benchmarks/suite.py
+"""
+End-to-end latency suite: the real Flask app (index.app) against the
+in-memory KG (fakegraph.py) and the fake OpenAI server (fake_openai.py).
+
+    python benchmarks/suite.py                        # run, compare with baseline.json
+    python benchmarks/suite.py --save-baseline        # run and store as the new baseline
+    python benchmarks/suite.py --kg powerlaw --nodes 50000 --openai-latency-ms 120 \\
+        --scenarios verify chat --requests 300 --concurrency 16
+
+Scenarios:
+  verify     POST /api/verify with --triples triples (half real edges, half random pairs)
+  recommend  POST /api/recommend for a random head (live query, no neighbour table)
+  chat       POST /api/chat, time to the first streamed byte (the fake model waits
+             --first-token-ms, then sends a chunk every --token-ms)
+  resolve    embeds.resolve_entities for --names unseen names (one embedding call
+             through the cache/batcher plus the ANN search)
+
+For each scenario: p50 / p95 / p99 latency in ms and requests per second at
+--concurrency. Against a baseline a scenario regresses when its p95 grows, or
+its throughput drops, by more than --tolerance; the exit status is then 1.
+Numbers are only comparable between runs with the same configuration; the
+suite warns when it differs from the baseline's.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+
+from fake_openai import FakeOpenAI, fake_vector
+from fakegraph import FakeDriver, REL_TYPES, powerlaw_graph, recommend_handlers, synthetic_graph, verify_handlers
+
+BASELINE = Path(__file__).with_name("baseline.json")
+SCENARIOS = ["verify", "recommend", "chat", "resolve"]
+
+
+def _pct(lat, p):
+    return lat[min(len(lat) - 1, int(len(lat) * p))]
+
+
+def run_scenario(fn, requests, concurrency, seed):
+    """Call fn(rng) `requests` times from `concurrency` threads -> summary dict."""
+    rngs = [random.Random(seed * 1000 + i) for i in range(requests)]
+
+    def one(rng):
+        t0 = time.perf_counter()
+        fn(rng)
+        return (time.perf_counter() - t0) * 1000
+
+    fn(random.Random(seed))  # warm-up: first-call imports and lazy clients
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        lat = sorted(ex.map(one, rngs))
+    wall = time.perf_counter() - t0
+    return {
+        "p50_ms": round(_pct(lat, 0.50), 2),
+        "p95_ms": round(_pct(lat, 0.95), 2),
+        "p99_ms": round(_pct(lat, 0.99), 2),
+        "rps": round(requests / wall, 1),
+    }
+
+
+def _write_embeddings(g, dim, path):
+    import pandas as pd
+    names = sorted(set(g.names.values()))
+    pd.DataFrame({"Name": names, "embedding": [fake_vector(n, dim) for n in names]}).to_parquet(path)
+
+
+def build_scenarios(app, g, args):
+    import embeds
+
+    nodes = list(g.names)
+    edges = [(h, t, rt) for h in nodes for t, rt, _ in g.adj.get(h, ())]
+
+    def check(resp):
+        if resp.status_code != 200:
+            raise RuntimeError(f"{resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+
+    def verify(rng):
+        triples = []
+        for i in range(args.triples):
+            if i % 2 == 0:
+                h, t, rt = rng.choice(edges)
+            else:
+                h, t, rt = rng.choice(nodes), rng.choice(nodes), rng.choice(REL_TYPES)
+            triples.append([g.names[h], rt, g.names[t]])
+        check(app.test_client().post("/api/verify", json={"triples": triples}))
+
+    def recommend(rng):
+        check(app.test_client().post("/api/recommend", json={"head": g.names[rng.choice(nodes)], "k": 5}))
+
+    def chat(rng):
+        resp = app.test_client().post("/api/chat", json={"messages": [{"role": "user", "content": "omega-3?"}]},
+                                      headers={"x-openai-key": "fake"}, buffered=False)
+        check(resp)
+        it = iter(resp.response)
+        next(it)  # time to first byte is what the user waits for
+        resp.close()
+
+    def resolve(rng):
+        # unseen spellings, so each call misses the embedding cache
+        names = [f"{g.names[rng.choice(nodes)]} ({rng.random():.6f})" for _ in range(args.names)]
+        embeds.resolve_entities(names)
+
+    return {"verify": verify, "recommend": recommend, "chat": chat, "resolve": resolve}
+
+
+def compare(results, config, baseline, tolerance):
+    """Print the comparison; return the names of regressed scenarios."""
+    if baseline.get("config") != config:
+        print("warning: configuration differs from the baseline; numbers may not be comparable")
+    regressed = []
+    print(f"\n{'scenario':<10} {'p95 ms':>9} {'base':>9} {'change':>8} {'req/s':>8} {'base':>8} {'change':>8}")
+    for name, cur in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<10} {cur['p95_ms']:>9} {'-':>9} {'new':>8} {cur['rps']:>8} {'-':>8}")
+            continue
+        dl = cur["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        dr = cur["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        bad = dl > tolerance or dr < -tolerance / (1 + tolerance)
+        if bad:
+            regressed.append(name)
+        print(f"{name:<10} {cur['p95_ms']:>9} {base['p95_ms']:>9} {dl:>+8.0%} {cur['rps']:>8} {base['rps']:>8} "
+              f"{dr:>+8.0%}{'  REGRESSED' if bad else ''}")
+    return regressed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kg", choices=["powerlaw", "uniform"], default="powerlaw",
+                    help="degree distribution of the synthetic KG")
+    ap.add_argument("--nodes", type=int, default=20000)
+    ap.add_argument("--avg-degree", type=int, default=8)
+    ap.add_argument("--rtt-ms", type=float, default=1.0, help="simulated Neo4j round-trip")
+    ap.add_argument("--openai-latency-ms", type=float, default=80.0, help="fake embeddings latency")
+    ap.add_argument("--first-token-ms", type=float, default=300.0)
+    ap.add_argument("--token-ms", type=float, default=20.0)
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    ap.add_argument("--requests", type=int, default=200, help="per scenario")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--triples", type=int, default=10, help="triples per /api/verify request")
+    ap.add_argument("--names", type=int, default=5, help="names per resolve_entities call")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change, 0.25 = 25%%")
+    args = ap.parse_args()
+
+    server = FakeOpenAI(latency_ms=args.openai_latency_ms, per_input_ms=0.02,
+                        first_token_ms=args.first_token_ms, token_ms=args.token_ms).start()
+    tmp = tempfile.mkdtemp(prefix="knownet-bench-")
+    if args.kg == "powerlaw":
+        g = powerlaw_graph(args.nodes, args.avg_degree)
+    else:
+        g = synthetic_graph(args.nodes, args.avg_degree)
+    _write_embeddings(g, server.dim, os.path.join(tmp, "embeddings.parquet"))
+
+    # the app reads these at import time
+    os.environ.update({
+        "OPENAI_BASE_URL": server.base_url,
+        "OPENAI_API_KEY": "fake",
+        "EMBED_CACHE_PATH": "",
+        "EMBEDDINGS_PATH": os.path.join(tmp, "embeddings.parquet"),
+        "EMBEDDINGS_RELOAD_CHECK_S": "0",
+        "NEIGHBORS_PATH": os.path.join(tmp, "neighbors.npz"),
+    })
+    import graph
+    import neo4j_graph
+
+    handlers = {**verify_handlers(), **recommend_handlers(),
+                neo4j_graph.Q_SHOW_INDEX: lambda g, p: [{"state": "ONLINE", "populationPercent": 100.0}]}
+    graph.set_driver(FakeDriver(g, rtt_ms=args.rtt_ms, handlers=handlers))
+    from index import app, startup
+    startup.join()  # lexicon and index check, as a warmed-up server has them
+    import embeds
+    embeds.load()
+
+    config = {k: getattr(args, k) for k in ("kg", "nodes", "avg_degree", "rtt_ms", "openai_latency_ms",
+                                            "first_token_ms", "token_ms", "requests", "concurrency",
+                                            "triples", "names")}
+    scenarios = build_scenarios(app, g, args)
+    results = {}
+    print(f"{'scenario':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for i, name in enumerate(args.scenarios):
+        results[name] = r = run_scenario(scenarios[name], args.requests, args.concurrency, seed=i + 1)
+        print(f"{name:<10} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['rps']:>8}")
+    server.stop()
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({"config": config, "results": results}, indent=2) + "\n")
+        print(f"\nbaseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"\nno baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    regressed = compare(results, config, json.loads(args.baseline.read_text()), args.tolerance)
+    if regressed:
+        print(f"\nregressed: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# benchmarks/verify_batch.py
+"""
+Per-triple vs batched /api/verify latency against the local stand-in graph.
+
+    python benchmarks/verify_batch.py --triples 40 --rtt-ms 2
+
+The simulated round-trip time is what dominates a real deployment, so the
+interesting number is how latency scales with answer length in each mode.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from fakegraph import FakeDriver, REL_TYPES, synthetic_graph
+
+import evidence
+import graph
+import lexicon
+import neo4j_graph
+import result_cache
+import verify
+
+
+def _sample_triples(g, n, rng):
+    names = list(g.names.values())
+    triples = []
+    for _ in range(n):
+        h = rng.randrange(len(names))
+        nbrs = g.adj.get(h)
+        # mix of supported edges and random (mostly unsure / 2-hop) pairs
+        if nbrs and rng.random() < 0.5:
+            t, rtype, _ = rng.choice(nbrs)
+            triples.append([names[h], rtype.lower().replace("_", " "), names[t]])
+        else:
+            triples.append([names[h], rng.choice(REL_TYPES), rng.choice(names)])
+    return triples
+
+
+def _check_evidence(g, results):
+    """Paging every evidence cursor yields exactly the pair's PubMed ids, in order."""
+    for r in results:
+        cur = (r.get("evidence") or {}).get("cursor")
+        if not cur:
+            continue
+        anchor, rel, after = evidence.decode_cursor(cur)
+        papers = []
+        while cur:
+            page, cur = evidence.page(anchor, rel, after, limit=3)
+            papers += page
+            if cur:
+                anchor, rel, after = evidence.decode_cursor(cur)
+        assert len(papers) == r["count"], (r, papers)
+        assert papers == sorted(papers)
+
+
+def _check_aliases(g, driver):
+    """A name and its alias resolve to one node pair: both triples get the pair's result, cache on or off."""
+    h = next(n for n in g.names if g.adj.get(n))
+    t, rtype, _ = g.adj[h][0]
+    handlers = dict(driver.handlers)
+    driver.handlers[neo4j_graph.Q_LEXICON] = lambda g_, p: [
+        {"id": i, "name": n, "aliases": ["alias of " + n] if i == h else []} for i, n in g.names.items()]
+    rel = rtype.lower().replace("_", " ")
+    triples = [[g.names[h], rel, g.names[t]], ["alias of " + g.names[h], rel, g.names[t]]]
+    try:
+        lexicon.build()
+        for enabled in (False, True):
+            result_cache.ENABLED = enabled
+            result_cache.VERIFY.clear()
+            res = verify.verify_list(triples)
+            assert [r["status"] for r in res] == ["supported"] * 2, res
+            assert res[0]["count"] == res[1]["count"], res
+    finally:
+        driver.handlers = handlers
+        result_cache.ENABLED = False
+        lexicon._LEX = None
+
+
+def _check_new_node(g, driver):
+    """A node added after the lexicon was built is still found (by name_key) by verify and evidence."""
+    lexicon.build()
+    nid = max(g.names) + 1
+    g.add_node(nid, "Entity added later")
+    t, rtype, _ = g.adj[next(n for n in g.names if g.adj.get(n))][0]
+    g.add_edge(nid, t, rtype, "999999")
+    try:
+        res = verify.verify_list([["Entity added later", rtype.lower().replace("_", " "), g.names[t]]])
+        assert res[0]["status"] == "supported", res
+        papers, _ = evidence.page(evidence._anchor_for("Entity added later", g.names[t]), rtype, ("", -1), 10)
+        assert papers == ["999999"], papers
+    finally:
+        lexicon._LEX = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=2000)
+    ap.add_argument("--triples", type=int, nargs="+", default=[5, 20, 40])
+    ap.add_argument("--rtt-ms", type=float, default=2.0)
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    lexicon.EMBED_FALLBACK = False  # every sampled name exists; never call OpenAI here
+    rng = random.Random(1)
+    g = synthetic_graph(args.nodes)
+    driver = FakeDriver(g, rtt_ms=args.rtt_ms)
+    graph.set_driver(driver)
+    _check_aliases(g, driver)
+
+    def per_triple(triples):
+        return verify.verify_list(triples, "per_triple")
+
+    def batch(triples):
+        lexicon._LEX = None
+        return verify.verify_list(triples)
+
+    def batch_lexicon(triples):
+        # id-anchored path; the lexicon is built once up front, as at app startup
+        if not lexicon.is_loaded():
+            lexicon.build()
+            driver.round_trips = 0
+        return verify.verify_list(triples)
+
+    modes = (("per_triple", per_triple), ("batch", batch), ("batch+lex", batch_lexicon))
+
+    print(f"{'triples':>8} {'mode':>11} {'p50 ms':>9} {'round-trips':>12} {'resp bytes':>11}")
+    for n in args.triples:
+        triples = _sample_triples(g, n, rng)
+        outputs = {}
+        lexicon._LEX = None
+        for name, fn in modes:
+            times = []
+            for _ in range(args.repeat):
+                driver.round_trips = 0
+                t0 = time.perf_counter()
+                outputs[name] = fn(triples)
+                times.append((time.perf_counter() - t0) * 1000)
+            size = len(json.dumps(outputs[name]))
+            print(f"{n:>8} {name:>11} {statistics.median(times):>9.2f} {driver.round_trips:>12} {size:>11}")
+        # cursors differ by anchor (name keys vs lexicon ids); compare everything else
+        same = [[{k: v for k, v in r.items() if k != "evidence"} for r in out] for out in outputs.values()]
+        assert all(o == same[0] for o in same), "batch results differ from per-triple"
+        _check_evidence(g, outputs["batch+lex"] + outputs["batch"])
+    _check_new_node(g, driver)
+
+
+if __name__ == "__main__":
+    main()
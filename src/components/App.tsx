@@ -612,23 +612,37 @@ export function Chat({ id, initialMessages }: ChatProps) {
           idx.set(buildKey(r.head, r.relation, r.tail), r);
         });
 
+        // edge -> its verify result (normalized key first, then original label)
+        const resultFor = (e: any) => {
+          const head = e.source.replace(/^node-/, '');
+          const tail = e.target.replace(/^node-/, '');
+          const baseRel =
+            (e.data && (e.data as any).relation)
+              ? (e.data as any).relation
+              : (e.label as string);
+          const normRel = normalizePredicate(baseRel);
+          const vr =
+            idx.get(buildKey(head, normRel, tail)) ||
+            idx.get(buildKey(head, baseRel, tail));
+          return { vr, baseRel, normRel };
+        };
+
+        // papers are paged from /api/evidence; verify only returns a count and a cursor
+        const papersOf = new Map<any, string[]>();
+        const withPapers = (e: any, vr: any, normRel: string) => {
+          const papers = papersOf.get(vr) || (Array.isArray(vr.papers) ? vr.papers : []);
+          return {
+            ...(e.data || {}),
+            papers: { [normRel]: papers }, // store under canonical key
+            papersList: papers
+          };
+        };
+
         const DRAW_MS = 400;
         setTimeout(() => {
           setEdges(prev =>
             prev.map(e => {
-              const head = e.source.replace(/^node-/, '');
-              const tail = e.target.replace(/^node-/, '');
-              const baseRel =
-                (e.data && (e.data as any).relation)
-                  ? (e.data as any).relation
-                  : (e.label as string);
-
-              // Try normalized key first, then original label as fallback
-              const normRel = normalizePredicate(baseRel);
-              const vr =
-                idx.get(buildKey(head, normRel, tail)) ||
-                idx.get(buildKey(head, baseRel, tail));
-
+              const { vr, baseRel, normRel } = resultFor(e);
               if (!vr) return e;
 
               const style = { ...e.style, strokeLinecap: 'butt' as const };
@@ -644,7 +658,6 @@ export function Chat({ id, initialMessages }: ChatProps) {
               }
 
               const count = typeof vr.count === 'number' ? vr.count : 0;
-              const papers: string[] = Array.isArray(vr.papers) ? vr.papers : [];
 
               return {
                 ...e,
@@ -652,17 +665,37 @@ export function Chat({ id, initialMessages }: ChatProps) {
                 // label: `${normRel} | ${count}`,
                 label: `${baseRel} | ${count}`,
                 data: {
-                  ...(e.data || {}),
+                  ...withPapers(e, vr, normRel),
                   relation: baseRel,
-                  verification: vr,
-                  papers: { [normRel]: papers }, // store under canonical key
-                  papersList: papers
+                  verification: vr
                 },
                 style
               };
             })
           );
         }, DRAW_MS);
+
+        // first page of papers per verified edge, attached whenever it arrives
+        await Promise.all((results || []).map(async (r: any) => {
+          const cursor = r?.evidence?.cursor;
+          if (!cursor) return;
+          try {
+            const er = await fetch(`${API_BASE}/api/evidence?cursor=${encodeURIComponent(cursor)}`);
+            if (!er.ok) throw new Error(`HTTP ${er.status}`);
+            const { papers } = await er.json();
+            papersOf.set(r, Array.isArray(papers) ? papers : []);
+          } catch (err) {
+            console.error('[evidence] request failed:', err);
+          }
+        }));
+        if (papersOf.size) {
+          setEdges(prev =>
+            prev.map(e => {
+              const { vr, normRel } = resultFor(e);
+              return vr && papersOf.has(vr) ? { ...e, data: withPapers(e, vr, normRel) } : e;
+            })
+          );
+        }
       } catch (err) {
         console.error('[verify] request failed:', err);
         pendingKeys.forEach(k => sentForVerification.current.delete(k));